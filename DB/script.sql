@@ -1,7 +1,11 @@
-CREATE TABLE messages (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    content VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NOT NULL,
-    sender VARCHAR(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NOT NULL,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    coordinates POINT
-) CHARACTER SET=utf8mb4 COLLATE=utf8mb4_general_ci;
+CREATE TABLE messages (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    content VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NOT NULL,
+    sender VARCHAR(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NOT NULL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    coordinates POINT,
+    -- CoordinateWriter finds the row of a chat line by its time and sender
+    INDEX messages_time_sender (timestamp, sender)
+) CHARACTER SET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- On an existing database: CREATE INDEX messages_time_sender ON messages (timestamp, sender);
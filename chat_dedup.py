@@ -0,0 +1,91 @@
+"""
+Persistent index of recently seen chat lines, used to drop duplicates.
+
+Each line is keyed by a 16-byte hash of (time, name, message). Recent keys are
+kept in an insertion-ordered dict for constant-time lookups and mirrored into a
+small SQLite table so the index survives restarts. Keys older than
+`window_seconds` are evicted from both, so memory and disk use stay flat no
+matter how long the scraper runs.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def line_key(line):
+    """
+    Hash a chat line dict into its dedup key.
+    """
+    raw = "\0".join((line['time'], line['name'], line['message'])).encode('utf-8')
+    return hashlib.blake2b(raw, digest_size=16).digest()
+
+
+class ChatDedupIndex:
+    def __init__(self, path='data/chat_dedup.sqlite3', window_seconds=6 * 3600,
+                 prune_interval=300):
+        self.window_seconds = window_seconds
+        self.prune_interval = prune_interval
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS seen (key BLOB PRIMARY KEY, seen_at REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS seen_at_idx ON seen (seen_at)")
+        self._db.commit()
+
+        # Reload the keys that are still inside the window, oldest first
+        cutoff = time.time() - window_seconds
+        self._seen = OrderedDict(self._db.execute(
+            "SELECT key, seen_at FROM seen WHERE seen_at >= ? ORDER BY seen_at", (cutoff,)
+        ))
+        self._last_prune = 0.0
+
+    def __len__(self):
+        return len(self._seen)
+
+    def filter_new(self, lines):
+        """
+        Return the lines that have not been seen inside the window,
+        and remember them.
+        """
+        now = time.time()
+        new_lines = []
+        new_rows = []
+        with self._lock:
+            self._evict(now)
+            for line in lines:
+                key = line_key(line)
+                if key in self._seen:
+                    continue
+                self._seen[key] = now
+                new_lines.append(line)
+                new_rows.append((key, now))
+
+            if new_rows:
+                self._db.executemany("INSERT OR REPLACE INTO seen (key, seen_at) VALUES (?, ?)", new_rows)
+                self._db.commit()
+        return new_lines
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _evict(self, now):
+        cutoff = now - self.window_seconds
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if seen_at >= cutoff:
+                break
+            self._seen.popitem(last=False)
+
+        # Deleting from SQLite is batched, there is no need to do it on every call
+        if now - self._last_prune >= self.prune_interval:
+            self._db.execute("DELETE FROM seen WHERE seen_at < ?", (cutoff,))
+            self._db.commit()
+            self._last_prune = now
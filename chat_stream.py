@@ -0,0 +1,159 @@
+"""
+Push-based chat line delivery over the Chrome DevTools Protocol.
+
+The MutationObserver that scraper.py injects calls `window.pwnChatLine(json)`
+for every new chat line when that function exists. ChatStream connects to the
+page through Chrome's remote debugging port, registers that function as a
+DevTools binding (Runtime.addBinding) and turns the resulting
+Runtime.bindingCalled events into a generator of chat line dicts, so lines
+arrive as soon as the page renders them instead of on the next poll.
+
+Binding calls made while the websocket is down go nowhere. Every line carries
+an increasing `seq`, and on reconnecting ChatStream asks the page
+(`window.getChatLinesSince`) for the lines after the last one it yielded, so
+the same ChatStream should be reconnected rather than replaced.
+"""
+import json
+import time
+import urllib.request
+from collections import deque
+
+import websocket
+
+BINDING_NAME = 'pwnChatLine'
+
+
+def find_page_websocket_url(port, url_match='pony.town'):
+    """
+    Ask Chrome's /json endpoint for the DevTools websocket of the Pony Town tab.
+    """
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/json", timeout=5) as response:
+        targets = json.load(response)
+    for target in targets:
+        if target.get('type') == 'page' and url_match in target.get('url', ''):
+            return target['webSocketDebuggerUrl']
+    raise RuntimeError(f"No page matching '{url_match}' on debugging port {port}")
+
+
+class ChatStream:
+    def __init__(self, port=9222, binding_name=BINDING_NAME, url_match='pony.town', log=print):
+        self.port = port
+        self.binding_name = binding_name
+        self.url_match = url_match
+        self.log = log
+        self.ws = None
+        self._next_id = 0
+        # seq of the last line yielded, None until the first one
+        self.last_seq = None
+        # Reconnects after which some missed lines could not be replayed
+        self.gaps = 0
+        self._pending = deque()
+
+    @property
+    def connected(self):
+        return self.ws is not None
+
+    def connect(self):
+        """
+        Open the DevTools websocket and install the binding in the page.
+        """
+        url = find_page_websocket_url(self.port, self.url_match)
+        # Chrome rejects websocket clients that send an Origin it doesn't know
+        self.ws = websocket.create_connection(url, timeout=10, suppress_origin=True)
+        self._send('Runtime.enable')
+        if self.last_seq is None:
+            # Line seqs are at least the page's clock in microseconds, so anything
+            # shown from here on is replayed if this connection drops before a line comes
+            self.last_seq = self._evaluate("Date.now() * 1000") - 1
+            self._send('Runtime.addBinding', name=self.binding_name)
+        else:
+            # Binding first, so no line falls between the replay and the first push
+            self._send('Runtime.addBinding', name=self.binding_name)
+            self._replay()
+        return self
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+            self.ws = None
+
+    def _send(self, method, **params):
+        self._next_id += 1
+        self.ws.send(json.dumps({'id': self._next_id, 'method': method, 'params': params}))
+        return self._next_id
+
+    def _binding_line(self, message):
+        # The chat line in a Runtime.bindingCalled event for our binding, else None
+        params = message.get('params', {})
+        if message.get('method') == 'Runtime.bindingCalled' and params.get('name') == self.binding_name:
+            return json.loads(params['payload'])
+        return None
+
+    def _evaluate(self, expression):
+        # Run `expression` in the page and return its value
+        request_id = self._send('Runtime.evaluate', expression=expression, returnByValue=True)
+        while True:
+            message = json.loads(self.ws.recv())
+            if message.get('id') == request_id:
+                return message.get('result', {}).get('result', {}).get('value')
+            line = self._binding_line(message)
+            if line is not None:
+                self._pending.append(line)
+
+    def _replay(self):
+        """
+        Queue the lines the page showed after `last_seq`, i.e. while we were disconnected.
+        """
+        backlog = self._evaluate(f"window.getChatLinesSince && window.getChatLinesSince({self.last_seq})")
+        if not backlog:
+            self.gaps += 1
+            self.log("The page has no chat line buffer; lines shown while disconnected are lost")
+            return
+        # Lines pushed during the evaluation can also be in the backlog; _take skips the repeats
+        self._pending = deque(sorted([*self._pending, *backlog['lines']], key=lambda line: line['seq']))
+        if backlog['lines']:
+            self.log(f"Replaying {len(backlog['lines'])} chat lines shown while disconnected")
+        if not backlog['complete']:
+            self.gaps += 1
+            self.log("Some chat lines shown while disconnected are no longer in the page's buffer and are lost")
+
+    def _take(self, line):
+        # False for a line already yielded (pushed and replayed both)
+        if self.last_seq is not None and line['seq'] <= self.last_seq:
+            return False
+        self.last_seq = line['seq']
+        return True
+
+    def lines(self, idle_timeout=1.0):
+        """
+        Yield chat line dicts ({time, name, message}) as the page reports them.
+
+        Yields None whenever `idle_timeout` seconds pass without a chat line, so
+        the caller can do its housekeeping without a separate thread.
+        Connection errors are raised to the caller.
+        """
+        deadline = time.monotonic() + idle_timeout
+        while True:
+            while self._pending:
+                line = self._pending.popleft()
+                if self._take(line):
+                    yield line
+                    deadline = time.monotonic() + idle_timeout
+
+            self.ws.settimeout(max(deadline - time.monotonic(), 0.01))
+            try:
+                raw = self.ws.recv()
+            except websocket.WebSocketTimeoutException:
+                raw = None
+
+            if raw:
+                line = self._binding_line(json.loads(raw))
+                if line is not None:
+                    if self._take(line):
+                        yield line
+                        deadline = time.monotonic() + idle_timeout
+                    continue
+
+            if time.monotonic() >= deadline:
+                yield None
+                deadline = time.monotonic() + idle_timeout
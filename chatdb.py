@@ -0,0 +1,253 @@
+"""
+Batched MariaDB writer for scraped chat lines.
+
+Lines are handed to ChatLineWriter.add() from the scraper loop and written by a
+background thread, so the loop never waits on the database. The writer keeps a
+small connection pool open, writes multi-row INSERTs, and commits whenever
+`batch_size` lines are waiting or `flush_interval` seconds have passed. If the
+database is unreachable the lines stay buffered in memory (up to
+`max_buffered`, oldest dropped first) and the writer keeps retrying.
+
+CoordinateWriter runs the same loop for the overlay pipeline: it fills in the
+on-screen coordinates of lines the scraper has already inserted.
+"""
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+from mysql.connector import pooling
+from mysql.connector.constants import ClientFlag
+
+INSERT_PREFIX = "INSERT INTO messages (content, sender, timestamp, coordinates) VALUES "
+INSERT_ROW = "(%s, %s, %s, ST_GeomFromText(%s))"
+UPDATE_COORDINATES = ("UPDATE messages SET coordinates = ST_GeomFromText(%s) "
+                      "WHERE content = %s AND sender = %s AND timestamp = %s")
+
+
+def point(line):
+    # Lines the overlay has not located yet keep the old placeholder
+    x, y = line.get('coordinates', (0, 0))
+    return f'POINT({x} {y})'
+
+
+def line_to_row(line):
+    """
+    Convert a chat line dict from the page into the INSERT parameters.
+    """
+    return (line['message'], line['name'], line['time'], point(line))
+
+
+class ChatLineWriter:
+    def __init__(self, db_config, batch_size=200, flush_interval=2.0,
+                 max_buffered=100000, pool_size=1, retry_delay=5.0, log=print):
+        self.db_config = db_config
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pool_size = pool_size
+        self.retry_delay = retry_delay
+        self.log = log
+
+        self.written = 0
+        self.dropped = 0
+
+        self._buffer = deque(maxlen=max_buffered)
+        self._cond = threading.Condition()
+        self._pool = None
+        self._stopping = False
+        self._thread = None
+        self._db_down = False
+
+    def start(self):
+        """
+        Start the background flush thread.
+        """
+        self._thread = threading.Thread(target=self._run, name='chat-db-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def add(self, lines):
+        """
+        Queue chat lines for writing. Never blocks on the database.
+        """
+        with self._cond:
+            self.dropped += max(0, len(self._buffer) + len(lines) - self._buffer.maxlen)
+            self._buffer.extend(lines)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._buffer)
+
+    def close(self, timeout=10):
+        """
+        Flush whatever is buffered (if the database allows it) and stop.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _take_batch(self):
+        # Wait until there is a full batch, the flush interval runs out, or we are stopping
+        with self._cond:
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._buffer) < self.batch_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            count = min(len(self._buffer), self.batch_size)
+            return [self._buffer.popleft() for _ in range(count)]
+
+    def _requeue(self, batch):
+        # Put a failed batch back at the front so ordering is preserved
+        with self._cond:
+            room = self._buffer.maxlen - len(self._buffer)
+            if room < len(batch):
+                self.dropped += len(batch) - room
+                batch = batch[len(batch) - room:] if room > 0 else []
+            self._buffer.extendleft(reversed(batch))
+
+    def _get_connection(self):
+        if self._pool is None:
+            self._pool = pooling.MySQLConnectionPool(
+                pool_name='pwn_chat_writer',
+                pool_size=self.pool_size,
+                **self.db_config
+            )
+        # The pool reconnects connections that went stale on its own
+        return self._pool.get_connection()
+
+    def _write(self, batch):
+        """
+        Write a batch and return how many lines it stored.
+        """
+        connection = self._get_connection()
+        cursor = None
+        try:
+            cursor = connection.cursor()
+            query = INSERT_PREFIX + ", ".join([INSERT_ROW] * len(batch))
+            params = [value for line in batch for value in line_to_row(line)]
+            cursor.execute(query, params)
+            connection.commit()
+        finally:
+            if cursor is not None:
+                cursor.close()
+            connection.close()
+        return len(batch)
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                if self._stopping:
+                    return
+                continue
+
+            try:
+                written = self._write(batch)
+            except mysql.connector.Error as err:
+                self._requeue(batch)
+                if not self._db_down:
+                    self.log(f"DB write failed, buffering lines in memory: {err}")
+                    self._db_down = True
+                if self._stopping:
+                    self.log(f"Giving up with {self.pending()} chat lines unwritten.")
+                    return
+                time.sleep(self.retry_delay)
+                continue
+            except Exception as e:
+                # Not the database's fault (a malformed line), so the same batch would fail again
+                with self._cond:
+                    self.dropped += len(batch)
+                self.log(f"Dropped {len(batch)} chat lines that could not be written: {type(e).__name__}: {e}")
+                continue
+
+            self.written += written
+            if self._db_down:
+                self.log(f"DB reachable again; {self.pending()} chat lines still buffered.")
+                self._db_down = False
+
+
+class CoordinateWriter(ChatLineWriter):
+    """
+    Sets the coordinates of chat lines that are already in the table.
+
+    The scraper inserts every line with POINT(0 0) as soon as the page shows
+    it; the overlay finds the bubble on screen a moment later. A located line
+    whose row has not been inserted yet is set aside and tried again one
+    `flush_interval` later, until it is `max_wait` seconds old.
+    """
+
+    def __init__(self, db_config, batch_size=50, flush_interval=0.5, max_wait=30.0, on_written=None, **kwargs):
+        # Count rows the WHERE matched, not only the ones whose value changed
+        db_config = dict(db_config, client_flags=[ClientFlag.FOUND_ROWS])
+        super().__init__(db_config, batch_size=batch_size, flush_interval=flush_interval, **kwargs)
+        self.max_wait = max_wait
+        self.on_written = on_written
+        self.expired = 0
+        # (retry time, line) of lines whose row was not there yet
+        self._deferred = deque()
+        self._last_try_done = False
+
+    def pending(self):
+        with self._cond:
+            return len(self._buffer) + len(self._deferred)
+
+    def close(self, timeout=10):
+        """
+        Flush like ChatLineWriter.close, trying set-aside lines once more, and
+        report the ones whose row still was not there.
+        """
+        super().close(timeout)
+        with self._cond:
+            discarded = len(self._deferred)
+            self._deferred.clear()
+        if discarded:
+            self.expired += discarded
+            self.log(f"Discarded the coordinates of {discarded} chat lines whose rows were not inserted yet.")
+
+    def _take_batch(self):
+        # Lines that missed their row rejoin the queue once their retry time has come,
+        # instead of being retried back to back while the scraper has not inserted them
+        with self._cond:
+            now = time.monotonic()
+            if self._stopping and not self._last_try_done:
+                # Closing: one last try for every set-aside line, without waiting for its retry time
+                now = float('inf')
+                self._last_try_done = True
+            due = []
+            while self._deferred and self._deferred[0][0] <= now:
+                due.append(self._deferred.popleft()[1])
+        if due:
+            self._requeue(due)
+        return super()._take_batch()
+
+    def _write(self, batch):
+        connection = self._get_connection()
+        cursor = None
+        found, missing = [], []
+        try:
+            cursor = connection.cursor()
+            for line in batch:
+                cursor.execute(UPDATE_COORDINATES, (point(line), line['message'], line['name'], line['time']))
+                (found if cursor.rowcount > 0 else missing).append(line)
+            connection.commit()
+        finally:
+            if cursor is not None:
+                cursor.close()
+            connection.close()
+
+        now = time.time()
+        waiting = [line for line in missing if now - line['located_at'] < self.max_wait]
+        self.expired += len(missing) - len(waiting)
+        if waiting:
+            retry_at = time.monotonic() + self.flush_interval
+            with self._cond:
+                self._deferred.extend((retry_at, line) for line in waiting)
+        if found and self.on_written is not None:
+            self.on_written(found)
+        return len(found)
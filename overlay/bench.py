@@ -0,0 +1,564 @@
+"""
+Micro-benchmarks for the capture and detection stages.
+
+Run from the repository root, e.g.:
+    python overlay/bench.py capture --frames 200 --region 0,80,1920,1000
+    python overlay/bench.py batch --batch_sizes 1,4,8 --images overlay/input_grabs
+    python overlay/bench.py prep --frames 200
+    python overlay/bench.py pool --workers 1,2,4,8 --images overlay/input_grabs
+    python overlay/bench.py roi --roi 0,80,1920,1000 --tile 640x640
+    python overlay/bench.py match --chat chat_lines.json
+    python overlay/bench.py accuracy --labels overlay/input_grabs/labels.json --chat chat_lines.json
+    python overlay/bench.py detlog --frames 2000
+    python overlay/bench.py nms --candidates 100,1000,10000
+    python overlay/bench.py backends --backends darknet,opencv --threads 4 --images overlay/input_grabs
+"""
+import argparse
+import json
+import os
+import random
+import re
+import time
+import tracemalloc
+from datetime import datetime
+
+
+def cpu_seconds():
+    # Our own CPU time plus that of finished child processes (scrot, tesseract, ...)
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def report(name, count, wall, cpu, unit="frames"):
+    rate = count / wall if wall else float('inf')
+    print(f"{name:<28} {count:>6} {unit}  {wall * 1000 / count:8.2f} ms/{unit[:-1]}  "
+          f"{rate:8.1f} {unit}/s  cpu {100 * cpu / wall:6.1f}%")
+
+
+def bench_capture(args):
+    """
+    Sustained capture rate of each grabber backend.
+    """
+    from grabber import make_frame_source
+
+    region = tuple(int(v) for v in args.region.split(',')) if args.region else None
+    for backend in args.backends.split(','):
+        try:
+            grab = make_frame_source(backend, region)
+            grab()  # warm-up
+        except Exception as e:
+            print(f"{backend:<28} unavailable: {e}")
+            continue
+
+        start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+        for _ in range(args.frames):
+            frame = grab()
+        wall, cpu = time.perf_counter() - start_wall, cpu_seconds() - start_cpu
+        report(f"capture/{backend} {frame.shape[1]}x{frame.shape[0]}", args.frames, wall, cpu)
+
+
+def load_frames(directory, count, width=1920, height=1088):
+    """
+    Up to `count` network-sized RGB frames from a directory of captures,
+    or random noise frames if there is none.
+    """
+    import cv2
+    import numpy as np
+
+    frames = []
+    if directory and os.path.isdir(directory):
+        for name in sorted(os.listdir(directory))[:count]:
+            image = cv2.imread(os.path.join(directory, name))
+            if image is not None:
+                frames.append(cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), (width, height)))
+    if not frames:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(min(count, 8))]
+    return frames
+
+
+def bench_batch(args):
+    """
+    Detection throughput of one Darknet network per batch size.
+    """
+    import darknet
+
+    frames = load_frames(args.images, args.frames)
+    for batch_size in (int(v) for v in args.batch_sizes.split(',')):
+        # The batch size is baked into the network when it is loaded
+        network, class_names, _ = darknet.load_network(args.config_file, args.data_file, args.weights,
+                                                       batch_size=batch_size)
+        batches = [[frames[(i + j) % len(frames)] for j in range(batch_size)]
+                   for i in range(0, args.frames, batch_size)]
+        darknet.detect_batch(network, class_names, batches[0], thresh=args.thresh, batch_size=batch_size)  # warm-up
+
+        start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+        for batch in batches:
+            darknet.detect_batch(network, class_names, batch, thresh=args.thresh, batch_size=batch_size)
+        wall, cpu = time.perf_counter() - start_wall, cpu_seconds() - start_cpu
+        report(f"detect/batch {batch_size}", len(batches) * batch_size, wall, cpu)
+        darknet.free_network_ptr(network)
+
+
+def bench_prep(args):
+    """
+    Cost of getting a captured frame into a Darknet IMAGE: the old
+    allocate-per-frame path against the detector's reused buffers.
+    """
+    import cv2
+    import numpy as np
+    import darknet
+    from detector import FrameBuffers
+
+    width, height = 1920, 1088
+    frame = np.random.default_rng(0).integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+
+    def per_frame():
+        darknet_image = darknet.make_image(width, height, 3)
+        image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        image_resized = cv2.resize(image_rgb, (width, height), interpolation=cv2.INTER_LINEAR)
+        darknet.copy_image_from_bytes(darknet_image, image_resized.tobytes())
+        darknet.free_image(darknet_image)
+
+    buffers = FrameBuffers(width, height)
+    for name, prepare in (("prep/per-frame IMAGE", per_frame), ("prep/reused buffers", lambda: buffers.prepare(frame))):
+        prepare()  # warm-up
+        tracemalloc.start()
+        start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+        for _ in range(args.frames):
+            prepare()
+        wall, cpu = time.perf_counter() - start_wall, cpu_seconds() - start_cpu
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report(name, args.frames, wall, cpu)
+        print(f"{'':<28} peak Python-side allocation {peak / 2**20:.1f} MiB")
+    buffers.close()
+
+
+def bench_pool(args):
+    """
+    Detection throughput of the worker pool as workers are added.
+    """
+    import cv2
+    from detector_pool import DetectorPool
+
+    # The pool takes BGR frames of capture size
+    frames = [cv2.cvtColor(frame, cv2.COLOR_RGB2BGR) for frame in load_frames(args.images, args.frames)]
+    for workers in (int(v) for v in args.workers.split(',')):
+        with DetectorPool(args.config_file, args.data_file, args.weights, workers=workers,
+                          frame_shape=frames[0].shape, detector_options={'thresh': args.thresh},
+                          threads_per_worker=args.threads_per_worker, log=lambda message: None) as pool:
+            start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+            for i in range(args.frames):
+                pool.submit(frames[i % len(frames)])
+                while pool.ready():
+                    pool.get()
+            while pool.pending():
+                pool.get()
+            wall, cpu = time.perf_counter() - start_wall, cpu_seconds() - start_cpu
+        report(f"detect/pool {workers} workers", args.frames, wall, cpu)
+
+
+def bench_roi(args):
+    """
+    Detection cost on the whole screen against a region of interest and tiles of it.
+    """
+    import cv2
+    from detector import DarknetDetector
+    from roi import parse_region, parse_size
+
+    frames = [cv2.cvtColor(frame, cv2.COLOR_RGB2BGR) for frame in load_frames(args.images, args.frames)]
+    setups = [("whole frame", {})]
+    if args.roi:
+        setups.append((f"roi {args.roi}", {'roi': parse_region(args.roi)}))
+    if args.tile:
+        setups.append((f"tiles {args.tile}", {'roi': parse_region(args.roi), 'tile': parse_size(args.tile)}))
+
+    for name, options in setups:
+        detector = DarknetDetector(args.config_file, args.data_file, args.weights, thresh=args.thresh, **options)
+        detector.detect(frames[0])  # warm-up
+        boxes = 0
+        start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+        for i in range(args.frames):
+            boxes += len(detector.detect(frames[i % len(frames)]))
+        wall, cpu = time.perf_counter() - start_wall, cpu_seconds() - start_cpu
+        report(f"detect/{name}", args.frames, wall, cpu)
+        print(f"{'':<28} input {detector.width}x{detector.height} x{detector.tiles_per_frame}, "
+              f"{boxes / args.frames:.1f} boxes/frame")
+        detector.close()
+
+
+# Mistakes Tesseract makes on the chat font, used to corrupt synthetic OCR text
+OCR_MISTAKES = {'l': '1I|', 'I': 'l1', 'i': 'l!', 'o': '0', 'O': '0', 's': '5', 'e': 'c', 'm': 'rn', 'n': 'r'}
+
+
+def corrupt(text, rng, rate=0.08):
+    """
+    Text as Tesseract might misread it: confused glyphs, dropped and doubled characters.
+    """
+    out = []
+    for char in text:
+        roll = rng.random()
+        if roll < rate and char in OCR_MISTAKES:
+            out.append(rng.choice(OCR_MISTAKES[char]))
+        elif roll < rate * 1.3:
+            continue
+        elif roll < rate * 1.5:
+            out.append(char * 2)
+        else:
+            out.append(char)
+    return ''.join(out)
+
+
+def sequence_matcher_first(ocr_text, messages, min_ratio=0.8):
+    # What combined.py did before: the first message whose SequenceMatcher ratio reaches 0.8
+    from difflib import SequenceMatcher
+    for message in messages:
+        if SequenceMatcher(None, ocr_text, message).ratio() >= min_ratio:
+            return message
+    return None
+
+
+def compare_matchers(name, cases):
+    """
+    Accuracy and speed of the old and new matcher on (ocr text, candidates, expected) cases.
+    """
+    from fuzzy import best_match
+
+    matchers = [("SequenceMatcher first", sequence_matcher_first),
+                ("bit-parallel best", lambda text, messages: best_match(text, messages)[0])]
+    for matcher_name, matcher in matchers:
+        correct = wrong = 0
+        start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+        for ocr_text, candidates, expected in cases:
+            found = matcher(ocr_text, candidates)
+            if found == expected:
+                correct += 1
+            elif found is not None:
+                wrong += 1
+        wall, cpu = time.perf_counter() - start_wall, cpu_seconds() - start_cpu
+        report(f"{name}/{matcher_name}", len(cases), wall, cpu, unit="texts")
+        print(f"{'':<28} correct {correct}/{len(cases)}  wrong {wrong}  unmatched {len(cases) - correct - wrong}")
+
+
+def bench_match(args):
+    """
+    Matching corrupted chat messages against a window of candidates, old matcher against new.
+    """
+    rng = random.Random(args.seed)
+    if args.chat:
+        with open(args.chat) as file:
+            messages = [line['message'] for line in json.load(file) if len(line['message']) >= 9]
+    else:
+        words = "hi hello pony town anyone here lol i love this song who wants to play tag".split()
+        messages = [' '.join(rng.choice(words) for _ in range(rng.randint(3, 10))) for _ in range(5000)]
+
+    cases = []
+    for _ in range(args.texts):
+        candidates = rng.sample(messages, min(args.window, len(messages)))
+        expected = rng.choice(candidates)
+        cases.append((corrupt(expected, rng), candidates, expected))
+    compare_matchers("match", cases)
+
+
+def bench_accuracy(args):
+    """
+    OCR labelled bubbles from captured frames and check which chat message each matcher picks.
+    """
+    import cv2
+    from chatindex import ChatLogIndex
+    from ocr import OcrStage
+
+    # [{"image": path, "bbox": [center x, center y, width, height] in 1920x1088, "message": chat text}, ...]
+    with open(args.labels) as file:
+        labels = json.load(file)
+    chat_index = ChatLogIndex(args.chat)
+    ocr = OcrStage(threads=args.ocr_threads, cache_size=0)
+    base = os.path.dirname(args.labels)
+
+    cases = []
+    for label in labels:
+        path = os.path.join(base, label['image'])
+        image = cv2.imread(path)
+        if image is None:
+            print(f"Skipping unreadable {path}")
+            continue
+        ocr_text = ocr.read(image, [label['bbox']])[0]
+        # Same parsing as combined.py, which loads darknet on import
+        found = re.search(r"screengrab-input-(\d{8}_\d{6})", path)
+        timestamp = datetime.strptime(found.group(1), "%Y%m%d_%H%M%S") if found else None
+        window = chat_index.window(timestamp) if timestamp else chat_index.entries
+        candidates = [entry['message'] for entry in window if len(entry['message']) >= chat_index.min_length]
+        cases.append((ocr_text, candidates, label['message']))
+    ocr.close()
+    compare_matchers("accuracy", cases)
+
+
+def bench_detlog(args):
+    """
+    Writing and reading one frame's detections: a YAML file per frame against the binary log.
+    """
+    import tempfile
+    import numpy as np
+    import yaml
+    from detlog import DetectionLog, group_frames, open_log, to_yaml_data
+
+    class_names = ['message', 'pony']
+    rng = np.random.default_rng(0)
+    frames = []
+    for _ in range(args.frames):
+        detections = np.zeros(rng.integers(0, 2 * args.boxes), dtype=[("class_id", np.int32), ("conf", np.float32),
+                                                                       ("x", np.float32), ("y", np.float32),
+                                                                       ("w", np.float32), ("h", np.float32)])
+        detections["class_id"] = rng.integers(0, len(class_names), len(detections))
+        detections["conf"] = rng.random(len(detections))
+        for field in ("x", "y", "w", "h"):
+            detections[field] = rng.random(len(detections)) * 1000
+        frames.append(detections)
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = os.path.join(directory, "detections.detlog")
+        log = DetectionLog(log_path, class_names)
+        start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+        for frame_id, detections in enumerate(frames):
+            log.append(frame_id, time.time(), detections)
+        report("write/detection log", args.frames, time.perf_counter() - start_wall, cpu_seconds() - start_cpu)
+        log.close()
+
+        start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+        records, _ = open_log(log_path)
+        for frame_id, frame in group_frames(records):
+            frame[frame["class_id"] >= 0]
+        report("read/detection log", args.frames, time.perf_counter() - start_wall, cpu_seconds() - start_cpu)
+
+        # The YAML side writes what overlay.py used to, so it is timed on far fewer frames
+        count = min(args.frames, 200)
+        start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+        for frame_id in range(count):
+            with open(os.path.join(directory, f"{frame_id}.yaml"), 'w') as file:
+                yaml.dump(to_yaml_data(records[records["frame_id"] == frame_id], class_names), file)
+        report("write/yaml per frame", count, time.perf_counter() - start_wall, cpu_seconds() - start_cpu)
+
+        start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+        for frame_id in range(count):
+            with open(os.path.join(directory, f"{frame_id}.yaml")) as file:
+                yaml.load(file, Loader=yaml.FullLoader)
+        report("read/yaml per frame", count, time.perf_counter() - start_wall, cpu_seconds() - start_cpu)
+
+
+def synthetic_candidates(count, classes, rng, width=1920, height=1088):
+    """
+    Boxes clustered around a few objects the way YOLO proposes them: (boxes as x, y, w, h rows, probs).
+    """
+    import numpy as np
+
+    objects = rng.random((max(count // 25, 1), 4)) * [width, height, 200, 60] + [0, 0, 20, 10]
+    boxes = objects[rng.integers(0, len(objects), count)]
+    boxes = boxes + rng.normal(0, 1, boxes.shape) * [6, 4, 8, 4]
+    probs = rng.random((count, classes)) * (rng.random((count, classes)) < 0.5)
+    return boxes.astype(np.float32), probs.astype(np.float32)
+
+
+def bench_nms(args):
+    """
+    NumPy NMS on the decoded candidates against Darknet's do_nms_sort on the DETECTION structs.
+    """
+    import numpy as np
+    import darknet
+    from ctypes import POINTER, c_float, cast
+    from nms import soft_nms
+
+    rng = np.random.default_rng(0)
+    for count in (int(v) for v in args.candidates.split(',')):
+        boxes, probs = synthetic_candidates(count, args.classes, rng)
+        saved = probs.copy()
+        dets = (darknet.DETECTION * count)()
+        for i, det in enumerate(dets):
+            det.bbox = darknet.BOX(*boxes[i].tolist())
+            det.classes = args.classes
+            det.objectness = 1.0
+            det.prob = cast(probs[i].ctypes.data, POINTER(c_float))
+        pointer = cast(dets, POINTER(darknet.DETECTION))
+
+        results = {}
+        for name in ("darknet", "numpy"):
+            elapsed = 0.0
+            for _ in range(args.repeat):
+                probs[...] = saved
+                start = time.perf_counter()
+                results[name] = darknet.suppress(pointer, count, args.classes, args.nms, name)
+                elapsed += time.perf_counter() - start
+            print(f"{f'nms/{name}':<28} {count:>6} candidates  {elapsed * 1000 / args.repeat:8.3f} ms  "
+                  f"{len(results[name])} kept")
+
+        probs[...] = saved
+        candidates = darknet.detections_to_array(pointer, count, args.classes)
+        start = time.perf_counter()
+        softened = soft_nms(candidates)
+        print(f"{'nms/soft-nms':<28} {count:>6} candidates  {(time.perf_counter() - start) * 1000:8.3f} ms  "
+              f"{len(softened)} kept")
+
+        # Both methods keep the same (box, class) pairs, up to float rounding in the overlap
+        def pairs(array):
+            return set(zip(array["class_id"].tolist(), array["x"].tolist(), array["y"].tolist()))
+        differ = len(pairs(results["darknet"]) ^ pairs(results["numpy"]))
+        print(f"{'':<28} {differ} detections differ between darknet and numpy")
+
+
+def agreement(reference, other, iou_threshold=0.5):
+    """
+    Greedily pair detections of the same class by IoU. Returns (paired, only in
+    reference, only in other, summed |confidence difference| of the pairs).
+    """
+    import numpy as np
+    from nms import box_iou
+
+    boxes = lambda array: np.stack([array[field] for field in ("x", "y", "w", "h")], axis=1)
+    iou = box_iou(boxes(reference), boxes(other))
+    iou[reference["class_id"][:, None] != other["class_id"][None, :]] = 0
+    paired, confidence = 0, 0.0
+    while iou.size and iou.max() > iou_threshold:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        confidence += abs(float(reference["conf"][i]) - float(other["conf"][j]))
+        iou[i, :] = 0
+        iou[:, j] = 0
+        paired += 1
+    return paired, len(reference) - paired, len(other) - paired, confidence
+
+
+def bench_backends(args):
+    """
+    Detection latency of each detector backend, and how well their detections agree with the first one's.
+    """
+    import cv2
+    from detector import make_detector
+
+    frames = [cv2.cvtColor(frame, cv2.COLOR_RGB2BGR) for frame in load_frames(args.images, args.frames)]
+    results = []
+    for backend in args.backends.split(','):
+        detector = make_detector(args.config_file, args.data_file, args.weights, backend=backend,
+                                 threads=args.threads, thresh=args.thresh)
+        detector.detect(frames[0])  # warm-up
+        arrays, latencies = [], []
+        start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+        for i in range(args.frames):
+            start = time.perf_counter()
+            arrays.append(detector.detect(frames[i % len(frames)]).copy())
+            latencies.append(time.perf_counter() - start)
+        wall, cpu = time.perf_counter() - start_wall, cpu_seconds() - start_cpu
+        report(f"detect/{backend}", args.frames, wall, cpu)
+        latencies.sort()
+        print(f"{'':<28} p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms, "
+              f"{sum(map(len, arrays)) / args.frames:.1f} boxes/frame")
+        results.append((backend, arrays))
+        detector.close()
+
+    reference, reference_arrays = results[0]
+    for other, other_arrays in results[1:]:
+        paired = only_reference = only_other = 0
+        confidence = 0.0
+        for reference_array, other_array in zip(reference_arrays, other_arrays):
+            counts = agreement(reference_array, other_array, args.iou)
+            paired, only_reference, only_other = paired + counts[0], only_reference + counts[1], only_other + counts[2]
+            confidence += counts[3]
+        total = paired + only_reference + only_other
+        print(f"{f'agree/{reference} vs {other}':<28} {paired}/{total} detections paired at IoU > {args.iou} "
+              f"({100 * paired / total if total else 100.0:.1f}%), {only_reference} only {reference}, "
+              f"{only_other} only {other}, mean |conf diff| {confidence / paired if paired else 0.0:.4f}")
+
+
+def parser():
+    parser = argparse.ArgumentParser(description="pwn-dy-town benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    capture = subparsers.add_parser("capture", help="screen capture backends")
+    capture.add_argument("--frames", type=int, default=100)
+    capture.add_argument("--backends", default="pyautogui,xshm")
+    capture.add_argument("--region", type=str, default=None, help="x,y,width,height")
+    capture.set_defaults(func=bench_capture)
+
+    batch = subparsers.add_parser("batch", help="darknet inference at several batch sizes")
+    batch.add_argument("--frames", type=int, default=64)
+    batch.add_argument("--batch_sizes", default="1,4,8")
+    batch.add_argument("--images", type=str, default=None, help="directory of captures, random frames if unset")
+    batch.add_argument("--config_file", default="screenshots/screenshots.cfg")
+    batch.add_argument("--data_file", default="screenshots/screenshots.data")
+    batch.add_argument("--weights", default="screenshots/screenshots_best.weights")
+    batch.add_argument("--thresh", type=float, default=.25)
+    batch.set_defaults(func=bench_batch)
+
+    prep = subparsers.add_parser("prep", help="frame preparation before inference")
+    prep.add_argument("--frames", type=int, default=200)
+    prep.set_defaults(func=bench_prep)
+
+    pool = subparsers.add_parser("pool", help="darknet inference in a pool of worker processes")
+    pool.add_argument("--frames", type=int, default=64)
+    pool.add_argument("--workers", default="1,2,4")
+    pool.add_argument("--threads_per_worker", type=int, default=None)
+    pool.add_argument("--images", type=str, default=None, help="directory of captures, random frames if unset")
+    pool.add_argument("--config_file", default="screenshots/screenshots.cfg")
+    pool.add_argument("--data_file", default="screenshots/screenshots.data")
+    pool.add_argument("--weights", default="screenshots/screenshots_best.weights")
+    pool.add_argument("--thresh", type=float, default=.25)
+    pool.set_defaults(func=bench_pool)
+
+    roi = subparsers.add_parser("roi", help="darknet inference on a region of interest and tiles")
+    roi.add_argument("--frames", type=int, default=32)
+    roi.add_argument("--roi", type=str, default=None, help="x,y,width,height")
+    roi.add_argument("--tile", type=str, default=None, help="WIDTHxHEIGHT")
+    roi.add_argument("--images", type=str, default=None, help="directory of captures, random frames if unset")
+    roi.add_argument("--config_file", default="screenshots/screenshots.cfg")
+    roi.add_argument("--data_file", default="screenshots/screenshots.data")
+    roi.add_argument("--weights", default="screenshots/screenshots_best.weights")
+    roi.add_argument("--thresh", type=float, default=.25)
+    roi.set_defaults(func=bench_roi)
+
+    match = subparsers.add_parser("match", help="fuzzy matching of OCR text against chat messages")
+    match.add_argument("--texts", type=int, default=500)
+    match.add_argument("--window", type=int, default=200, help="candidate messages per OCR text")
+    match.add_argument("--chat", type=str, default=None, help="chat_lines.json to take messages from, synthetic if unset")
+    match.add_argument("--seed", type=int, default=0)
+    match.set_defaults(func=bench_match)
+
+    accuracy = subparsers.add_parser("accuracy", help="OCR and matching accuracy on labelled bubbles")
+    accuracy.add_argument("--labels", required=True,
+                          help="JSON list of {image, bbox, message}, image paths relative to the file")
+    accuracy.add_argument("--chat", default="chat_lines.json")
+    accuracy.add_argument("--ocr_threads", type=int, default=4)
+    accuracy.set_defaults(func=bench_accuracy)
+
+    detlog = subparsers.add_parser("detlog", help="per-frame YAML files against the binary detection log")
+    detlog.add_argument("--frames", type=int, default=2000)
+    detlog.add_argument("--boxes", type=int, default=8, help="average detections per frame")
+    detlog.set_defaults(func=bench_detlog)
+
+    nms = subparsers.add_parser("nms", help="NumPy NMS against darknet's do_nms_sort")
+    nms.add_argument("--candidates", default="100,1000,10000")
+    nms.add_argument("--classes", type=int, default=2)
+    nms.add_argument("--nms", type=float, default=.45)
+    nms.add_argument("--repeat", type=int, default=5)
+    nms.set_defaults(func=bench_nms)
+
+    backends = subparsers.add_parser("backends", help="latency and agreement of the detector backends")
+    backends.add_argument("--backends", default="darknet,opencv", help="the first one is the reference")
+    backends.add_argument("--frames", type=int, default=32)
+    backends.add_argument("--threads", type=int, default=None, help="CPU threads for the opencv backend")
+    backends.add_argument("--iou", type=float, default=.5, help="overlap at which two detections agree")
+    backends.add_argument("--images", type=str, default=None, help="directory of captures, random frames if unset")
+    backends.add_argument("--config_file", default="screenshots/screenshots.cfg")
+    backends.add_argument("--data_file", default="screenshots/screenshots.data")
+    backends.add_argument("--weights", default="screenshots/screenshots_best.weights")
+    backends.add_argument("--thresh", type=float, default=.25)
+    backends.set_defaults(func=bench_backends)
+
+    return parser.parse_args()
+
+
+def main():
+    args = parser()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Time-sorted index of the scraped chat log for matching OCR text.
+
+combined.py used to parse every line of chat_lines.json with strptime for
+every frame and run SequenceMatcher on every line within 10 seconds.
+ChatLogIndex parses and normalises each line once, keeps the lines sorted by
+time so a frame's window is two bisects, and throws out candidates whose
+trigrams make a good enough score impossible before the edit distance (fuzzy.py)
+is computed.
+
+refresh() picks up lines appended to the file since the last call (both a
+JSON array rewritten by an exporter and JSON Lines appended in place), and
+add() takes lines straight from the scraper.
+"""
+import json
+import os
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+
+from fuzzy import best_match, normalize
+
+# (format, timezone): the page's observer stamps lines with toISOString(), which is UTC;
+# the older exporter wrote toLocaleString(), the local wall clock
+TIME_FORMATS = (("%m/%d/%Y, %H:%M:%S", None), ("%Y-%m-%d %H:%M:%S", timezone.utc))
+
+
+def parse_time(text):
+    """
+    Unix time of a chat line's 'time', or None.
+    """
+    for time_format, zone in TIME_FORMATS:
+        try:
+            parsed = datetime.strptime(text, time_format)
+        except ValueError:
+            continue
+        return parsed.replace(tzinfo=zone).timestamp() if zone is not None else parsed.timestamp()
+    return None
+
+
+def trigrams(text):
+    """
+    Trigrams of an already normalised text, padded so short texts have some.
+    """
+    text = f"  {text} "
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def could_match(ocr_length, ocr_grams, length, grams, min_score):
+    """
+    Cheap necessary conditions for 1 - distance / longest to reach min_score.
+    """
+    longest = max(ocr_length, length)
+    limit = int((1 - min_score) * longest + 1e-9)
+    # Every edit changes the length by at most one...
+    if abs(ocr_length - length) > limit:
+        return False
+    # ...and destroys at most three trigrams of either text
+    return len(ocr_grams & grams) >= max(len(ocr_grams), len(grams)) - 3 * limit
+
+
+class ChatLogIndex:
+    def __init__(self, path=None, window_seconds=10, min_length=9, refresh_interval=1.0):
+        """
+        Args:
+            path: chat_lines.json to load and follow, or None to only use add().
+            window_seconds: how far a message may be from a frame's time.
+            min_length: shorter messages are never matched (too easy to match by accident).
+            refresh_interval: refresh() looks at the file at most this often.
+        """
+        self.path = path
+        self.window_seconds = window_seconds
+        self.min_length = min_length
+        self.refresh_interval = refresh_interval
+
+        self.times = []
+        self.entries = []
+        self._sequence = 0
+        self._loaded = 0
+        self._offset = 0
+        self._signature = None
+        self._checked = 0.0
+        if path is not None:
+            self.refresh(force=True)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def revision(self):
+        """
+        Changes whenever lines are added, so callers can tell whether a failed match is worth retrying.
+        """
+        return self._sequence
+
+    def add(self, lines):
+        """
+        Index chat lines ({'time', 'name', 'message'} dicts). Returns how many were added.
+        """
+        added = 0
+        for line in lines:
+            timestamp = parse_time(line.get('time', ''))
+            if timestamp is None:
+                continue
+            message = line['message']
+            # The sequence number keeps lines with the same second in arrival order
+            key = (timestamp, self._sequence)
+            normalized = normalize(message)
+            entry = {'message': message, 'name': line['name'], 'time': line['time'],
+                     'normalized': normalized, 'length': len(normalized), 'grams': trigrams(normalized)}
+            self._sequence += 1
+            if not self.times or key >= self.times[-1]:
+                self.times.append(key)
+                self.entries.append(entry)
+            else:
+                index = bisect_right(self.times, key)
+                insort(self.times, key)
+                self.entries.insert(index, entry)
+            added += 1
+        return added
+
+    def refresh(self, force=False):
+        """
+        Index lines added to the file since the last refresh. Returns how many were added.
+        """
+        now = time.monotonic()
+        if self.path is None or (not force and now - self._checked < self.refresh_interval):
+            return 0
+        self._checked = now
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return 0
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return 0
+
+        with open(self.path, 'r') as file:
+            head = file.read(1)
+            if head == '[':
+                # A JSON array is rewritten whole; lines before the old end were indexed already
+                file.seek(0)
+                lines = json.load(file)
+                if len(lines) < self._loaded:
+                    self._reset()
+                new_lines = lines[self._loaded:]
+                self._loaded = len(lines)
+            else:
+                # JSON Lines only ever grow, so read from where we stopped
+                if stat.st_size < self._offset:
+                    self._reset()
+                file.seek(self._offset)
+                data = file.read()
+                complete = data[:data.rfind('\n') + 1]
+                self._offset += len(complete.encode('utf-8'))
+                new_lines = [json.loads(row) for row in complete.splitlines() if row.strip()]
+        self._signature = signature
+        return self.add(new_lines)
+
+    def _reset(self):
+        # The file was truncated or replaced by a shorter one
+        self.times = []
+        self.entries = []
+        self._loaded = 0
+        self._offset = 0
+
+    def forget_before(self, target_time):
+        """
+        Drop lines older than a datetime (naive ones are local time), for indexes that live as long as the stream does.
+        """
+        stop = bisect_left(self.times, (target_time.timestamp(),))
+        del self.times[:stop]
+        del self.entries[:stop]
+        return stop
+
+    def window(self, target_time, seconds=None):
+        """
+        Entries within `seconds` (default window_seconds) of a datetime (naive ones are local time), in time order.
+        """
+        seconds = self.window_seconds if seconds is None else seconds
+        center = target_time.timestamp()
+        start = bisect_left(self.times, (center - seconds,))
+        stop = bisect_right(self.times, (center + seconds, float('inf')))
+        return self.entries[start:stop]
+
+    def match(self, ocr_text, target_time, min_score=0.75):
+        """
+        Message near target_time most similar to ocr_text, as
+        {'message', 'name', 'time', 'score'}, or None if none reaches min_score.
+        """
+        normalized = normalize(ocr_text)
+        ocr_length = len(normalized)
+        ocr_grams = trigrams(normalized)
+        candidates = [entry for entry in self.window(target_time)
+                      if len(entry['message']) >= self.min_length
+                      and could_match(ocr_length, ocr_grams, entry['length'], entry['grams'], min_score)]
+        entry, score = best_match(ocr_text, candidates, min_score, key=lambda entry: entry['normalized'])
+        if entry is None:
+            return None
+        return {'message': entry['message'], 'name': entry['name'], 'time': entry['time'], 'score': score}
@@ -1,245 +1,316 @@
-import numpy as np
+import argparse
 import os
 import time
 import cv2
 import darknet
-import yaml
-import glob
 import re
 from datetime import datetime, timedelta
-from PIL import Image
-import pytesseract
-import json
-from difflib import SequenceMatcher
-
-# Track processed images to avoid duplicate processing
-processed_images = set()
-
-# Helper function to calculate text similarity
-def text_similarity(a, b):
-    return SequenceMatcher(None, a, b).ratio()
-
-# Load chat lines from JSON
-def load_chat_lines(json_path):
-    with open(json_path, 'r') as file:
-        return json.load(file)
+from framegate import ChangeGate
+from ledger import FrameLedger, detector_version
+from detector import BACKENDS, make_detector
+from incremental import IncrementalDetector
+from detector_pool import DetectionError, DetectorPool
+from roi import parse_region, parse_size
+from ocr import OcrStage
+from chatindex import ChatLogIndex
+from detlog import DetectionLog
+from tracker import BubbleTracker
 
 # Extract the timestamp from the input filename
 def extract_timestamp_from_filename(filename):
-    timestamp_match = re.search(r"screengrab-input-(\d{8}_\d{6})", filename)
+    timestamp_match = re.search(r"screengrab-input-(\d{8}_\d{6})(?:_(\d{3}))?", filename)
     if not timestamp_match:
         return None
-    timestamp_str = timestamp_match.group(1)
-    return datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-
-# Find messages in chat_lines.json within 10 seconds of the timestamp
-def find_messages_within_timeframe(chat_lines, target_time):
-    messages_in_timeframe = []
-    for chat in chat_lines:
-        message_time = datetime.strptime(chat['time'], "%m/%d/%Y, %H:%M:%S")
-        if abs((message_time - target_time).total_seconds()) <= 10:
-            messages_in_timeframe.append({'message': chat['message'], 'name': chat['name']})
-    return messages_in_timeframe
-
-
-# Match OCR text to chat messages with 80% similarity
-def find_matching_message(ocr_text, messages):
-    for entry in messages:
-        message = entry['message']
-        if len(message) > 8 and text_similarity(ocr_text, message) >= 0.8:
-            return entry  # Return both message and name
-    return None
-
+    timestamp = datetime.strptime(timestamp_match.group(1), "%Y%m%d_%H%M%S")
+    # Newer captures carry milliseconds
+    return timestamp + timedelta(milliseconds=int(timestamp_match.group(2) or 0))
+
+# Frame id for the detection log: the input's capture time as digits, e.g. 20240928011822
+# (20240928011822123 for names with milliseconds)
+def frame_id_from_filename(filename):
+    timestamp_match = re.search(r"screengrab-input-(\d{8})_(\d{6})(?:_(\d{3}))?", filename)
+    if not timestamp_match:
+        return 0
+    return int(''.join(part for part in timestamp_match.groups() if part))
 
 # Generate the next output filename from the input filename
 def get_output_filename_from_input(input_file):
-    timestamp_match = re.search(r"screengrab-input-(\d+_\d+).png", input_file)
+    timestamp_match = re.search(r"screengrab-input-(\d+_\d+(?:_\d+)?)\.png", input_file)
     if not timestamp_match:
         return None
     timestamp = timestamp_match.group(1)
     return f"output/screengrab-output-{timestamp}.png"
 
-# Get unprocessed input files based on the prefix and directory
-def get_unprocessed_input_filenames(directory, prefix):
-    files = glob.glob(os.path.join(directory, f"{prefix}-*.png"))
-    unprocessed_files = []
-    for file in files:
-        output_file = get_output_filename_from_input(file)
-        if output_file and not os.path.exists(output_file):
-            unprocessed_files.append(file)
-    return unprocessed_files
-
-# Write detections to a YAML file
-def write_detections_to_yaml(detections, output_file, timestamp):
-    detections_serializable = [(label, confidence, list(bbox)) for label, confidence, bbox in detections]
-    data = {'timestamp': timestamp, 'detections': detections_serializable}
-    with open(output_file, 'w') as file:
-        yaml.dump(data, file)
-
-# Extract the message coordinates from the YAML data
-def extract_message_coordinates(yaml_data):
-    message_coordinates = []
-    if 'detections' in yaml_data:
-        for entry in yaml_data['detections']:
-            if entry[0] == 'message':  # Assuming 'message' label indicates the region of interest
-                message_coordinates.append(entry[2])
-    return message_coordinates
-
-# Perform OCR on the image based on the scaled bounding box coordinates
-def perform_ocr_on_image(image_path, coordinates):
-    # Scaling factors based on the resolution difference
-    width_scale_factor = 1614 / 1920
-    height_scale_factor = 885 / 1088
-    
-    # Scale the bounding box coordinates
-    center_x, center_y, width, height = coordinates
-    center_x *= width_scale_factor
-    center_y *= height_scale_factor
-    width *= width_scale_factor
-    height *= height_scale_factor
-
-    # Calculate the bounding box coordinates in the input resolution
-    x1 = center_x - (width / 2)
-    y1 = center_y - (height / 2)
-    x2 = center_x + (width / 2)
-    y2 = center_y + (height / 2)
-
-    # Open the original input image and crop it using the adjusted coordinates
-    image = Image.open(image_path)
-    cropped_image = image.crop((x1, y1, x2, y2))
-
-    # Convert the cropped image to OpenCV format and up-sample it
-    cropped_image_cv = np.array(cropped_image)
-    cropped_image_cv = cv2.cvtColor(cropped_image_cv, cv2.COLOR_RGB2BGR)
-    cropped_image_cv = cv2.resize(cropped_image_cv, (0, 0), fx=2, fy=2)
-
-    # Convert the image to HSV color-space and get the binary mask
-    hsv = cv2.cvtColor(cropped_image_cv, cv2.COLOR_BGR2HSV)
-    lower_bound = np.array([0, 0, 123])
-    upper_bound = np.array([179, 255, 255])
-    msk = cv2.inRange(hsv, lower_bound, upper_bound)
-
-    # Perform OCR on the masked image
-    text = pytesseract.image_to_string(msk, lang='eng', config='--oem 3 --psm 7')
-
-    return text
-
-def process_ocr_on_yaml_and_image(yaml_file, png_file, chat_lines):
-    with open(yaml_file, 'r') as file:
-        yaml_data = yaml.load(file, Loader=yaml.FullLoader)
-
-    message_coordinates_list = extract_message_coordinates(yaml_data)
-
-    if message_coordinates_list:
-        # Extract timestamp from the input filename
-        timestamp = extract_timestamp_from_filename(png_file)
-        if not timestamp:
-            print(f"Invalid timestamp in filename {png_file}")
-            return
-        
-        # Find chat messages within 10 seconds of the timestamp
-        nearby_messages = find_messages_within_timeframe(chat_lines, timestamp)
-
-        for message_coordinates in message_coordinates_list:
-            try:
-                # Print the coordinates
-                # print(f"Processing coordinates: {message_coordinates}")
-
-                # Perform OCR on the image
-                ocr_text = perform_ocr_on_image(png_file, message_coordinates)
-                
-                # Try to match the OCR text with any chat message
-                matching_entry = find_matching_message(ocr_text, nearby_messages)
-                
-                if matching_entry:
-                    matched_message = matching_entry['message']
-                    user = matching_entry['name']
-                    print(f"OCR Text: '{ocr_text}' matched")
-                    print('#'*90)
-                    print(f'{user} says {matched_message}')
-                    print(f'coords: {message_coordinates}')
-                else:
-                    pass
-                    # print(f"No matching chat message found for OCR text: '{ocr_text}' at coordinates {message_coordinates}")
-                    
-            except ValueError as e:
-                print(f"Error processing {png_file}: {e}")
-    else:
-        pass
-        # print(f"No message coordinates found in {yaml_file}")
+# List input files based on the prefix and directory (one readdir, no stat calls)
+def list_input_filenames(directory, prefix):
+    with os.scandir(directory) as entries:
+        return [os.path.join(directory, entry.name) for entry in entries
+                if entry.name.startswith(f"{prefix}-") and entry.name.endswith(".png")]
+
+# Get unprocessed input files: those the ledger has no current record for
+def get_unprocessed_input_filenames(directory, prefix, ledger, version):
+    files = list_input_filenames(directory, prefix)
+    if ledger.is_empty():
+        # First run with a ledger: adopt frames that already have an output image
+        done = [file for file in files if os.path.exists(get_output_filename_from_input(file) or "")]
+        ledger.record_many(done, 'done', version)
+    return ledger.pending(files, version)
+
+# OCR the message boxes of an already decoded frame that the tracker has not read yet, and match the text
+# against the chat log
+def process_ocr_on_frame(image, png_file, messages, chat_index, ocr, tracker):
+    # Extract timestamp from the input filename
+    timestamp = extract_timestamp_from_filename(png_file)
+    if not timestamp:
+        print(f"Invalid timestamp in filename {png_file}")
+        return
 
+    # Bubbles seen in earlier frames keep their track, text and match
+    tracks = tracker.update(messages, timestamp, image)
+    if not tracks:
+        return
 
-# Load chat lines once for the entire script
-chat_lines = load_chat_lines('../chat_lines.json')
+    # Pick up chat lines scraped since the last frame
+    chat_index.refresh()
 
-# Main function
-def main():
-    # Set up YOLO
-    network, class_names, class_colors = darknet.load_network(
-        "../screenshots/screenshots.cfg", "../screenshots/screenshots.data", "../screenshots/screenshots_best.weights", batch_size=1
-    )
+    # Perform OCR on the new and changed bubbles of the frame at once
+    unread = [track for track in tracks if track.needs_read]
+    for track, ocr_text in zip(unread, ocr.read(image, [track.box for track in unread])):
+        track.set_text(ocr_text)
 
-    input_directory = 'input_grabs'
-    input_prefix = 'screengrab-input'
-    os.makedirs("output", exist_ok=True)
+    for track in tracks:
+        if not track.needs_match(chat_index.revision):
+            continue
+        try:
+            # Try to match the OCR text with any chat message within 10 seconds of when the bubble appeared
+            matching_entry = chat_index.match(track.text, track.first_seen)
+
+            if track.resolve(matching_entry, chat_index.revision):
+                matched_message = matching_entry['message']
+                user = matching_entry['name']
+                print(f"OCR Text: '{track.text}' matched ({matching_entry['score']:.2f})")
+                print('#'*90)
+                print(f'{user} says {matched_message}')
+                print(f'coords: {list(track.box)}')
+
+        except ValueError as e:
+            print(f"Error processing {png_file}: {e}")
+
+
+# Chat lines indexed by time once, then followed as the file grows
+chat_index = ChatLogIndex('../chat_lines.json')
+
+# Bubbles followed across frames, so each one is read and matched once
+tracker = BubbleTracker()
+
+# Save outputs, run OCR and record the frame once its detections are known
+def finish_frame(image_path, image, image_resized, array, detect_ms, class_colors, ledger, version, ocr,
+                 detection_log):
+    detections = darknet.array_to_detections(array, detection_log.class_names)
+
+    # Draw bounding boxes and labels on the detector's BGR buffer, which is rewritten next batch anyway
+    image_with_boxes = darknet.draw_boxes(detections, image_resized, class_colors)
+
+    # Fix the output filename to avoid nested "output/output"
+    output_filename = get_output_filename_from_input(image_path)
+
+    # One appended record per detection instead of a YAML file per frame
+    detection_log.append(frame_id_from_filename(image_path), os.path.getctime(image_path), array)
+
+    # Save the annotated image
+    cv2.imwrite(f"{output_filename}", image_with_boxes)
+
+    # Run OCR on the original input image and try to match with chat messages
+    ocr_start = time.perf_counter()
+    messages = array[array["class_id"] == detection_log.class_names.index('message')]
+    process_ocr_on_frame(image, image_path, messages, chat_index, ocr, tracker)
+    ocr_ms = (time.perf_counter() - ocr_start) * 1000
+
+    # Mark the image as processed
+    ledger.record(image_path, 'done', version, len(detections), detect_ms, ocr_ms)
+
+def parser():
+    parser = argparse.ArgumentParser(description="Detect, OCR and match chat bubbles in captured frames")
+    parser.add_argument("--batch_size", default=1, type=int,
+                        help="number of frames per network forward pass")
+    parser.add_argument("--workers", default=0, type=int,
+                        help="detect in this many worker processes, each with its own network (0 detects in-process)")
+    parser.add_argument("--threads_per_worker", default=None, type=int,
+                        help="OpenMP threads for each worker's network")
+    parser.add_argument("--roi", type=str, default=None,
+                        help="x,y,width,height of the screen to detect in, or 'auto' to learn it from detections")
+    parser.add_argument("--tile", type=str, default=None,
+                        help="WIDTHxHEIGHT tiles to split the region into at native resolution")
+    parser.add_argument("--tile_overlap", type=int, default=160, help="minimum overlap between tiles in pixels")
+    parser.add_argument("--ocr_threads", default=4, type=int, help="bubbles read in parallel")
+    parser.add_argument("--ocr_cache", default=2048, type=int,
+                        help="OCR results remembered by crop hash (0 disables the cache)")
+    parser.add_argument("--detection_log", default="output/detections.detlog",
+                        help="binary log every frame's detections are appended to (see detlog.py for YAML)")
+    parser.add_argument("--detector", choices=BACKENDS, default='darknet',
+                        help="run the network with libdarknet or with OpenCV's DNN module (no Darknet build needed)")
+    parser.add_argument("--detector_threads", type=int, default=None,
+                        help="CPU threads for the opencv detector (default: OpenCV's choice)")
+    parser.add_argument("--detector_socket", default=None,
+                        help="socket of the detectord to use with --detector daemon (default /tmp/pwn-detector.sock)")
+    parser.add_argument("--incremental", action='store_true',
+                        help="keep every tile's detections and re-detect only the tiles that changed (needs --tile)")
+    parser.add_argument("--refresh_every", type=int, default=30,
+                        help="with --incremental, detect every tile every this many frames (0 = never)")
+    args = parser.parse_args()
+    if args.incremental and args.tile is None:
+        parser.error("--incremental needs --tile")
+    if args.incremental and args.detector == 'daemon':
+        parser.error("--incremental runs its own network, it cannot use --detector daemon")
+    if args.detector == 'daemon':
+        # detectord runs the network with its own settings, these would be silently ignored
+        given = [f"--{name}" for name in ('roi', 'tile', 'tile_overlap') if getattr(args, name) != parser.get_default(name)]
+        if given:
+            parser.error(f"{', '.join(given)} must be set on detectord.py, not with --detector daemon")
+    if args.incremental and (args.batch_size != 1 or args.workers > 0):
+        parser.error("--incremental detects one frame at a time in-process (--batch_size 1, --workers 0)")
+    if args.workers > 0 and args.detector == 'daemon':
+        parser.error("--workers runs its own networks, it cannot use --detector daemon")
+    if args.workers > 0 and args.batch_size != 1:
+        parser.error("--workers detects one frame per worker at a time, it cannot be combined with --batch_size")
+    return args
+
+# Frames that are unreadable or unchanged never reach YOLO; returns the image or None
+def read_gated_frame(image_path, gate, ledger, version):
+    image = cv2.imread(image_path)
+
+    if image is None:
+        print(f"Error: Unable to read image from {image_path}")
+        ledger.record(image_path, 'failed', version)
+        return None
 
-    # Get all unprocessed images
-    unprocessed_images = get_unprocessed_input_filenames(input_directory, input_prefix)
-    if not unprocessed_images:
-        print(f"No new images found in {input_directory}")
-        return
+    # Nothing moved since the last processed frame, so there are no new bubbles to read
+    if not gate.check(image):
+        ledger.record(image_path, 'skipped', version)
+        return None
+    return image
+
+def detector_options(args):
+    return {'backend': args.detector, 'thresh': 0.25, 'roi': parse_region(args.roi), 'tile': parse_size(args.tile),
+            'tile_overlap': args.tile_overlap}
+
+# One network in this process, fed in batches of --batch_size frames
+def process_in_process(unprocessed_images, gate, ledger, version, config_file, data_file, weights_file, args, ocr):
+    # Set up YOLO; the detector keeps its frame buffers between frames
+    if args.incremental:
+        # Frames come in capture order, so every frame's unchanged tiles keep the last frame's detections
+        detector = IncrementalDetector(config_file, data_file, weights_file, refresh_every=args.refresh_every,
+                                       threads=args.detector_threads, **detector_options(args))
+    else:
+        detector = make_detector(config_file, data_file, weights_file, batch_size=args.batch_size,
+                                 threads=args.detector_threads, socket_path=args.detector_socket,
+                                 **detector_options(args))
+    detection_log = DetectionLog(args.detection_log, detector.class_names)
+    batch = []
+
+    def run_batch():
+        detect_start = time.perf_counter()
+        arrays = detector.detect_prepared(len(batch))
+        detect_ms = (time.perf_counter() - detect_start) * 1000 / len(batch)
+        for slot, ((image_path, image), array) in enumerate(zip(batch, arrays)):
+            finish_frame(image_path, image, detector.canvas[slot], array, detect_ms, detector.class_colors,
+                         ledger, version, ocr, detection_log)
+        batch.clear()
 
     for image_path in unprocessed_images:
-        timestamp = os.path.getctime(image_path)
-        human_readable_timestamp = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
-        image = cv2.imread(image_path)
-
+        image = read_gated_frame(image_path, gate, ledger, version)
         if image is None:
-            print(f"Error: Unable to read image from {image_path}")
             continue
 
-        # Get the width and height of the Darknet network
-        width = 1920
-        height = 1088
-
-        # Create a Darknet IMAGE object with the specified width, height, and 3 channels
-        darknet_image = darknet.make_image(width, height, 3)
-
-        # Convert the input image from BGR to RGB color space
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-        # Resize the image to match the dimensions of the Darknet network
-        image_resized = cv2.resize(image_rgb, (width, height), interpolation=cv2.INTER_LINEAR)
-
-        # Copy the resized image data into the Darknet IMAGE object
-        darknet.copy_image_from_bytes(darknet_image, image_resized.tobytes())
-
-        # Run YOLO object detection
-        detections = darknet.detect_image(network, class_names, darknet_image, thresh=0.25)
-
-        # Free the memory used by the Darknet IMAGE object
-        darknet.free_image(darknet_image)
+        # Resize straight into the detector's buffers for the next free batch slot
+        detector.prepare(image, len(batch))
+        batch.append((image_path, image))
+        if len(batch) == args.batch_size:
+            run_batch()
+
+    if batch:
+        run_batch()
+    if args.incremental:
+        print(detector.summary())
+    detection_log.close()
+    detector.close()
+
+# --workers networks in worker processes; results come back in capture order
+def process_with_pool(unprocessed_images, gate, ledger, version, config_file, data_file, weights_file, args, ocr):
+    with DetectorPool(config_file, data_file, weights_file, workers=args.workers,
+                      threads_per_worker=args.threads_per_worker, detector_options=detector_options(args)) as pool:
+        detection_log = DetectionLog(args.detection_log, pool.class_names)
+
+        def finish_next():
+            try:
+                (image_path, image), array, detect_ms = pool.get()
+            except DetectionError as e:
+                # One bad frame is recorded as failed; the rest of the run goes on
+                print(f"Error: {e}")
+                ledger.record(e.tag[0], 'failed', version)
+                return
+            image_resized = cv2.resize(image, (1920, 1088), interpolation=cv2.INTER_LINEAR)
+            finish_frame(image_path, image, image_resized, array, detect_ms, pool.class_colors,
+                         ledger, version, ocr, detection_log)
+
+        for image_path in unprocessed_images:
+            image = read_gated_frame(image_path, gate, ledger, version)
+            if image is None:
+                continue
+
+            # Blocks while every worker slot is busy, so reading never runs far ahead of detection
+            try:
+                pool.submit(image, tag=(image_path, image))
+            except ValueError as e:
+                # Larger than the pool's shared-memory slots; the other frames go on
+                print(f"Error: skipping {image_path}: {e}")
+                ledger.record(image_path, 'failed', version)
+                continue
+            while pool.ready():
+                finish_next()
 
-        # Draw bounding boxes and labels on the image based on the detected objects
-        image_with_boxes = darknet.draw_boxes(detections, image_resized, class_colors)
+        while pool.pending():
+            finish_next()
+        detection_log.close()
 
-        # Fix the output filename to avoid nested "output/output"
-        output_filename = get_output_filename_from_input(image_path)
-        yaml_output_file = f"{output_filename.split('.png')[0]}.yaml"  # Remove extra "output/" path
+# Main function
+def main():
+    args = parser()
+    config_file = "../screenshots/screenshots.cfg"
+    weights_file = "../screenshots/screenshots_best.weights"
+    data_file = "../screenshots/screenshots.data"
 
-        write_detections_to_yaml(detections, yaml_output_file, human_readable_timestamp)
+    input_directory = 'input_grabs'
+    input_prefix = 'screengrab-input'
+    os.makedirs("output", exist_ok=True)
 
-        # Convert image back to BGR color space before saving with OpenCV
-        image_bgr = cv2.cvtColor(image_with_boxes, cv2.COLOR_RGB2BGR)
+    # Remembers what every frame went through, so reruns pick up where they stopped
+    ledger = FrameLedger("output/ledger.sqlite3")
+    version = detector_version(config_file, weights_file)
 
-        # Save the annotated image
-        cv2.imwrite(f"{output_filename}", image_bgr)
+    # Get all unprocessed images
+    unprocessed_images = get_unprocessed_input_filenames(input_directory, input_prefix, ledger, version)
+    if not unprocessed_images:
+        print(f"No new images found in {input_directory}")
+        return
+    print(f"{len(unprocessed_images)} frames to process with detector {version}")
 
-        # Run OCR on the original input image and try to match with chat messages
-        process_ocr_on_yaml_and_image(yaml_output_file, image_path, chat_lines)
+    # Go through frames in capture order so the change gate compares neighbours
+    unprocessed_images.sort()
+    gate = ChangeGate()
+    ocr = OcrStage(threads=args.ocr_threads, cache_size=args.ocr_cache)
 
-        # Mark the image as processed
-        processed_images.add(image_path)
+    if args.workers > 0:
+        process_with_pool(unprocessed_images, gate, ledger, version, config_file, data_file, weights_file, args, ocr)
+    else:
+        process_in_process(unprocessed_images, gate, ledger, version, config_file, data_file, weights_file, args, ocr)
+
+    print(gate.summary())
+    print(f"Ledger: {ledger.summary()}")
+    print(ocr.summary())
+    print(tracker.summary())
+    ledger.close()
+    ocr.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,143 @@
+"""
+OpenCV DNN backend for the detector.
+
+darknet.py needs a libdarknet.so that someone built by hand (which is why
+combined.py used to have to run in WSL). cv2.dnn reads the same
+screenshots.cfg and .weights with readNetFromDarknet and runs them on the CPU
+with OpenCV's own kernels, so opencv-python is all a machine needs.
+
+OpenCVDetector is a DarknetDetector with the network calls swapped out:
+regions, tiles, batching and the output coordinates all behave the same. The
+YOLO layers' raw rows are turned into DETECTION_DTYPE rows the way
+get_network_boxes does it (a row per box and class whose objectness times
+class probability passes the threshold), then suppressed with nms.py.
+
+    detector = make_detector(config_file, data_file, weights, backend='opencv', threads=4)
+"""
+import os
+
+import cv2
+import numpy as np
+
+import darknet
+from detector import DarknetDetector, FrameBuffers
+from nms import nms
+
+
+def read_data_file(data_file):
+    """
+    key = value pairs of a Darknet .data file.
+    """
+    values = {}
+    with open(data_file) as file:
+        for line in file:
+            line = line.split('#', 1)[0].strip()
+            if '=' in line:
+                key, value = line.split('=', 1)
+                values[key.strip()] = value.strip()
+    return values
+
+
+def read_class_names(data_file):
+    """
+    Class names from the 'names' file a .data file points to. Darknet resolves
+    that path from its working directory, so the .data file's directory is tried too.
+    """
+    names_file = read_data_file(data_file)['names']
+    if not os.path.exists(names_file):
+        names_file = os.path.join(os.path.dirname(data_file), os.path.basename(names_file))
+    with open(names_file) as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def read_input_size(config_file):
+    """
+    (width, height) from the [net] section of a Darknet .cfg file.
+    """
+    size = {}
+    section = None
+    with open(config_file) as file:
+        for line in file:
+            line = line.split('#', 1)[0].strip()
+            if line.startswith('['):
+                section = line
+                if size:
+                    break
+            elif section in ('[net]', '[network]') and '=' in line:
+                key, value = (part.strip() for part in line.split('=', 1))
+                if key in ('width', 'height'):
+                    size[key] = int(value)
+    return size['width'], size['height']
+
+
+class BlobBuffers(FrameBuffers):
+    """
+    FrameBuffers with the planar floats in a NumPy array instead of a Darknet
+    IMAGE; the first n slots are the NCHW blob cv2.dnn takes.
+    """
+
+    def __init__(self, width, height, slots=1):
+        self.width = width
+        self.height = height
+        self.slots = slots
+        self.image = None
+        self.pixels = np.zeros((slots, 3, height, width), dtype=np.float32)
+        self.resized = np.zeros((slots, height, width, 3), dtype=np.uint8)
+
+    def close(self):
+        self.pixels = None
+
+
+class OpenCVDetector(DarknetDetector):
+    def __init__(self, config_file, data_file, weights, threads=None, **options):
+        """
+        Args:
+            threads: CPU threads cv2.dnn may use (None leaves OpenCV's default).
+            options: as for DarknetDetector. nms_method is ignored, NMS is always nms.py.
+        """
+        if threads is not None:
+            cv2.setNumThreads(threads)
+        super().__init__(config_file, data_file, weights, **options)
+
+    def _load_network(self, config_file, data_file, weights, slots):
+        if not hasattr(cv2.dnn, 'readNetFromDarknet'):
+            raise RuntimeError(f"OpenCV {cv2.__version__} cannot read Darknet models (the importer was removed "
+                               f"in 5.0); install opencv-python<5 for the opencv backend")
+        network = cv2.dnn.readNetFromDarknet(config_file, weights)
+        network.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        network.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.output_names = network.getUnconnectedOutLayersNames()
+        class_names = read_class_names(data_file)
+        return network, class_names, darknet.class_colors(class_names), read_input_size(config_file)
+
+    def _make_buffers(self, width, height, slots):
+        return BlobBuffers(width, height, slots)
+
+    def _resize_network(self, width, height):
+        # cv2.dnn takes its input size from the blob
+        pass
+
+    def _predict(self, slots):
+        self.network.setInput(self.buffers.pixels[:slots])
+        outputs = self.network.forward(self.output_names)
+        # Each YOLO layer gives (slots x) rows of center x, y, width, height (relative to the input),
+        # objectness and one objectness * class probability per class
+        rows = np.concatenate([output.reshape(slots, -1, output.shape[-1]) for output in outputs], axis=1)
+        return [self._decode(slot_rows) for slot_rows in rows]
+
+    def _decode(self, rows):
+        scores = rows[:, 5:]
+        boxes, class_ids = np.nonzero((scores > self.thresh) & (rows[:, 4:5] > self.thresh))
+        detections = np.empty(len(boxes), dtype=darknet.DETECTION_DTYPE)
+        detections["class_id"] = class_ids
+        detections["conf"] = scores[boxes, class_ids]
+        detections["x"] = rows[boxes, 0] * self.width
+        detections["y"] = rows[boxes, 1] * self.height
+        detections["w"] = rows[boxes, 2] * self.width
+        detections["h"] = rows[boxes, 3] * self.height
+        if self.nms:
+            return nms(detections, self.nms)
+        return detections[np.argsort(detections["conf"], kind="stable")]
+
+    def _free_network(self):
+        pass
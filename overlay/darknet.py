@@ -22,6 +22,8 @@ See the example code (such as "example_images.py") which imports this module.
 from ctypes import *
 import os
 import hashlib
+import numpy as np
+from nms import nms_indices
 
 # Define a structure to represent a bounding box with (x, y, width, height)
 class BOX(Structure):
@@ -181,71 +183,28 @@ def decode_detection(detections):
         decoded.append((str(label), confidence, bbox))
     return decoded
 
-# Non-Maximum Suppression (NMS) function based on the method by Malisiewicz et al.
-# https://www.pyimagesearch.com/2015/02/16/faster-non-maximum-suppression-python/
+# Non-Maximum Suppression (NMS) on (label, confidence, bbox) tuples, done by nms.py
 def non_max_suppression_fast(detections, overlap_thresh):
     """
-    Apply non-maximum suppression (NMS) to a list of detections.
+    Apply class-aware non-maximum suppression (NMS) to a list of detections.
 
     Args:
         detections: List of detected objects, where each detection is represented as a tuple
-                    (label, confidence, (x, y, w, h)).
-        overlap_thresh: Threshold for considering overlap between bounding boxes.
+                    (label, confidence, (x, y, w, h)), as returned by detect_image.
+        overlap_thresh: Boxes of the same label overlapping a kept box by more than this IoU are dropped.
 
     Returns:
-        List of selected detections after NMS.
+        List of selected detections after NMS, most confident first.
     """
-    boxes = []
-
-    # Convert detections to a list of bounding boxes
-    for detection in detections:
-        _, _, _, (x, y, w, h) = detection
-        x1 = x - w / 2
-        y1 = y - h / 2
-        x2 = x + w / 2
-        y2 = y + h / 2
-        boxes.append(np.array([x1, y1, x2, y2]))
-
-    boxes_array = np.array(boxes)
-
-    # Initialize the list of picked indexes
-    pick = []
-
-    # Extract coordinates of the bounding boxes
-    x1 = boxes_array[:, 0]
-    y1 = boxes_array[:, 1]
-    x2 = boxes_array[:, 2]
-    y2 = boxes_array[:, 3]
-
-    # Compute the area of the bounding boxes and sort by the bottom-right y-coordinate
-    area = (x2 - x1 + 1) * (y2 - y1 + 1)
-    idxs = np.argsort(y2)
-
-    # Keep looping while some indexes still remain in the indexes list
-    while len(idxs) > 0:
-        # Grab the last index in the indexes list and add it to the list of picked indexes
-        last = len(idxs) - 1
-        i = idxs[last]
-        pick.append(i)
-
-        # Find the largest (x, y) coordinates for the start of the bounding box
-        xx1 = np.maximum(x1[i], x1[idxs[:last]])
-        yy1 = np.maximum(y1[i], y1[idxs[:last]])
-        xx2 = np.minimum(x2[i], x2[idxs[:last]])
-        yy2 = np.minimum(y2[i], y2[idxs[:last]])
-
-        # Compute the width and height of the bounding box
-        w = np.maximum(0, xx2 - xx1 + 1)
-        h = np.maximum(0, yy2 - yy1 + 1)
-
-        # Compute the ratio of overlap
-        overlap = (w * h) / area[idxs[:last]]
-
-        # Delete all indexes from the index list that have high overlap with the current box
-        idxs = np.delete(idxs, np.concatenate(([last], np.where(overlap > overlap_thresh)[0])))
-
-    # Return only the bounding boxes that were picked using the integer data type
-    return [detections[i] for i in pick]
+    if not detections:
+        return []
+    labels = {}
+    array = np.empty(len(detections), dtype=DETECTION_DTYPE)
+    array["class_id"] = [labels.setdefault(label, len(labels)) for label, _, _ in detections]
+    array["conf"] = [float(confidence) for _, confidence, _ in detections]
+    for field, values in zip(("x", "y", "w", "h"), zip(*(bbox for _, _, bbox in detections))):
+        array[field] = values
+    return [detections[i] for i in nms_indices(array, overlap_thresh).tolist()]
 
 
 # Function to remove all classes with 0% confidence within the detection
@@ -293,10 +252,105 @@ def remove_negatives_faster(detections, class_names, num):
         predictions.append((name, detections[j].prob[detections[j].best_class_idx], bbox))
     return predictions
 
-# Function to perform object detection on an input image using a Darknet network
-def detect_image(network, class_names, image, thresh=.5, hier_thresh=.5, nms=.45):
+# One row per (box, class) pair that passed the threshold
+DETECTION_DTYPE = np.dtype([("class_id", np.int32),
+                            ("conf", np.float32),
+                            ("x", np.float32),
+                            ("y", np.float32),
+                            ("w", np.float32),
+                            ("h", np.float32)])
+
+# NumPy layout of the DETECTION struct, so the C array can be read without per-field ctypes access
+_DETECTION_VIEW = np.dtype({
+    "names": ["x", "y", "w", "h", "prob"],
+    "formats": [np.float32, np.float32, np.float32, np.float32, np.uintp],
+    "offsets": [DETECTION.bbox.offset + BOX.x.offset, DETECTION.bbox.offset + BOX.y.offset,
+                DETECTION.bbox.offset + BOX.w.offset, DETECTION.bbox.offset + BOX.h.offset,
+                DETECTION.prob.offset],
+    "itemsize": sizeof(DETECTION),
+})
+
+# Vectorized replacement for remove_negatives
+def detections_to_array(detections, num, num_classes, thresh=0.0):
     """
-    Returns a list with the highest confidence class and their bounding box.
+    Read a Darknet detection array into a structured NumPy array.
+
+    Args:
+        detections: POINTER(DETECTION) as returned by get_network_boxes.
+        num: Number of detections.
+        num_classes: Number of classes in each prob buffer.
+        thresh: Keep (box, class) pairs whose probability is above this.
+
+    Returns:
+        DETECTION_DTYPE array with one row per kept (box, class) pair, in box order.
+    """
+    if num == 0:
+        return np.empty(0, dtype=DETECTION_DTYPE)
+    dets = np.frombuffer((DETECTION * num).from_address(addressof(detections.contents)), dtype=_DETECTION_VIEW)
+
+    # Each box has its own prob allocation. Darknet makes them one after another,
+    # so they usually sit at a fixed stride and can be viewed as one matrix
+    addresses = dets["prob"]
+    row_bytes = num_classes * sizeof(c_float)
+    strides = np.diff(addresses.astype(np.int64))
+    if addresses[0] and (num == 1 or (strides[0] >= row_bytes and (strides == strides[0]).all())):
+        stride = int(strides[0]) if num > 1 else row_bytes
+        buffer = (c_char * (stride * (num - 1) + row_bytes)).from_address(int(addresses[0]))
+        probs = np.ndarray((num, num_classes), dtype=np.float32, buffer=buffer, strides=(stride, sizeof(c_float)))
+    else:
+        probs = np.zeros((num, num_classes), dtype=np.float32)
+        for row, address in zip(probs, addresses.tolist()):
+            if address:
+                memmove(row.ctypes.data, address, row_bytes)
+
+    boxes, class_ids = np.nonzero(probs > thresh)
+    result = np.empty(len(boxes), dtype=DETECTION_DTYPE)
+    result["class_id"] = class_ids
+    result["conf"] = probs[boxes, class_ids]
+    for field in ("x", "y", "w", "h"):
+        result[field] = dets[field][boxes]
+    return result
+
+# Convert a structured detection array back to the (label, confidence, bbox) tuples used elsewhere
+def array_to_detections(array, class_names):
+    """
+    Args:
+        array: DETECTION_DTYPE array.
+        class_names: List of class names.
+
+    Returns:
+        List of (label, confidence, (x, y, w, h)) with confidence formatted like decode_detection.
+    """
+    return [(class_names[class_id], str(round(conf * 100, 2)), (x, y, w, h))
+            for class_id, conf, x, y, w, h in array.tolist()]
+
+# Decode a Darknet detection array and apply NMS to it
+def suppress(detections, num, num_classes, nms=.45, nms_method="numpy"):
+    """
+    Args:
+        detections: POINTER(DETECTION) as returned by get_network_boxes.
+        num: Number of detections.
+        num_classes: Number of classes in each prob buffer.
+        nms: Non-Maximum Suppression threshold, 0 to keep every candidate.
+        nms_method: "numpy" decodes first and suppresses only the candidates
+                    above the threshold; "darknet" runs do_nms_sort on all num boxes.
+
+    Returns:
+        DETECTION_DTYPE array of the kept (box, class) pairs.
+    """
+    if nms and nms_method == "darknet":
+        do_nms_sort(detections, num, num_classes, nms)
+    predictions = detections_to_array(detections, num, num_classes)
+    if nms and nms_method == "numpy":
+        predictions = predictions[np.sort(nms_indices(predictions, nms))]
+    elif nms and nms_method != "darknet":
+        raise ValueError(f"Unknown NMS method {nms_method!r}")
+    return predictions
+
+# Function to perform object detection on an input image, returning a structured array
+def detect_image_array(network, class_names, image, thresh=.5, hier_thresh=.5, nms=.45, nms_method="numpy"):
+    """
+    Like detect_image, but returns a DETECTION_DTYPE array sorted by ascending confidence.
 
     Args:
         network: Darknet network.
@@ -305,20 +359,104 @@ def detect_image(network, class_names, image, thresh=.5, hier_thresh=.5, nms=.45
         thresh: Detection confidence threshold.
         hier_thresh: Hierarchical threshold.
         nms: Non-Maximum Suppression threshold.
+        nms_method: "numpy" to suppress the decoded candidates with nms.py, or
+                    "darknet" for do_nms_sort on every box the network produced.
 
     Returns:
-        List of detections with class name, confidence, and bounding box.
+        DETECTION_DTYPE array with float confidences.
     """
     pnum = pointer(c_int(0))
     predict_image(network, image)
     detections = get_network_boxes(network, image.w, image.h, thresh, hier_thresh, None, 0, pnum, 0)
     num = pnum[0]
-    if nms:
-        do_nms_sort(detections, num, len(class_names), nms)
-    predictions = remove_negatives(detections, class_names, num)
-    predictions = decode_detection(predictions)
+    predictions = suppress(detections, num, len(class_names), nms, nms_method)
     free_detections(detections, num)
-    return sorted(predictions, key=lambda x: x[1])
+    return predictions[np.argsort(predictions["conf"], kind="stable")]
+
+# Function to perform object detection on an input image using a Darknet network
+def detect_image(network, class_names, image, thresh=.5, hier_thresh=.5, nms=.45):
+    """
+    Returns a list with the highest confidence class and their bounding box.
+
+    Args:
+        network: Darknet network.
+        class_names: List of class names.
+        image: Input image.
+        thresh: Detection confidence threshold.
+        hier_thresh: Hierarchical threshold.
+        nms: Non-Maximum Suppression threshold.
+
+    Returns:
+        List of detections with class name, confidence, and bounding box.
+    """
+    return array_to_detections(detect_image_array(network, class_names, image, thresh, hier_thresh, nms), class_names)
+
+
+# Function to run an already filled batch IMAGE through the network
+def detect_batch_arrays(network, class_names, image, count, batch_size, thresh=.5, hier_thresh=.5, nms=.45,
+                        nms_method="numpy"):
+    """
+    Run a batch that is already laid out in an IMAGE through the network in a single forward pass.
+
+    Args:
+        network: Darknet network loaded with load_network(..., batch_size=batch_size).
+        class_names: List of class names.
+        image: IMAGE of one frame's width, height and channels whose data holds
+               batch_size planar RGB float frames back to back.
+        count: Number of frames in the batch that are real; the rest is padding.
+        batch_size: Batch size the network was loaded with.
+        thresh: Detection confidence threshold.
+        hier_thresh: Hierarchical threshold.
+        nms: Non-Maximum Suppression threshold.
+        nms_method: "numpy" or "darknet", see detect_image_array.
+
+    Returns:
+        One DETECTION_DTYPE array per real frame, sorted by ascending confidence.
+    """
+    batch_detections = network_predict_batch(network, image, batch_size, image.w, image.h,
+                                             thresh, hier_thresh, None, 0, 0)
+    results = []
+    for idx in range(count):
+        num = batch_detections[idx].num
+        detections = batch_detections[idx].dets
+        predictions = suppress(detections, num, len(class_names), nms, nms_method)
+        results.append(predictions[np.argsort(predictions["conf"], kind="stable")])
+    free_batch_detections(batch_detections, batch_size)
+    return results
+
+
+# Function to perform object detection on several images in one forward pass
+def detect_batch(network, class_names, images, thresh=.5, hier_thresh=.5, nms=.45, batch_size=None):
+    """
+    Run a batch of images through the network in a single forward pass.
+
+    Args:
+        network: Darknet network loaded with load_network(..., batch_size=batch_size).
+        class_names: List of class names.
+        images: List of RGB uint8 arrays already resized to the network's width and height.
+                May be shorter than batch_size; the rest of the batch is padded with black frames.
+        thresh: Detection confidence threshold.
+        hier_thresh: Hierarchical threshold.
+        nms: Non-Maximum Suppression threshold.
+        batch_size: Batch size the network was loaded with (defaults to len(images)).
+
+    Returns:
+        One list of detections per input image, each in the same format as detect_image.
+    """
+    width = network_width(network)
+    height = network_height(network)
+    batch_size = batch_size or len(images)
+    if len(images) > batch_size:
+        raise ValueError(f"{len(images)} images do not fit in a batch of {batch_size}")
+
+    # Darknet wants planar RGB floats in [0, 1], the frames back to back
+    batch_array = np.zeros((batch_size, 3, height, width), dtype=np.float32)
+    for i, image in enumerate(images):
+        np.multiply(image.transpose(2, 0, 1), np.float32(1 / 255), out=batch_array[i], dtype=np.float32)
+    darknet_images = IMAGE(width, height, 3, batch_array.ctypes.data_as(POINTER(c_float)))
+
+    return [array_to_detections(predictions, class_names) for predictions in
+            detect_batch_arrays(network, class_names, darknet_images, len(images), batch_size, thresh, hier_thresh, nms)]
 
 
 # Platform-specific library path and initialization
@@ -329,7 +467,40 @@ elif os.name == "nt":
 else:
     print("Unsupported OS")
     exit
-lib = CDLL(libpath, RTLD_GLOBAL)
+
+
+class _MissingFunction:
+    def __init__(self, name, error):
+        self.name = name
+        self.error = error
+
+    def __call__(self, *args, **kwargs):
+        raise OSError(f"Darknet function {self.name} is unavailable, {libpath} failed to load: {self.error}")
+
+
+class _MissingLibrary:
+    """
+    Stands in for libdarknet where it was never built. The module still imports, so the structures,
+    DETECTION_DTYPE and the NumPy helpers work for the OpenCV backend; calling into Darknet raises.
+    """
+    def __init__(self, error):
+        self.error = error
+
+    def __getattr__(self, name):
+        return _MissingFunction(name, self.error)
+
+
+def library_available():
+    """
+    True if libdarknet was loaded, False if only the OpenCV backend can run.
+    """
+    return not isinstance(lib, _MissingLibrary)
+
+
+try:
+    lib = CDLL(libpath, RTLD_GLOBAL)
+except OSError as e:
+    lib = _MissingLibrary(e)
 
 # Argument types and return types for Darknet functions
 lib.network_width.argtypes = [c_void_p]
@@ -398,6 +569,11 @@ load_net_custom = lib.load_network_custom
 load_net_custom.argtypes = [c_char_p, c_char_p, c_int, c_int]
 load_net_custom.restype = c_void_p
 
+# Define and comment function to change a network's input size in place
+resize_network = lib.resize_network
+resize_network.argtypes = [c_void_p, c_int, c_int]
+resize_network.restype = c_int
+
 # Define and comment function to free a network pointer
 free_network_ptr = lib.free_network_ptr
 free_network_ptr.argtypes = [c_void_p]
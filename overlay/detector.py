@@ -0,0 +1,354 @@
+"""
+Darknet detector that keeps its frame buffers for its whole life.
+
+The per-frame path in overlay.py and combined.py used to allocate a Darknet
+IMAGE, a converted copy, a resized copy and a bytes copy for every frame and
+then free the IMAGE again. DarknetDetector allocates one IMAGE (big enough
+for a full batch) and one resize buffer per batch slot up front: frames are
+resized straight into those buffers with cv2.resize(dst=...) and converted to
+Darknet's planar float layout by writing through a NumPy view of the IMAGE's
+data pointer, so detecting a frame allocates nothing frame-sized.
+
+With a region of interest the detector crops that part of the frame at its
+native resolution and resizes the network to fit it, instead of scaling the
+whole desktop into the network. With tiling the region is cut into
+overlapping tiles that all go through one batched forward pass. Either way
+detections come back in output_size coordinates of the whole frame (the
+1920x1088 space the YAML files and the OCR cropping have always used).
+
+Usage:
+    detector = DarknetDetector(config_file, data_file, weights, roi=(0, 80, 1920, 1000))
+    detections = detector.detect(frame_bgr)    # DETECTION_DTYPE array
+    annotated = detector.canvas[0]             # BGR output-sized frame to draw on, reused
+"""
+import cv2
+import numpy as np
+
+import darknet
+from nms import nms, top_k_per_class
+from roi import RoiLearner, align_up, clip_region, tile_boxes
+
+
+class FrameBuffers:
+    def __init__(self, width, height, slots=1):
+        """
+        Args:
+            width, height: network input size.
+            slots: frames per batch.
+        """
+        self.width = width
+        self.height = height
+        self.slots = slots
+
+        # One IMAGE holding every slot back to back, which is the layout network_predict_batch reads
+        self._storage = darknet.make_image(width, height, 3 * slots)
+        self.image = darknet.IMAGE(width, height, 3, self._storage.data)
+        self.pixels = np.ctypeslib.as_array(self._storage.data, shape=(slots, 3, height, width))
+        self.resized = np.zeros((slots, height, width, 3), dtype=np.uint8)
+
+    def convert(self, slot):
+        # Reversing the channel axis turns BGR into RGB without a converted copy
+        np.multiply(self.resized[slot].transpose(2, 0, 1)[::-1], np.float32(1 / 255), out=self.pixels[slot])
+
+    def prepare(self, frame, slot=0):
+        """
+        Resize a BGR uint8 frame into `slot` and convert it to planar RGB floats in [0, 1].
+        Returns the resized BGR frame, a view that the next prepare() of the slot overwrites.
+        """
+        resized = self.resized[slot]
+        if frame.shape[:2] == (self.height, self.width):
+            resized[...] = frame
+        else:
+            cv2.resize(frame, (self.width, self.height), dst=resized, interpolation=cv2.INTER_LINEAR)
+        self.convert(slot)
+        return resized
+
+    def place(self, crop, slot=0):
+        """
+        Copy a crop no larger than the buffer into the top-left corner of `slot`
+        at native resolution, black out the rest and convert it.
+        """
+        height, width = crop.shape[:2]
+        resized = self.resized[slot]
+        resized[:height, :width] = crop
+        resized[height:] = 0
+        resized[:height, width:] = 0
+        self.convert(slot)
+
+    def close(self):
+        if self._storage is not None:
+            self.pixels = None
+            darknet.free_image(self._storage)
+            self._storage = None
+
+
+def suppress_tile_duplicates(detections, overlap_threshold=0.5):
+    """
+    Drop lower-confidence boxes of the same class that mostly lie inside a
+    kept one. A bubble inside two overlapping tiles turns into the whole box
+    from one tile and possibly a clipped piece of it from the other, so the
+    overlap is measured against the smaller box rather than as IoU.
+    """
+    return nms(detections, overlap_threshold, metric='min')
+
+
+class DarknetDetector:
+    def __init__(self, config_file, data_file, weights, batch_size=1, thresh=.25, hier_thresh=.5, nms=.45,
+                 roi=None, tile=None, tile_overlap=160, frame_size=(1920, 1080), output_size=(1920, 1088),
+                 nms_method="numpy", top_k=None):
+        """
+        Args:
+            batch_size: frames per forward pass.
+            nms_method: "numpy" (nms.py on the decoded candidates) or "darknet" (do_nms_sort).
+            top_k: keep at most this many detections of each class per frame.
+            roi: (x, y, width, height) of the source frame to detect in, 'auto'
+                 to learn it from where detections appear, or None for the whole frame.
+            tile: (width, height) tiles to cut the region into at native
+                  resolution, or None to detect on the region in one piece.
+                  Needs a fixed roi (or the whole frame).
+            tile_overlap: minimum overlap between neighbouring tiles in pixels.
+            frame_size: (width, height) of the captured frames, used to lay out tiles.
+            output_size: (width, height) space detections are reported in.
+        """
+        if tile is not None and roi == 'auto':
+            raise ValueError("Tiling needs a fixed region of interest")
+        self.learner = RoiLearner() if roi == 'auto' else None
+        self.roi = None if roi == 'auto' else roi
+        self.output_size = output_size
+
+        self.tiles = None
+        if tile is not None:
+            region = clip_region(self.roi, frame_size) if self.roi is not None else (0, 0) + tuple(frame_size)
+            self.tiles = tile_boxes(region, tile, tile_overlap)
+        self.tiles_per_frame = len(self.tiles) if self.tiles else 1
+
+        # Every tile of every frame in a batch gets its own slot of the network's batch
+        self.network, self.class_names, self.class_colors, self.full_size = self._load_network(
+            config_file, data_file, weights, batch_size * self.tiles_per_frame
+        )
+        self.batch_size = batch_size
+        self.thresh = thresh
+        self.hier_thresh = hier_thresh
+        self.nms = nms
+        self.nms_method = nms_method
+        self.top_k = top_k
+        self.width, self.height = self.full_size
+        self.buffers = self._make_buffers(self.width, self.height, batch_size * self.tiles_per_frame)
+        if self.tiles:
+            self.set_input_size(max(w for _, _, w, _ in self.tiles), max(h for _, _, _, h in self.tiles))
+
+        # (scale x, offset x, scale y, offset y) from network pixels to output space, per slot
+        self._placements = np.zeros((self.buffers.slots, 4), dtype=np.float32)
+        self._canvas = None
+        self._region = None
+        self._frame_sizes = [None] * batch_size
+
+    # What a backend has to provide; the rest of the detector only moves pixels and boxes around
+
+    def _load_network(self, config_file, data_file, weights, slots):
+        """
+        Load the network for `slots` images per forward pass.
+        Returns (network, class names, class colors, (input width, input height)).
+        """
+        network, class_names, class_colors = darknet.load_network(config_file, data_file, weights,
+                                                                  batch_size=slots)
+        return network, class_names, class_colors, (darknet.network_width(network), darknet.network_height(network))
+
+    def _make_buffers(self, width, height, slots):
+        return FrameBuffers(width, height, slots)
+
+    def _resize_network(self, width, height):
+        darknet.resize_network(self.network, width, height)
+
+    def _predict(self, slots):
+        """
+        Run the network on the first `slots` buffer slots. Returns one
+        DETECTION_DTYPE array per slot in network input pixels, after NMS.
+        """
+        if self.buffers.slots == 1:
+            return [darknet.detect_image_array(self.network, self.class_names, self.buffers.image,
+                                               self.thresh, self.hier_thresh, self.nms, self.nms_method)]
+        return darknet.detect_batch_arrays(self.network, self.class_names, self.buffers.image, slots,
+                                           self.buffers.slots, self.thresh, self.hier_thresh, self.nms,
+                                           self.nms_method)
+
+    def _free_network(self):
+        darknet.free_network_ptr(self.network)
+
+    def set_input_size(self, width, height):
+        """
+        Resize the network's input and reallocate the frame buffers to match.
+        """
+        width, height = align_up(width), align_up(height)
+        if (width, height) == (self.width, self.height):
+            return
+        self._resize_network(width, height)
+        self.buffers.close()
+        self.buffers = self._make_buffers(width, height, self.buffers.slots)
+        self.width, self.height = width, height
+
+    @property
+    def resized(self):
+        """
+        Network-input BGR frames from the last prepare, one per batch slot.
+        """
+        return self.buffers.resized
+
+    @property
+    def canvas(self):
+        """
+        Output-sized BGR frames from the last prepare, one per batch slot, to draw detections on.
+        """
+        if self._canvas is None:
+            return self.buffers.resized
+        return self._canvas
+
+    def _frame_region(self, frame_size, slot):
+        if slot == 0:
+            # All frames of a batch share the network size, so the region is picked once per batch
+            region = self.learner.region(frame_size) if self.learner is not None else self.roi
+            self._region = clip_region(region, frame_size) if region is not None else None
+            if self._region is not None and not self.tiles:
+                self.set_input_size(self._region[2], self._region[3])
+            elif self._region is None and not self.tiles:
+                self.set_input_size(*self.full_size)
+        return self._region
+
+    def _canvas_slot(self, frame, slot):
+        out_width, out_height = self.output_size
+        if self._canvas is None:
+            self._canvas = np.empty((self.batch_size, out_height, out_width, 3), dtype=np.uint8)
+        cv2.resize(frame, self.output_size, dst=self._canvas[slot], interpolation=cv2.INTER_LINEAR)
+
+    def prepare(self, frame, slot=0):
+        """
+        Load a BGR uint8 frame of any size into batch slot `slot`.
+        """
+        frame_height, frame_width = frame.shape[:2]
+        out_width, out_height = self.output_size
+        scale_x, scale_y = out_width / frame_width, out_height / frame_height
+        region = self._frame_region((frame_width, frame_height), slot)
+        self._frame_sizes[slot] = (frame_width, frame_height)
+
+        if region is None and not self.tiles:
+            # Whole frame scaled into the network, as before regions existed
+            self.buffers.prepare(frame, slot)
+            self._placements[slot] = (out_width / self.width, 0, out_height / self.height, 0)
+            if self._canvas is not None or (self.width, self.height) != self.output_size:
+                self._canvas_slot(frame, slot)
+            return
+
+        boxes = self.tiles or [region]
+        for i, (x, y, width, height) in enumerate(boxes):
+            buffer_slot = slot * self.tiles_per_frame + i
+            self.buffers.place(frame[y:y + height, x:x + width], buffer_slot)
+            self._placements[buffer_slot] = (scale_x, x * scale_x, scale_y, y * scale_y)
+        self._canvas_slot(frame, slot)
+
+    def _to_output(self, detections, buffer_slot):
+        scale_x, offset_x, scale_y, offset_y = self._placements[buffer_slot]
+        detections["x"] = detections["x"] * scale_x + offset_x
+        detections["w"] *= scale_x
+        detections["y"] = detections["y"] * scale_y + offset_y
+        detections["h"] *= scale_y
+        return detections
+
+    def detect_prepared(self, count=1):
+        """
+        Detect on the first `count` prepared slots. Returns one DETECTION_DTYPE
+        array per slot, in output_size coordinates.
+        """
+        arrays = self._predict(count * self.tiles_per_frame)
+        arrays = [self._to_output(array, buffer_slot) for buffer_slot, array in enumerate(arrays)]
+
+        results = []
+        for slot in range(count):
+            tiles = arrays[slot * self.tiles_per_frame:(slot + 1) * self.tiles_per_frame]
+            detections = tiles[0] if len(tiles) == 1 else suppress_tile_duplicates(np.concatenate(tiles))
+            if self.top_k is not None:
+                detections = top_k_per_class(detections, self.top_k)
+            results.append(detections)
+            if self.learner is not None:
+                # The learner works in source pixels
+                scale_x = self._frame_sizes[slot][0] / self.output_size[0]
+                scale_y = self._frame_sizes[slot][1] / self.output_size[1]
+                self.learner.observe(detections["x"] * scale_x, detections["y"] * scale_y,
+                                     detections["w"] * scale_x, detections["h"] * scale_y)
+        return results
+
+    def detect_region(self, frame, box):
+        """
+        Detect on one (x, y, width, height) box of a BGR frame at native
+        resolution. The box has to fit the network input. Detections are in
+        output_size coordinates of the whole frame.
+        """
+        if self.tiles or self.batch_size != 1:
+            raise ValueError("detect_region needs a detector without tiles and a batch size of 1")
+        x, y, width, height = box
+        if width > self.width or height > self.height:
+            raise ValueError(f"A {width}x{height} box does not fit the {self.width}x{self.height} network input")
+        frame_height, frame_width = frame.shape[:2]
+        scale_x, scale_y = self.output_size[0] / frame_width, self.output_size[1] / frame_height
+        self.buffers.place(frame[y:y + height, x:x + width], 0)
+        self._placements[0] = (scale_x, x * scale_x, scale_y, y * scale_y)
+        self._frame_sizes[0] = (frame_width, frame_height)
+        return self.detect_prepared(1)[0]
+
+    def detect(self, frame):
+        """
+        Detect on a single BGR frame of any size.
+        """
+        self.prepare(frame)
+        return self.detect_prepared(1)[0]
+
+    def detect_many(self, frames):
+        """
+        Detect on up to batch_size BGR frames in one forward pass.
+        """
+        if len(frames) > self.batch_size:
+            raise ValueError(f"{len(frames)} frames do not fit in a batch of {self.batch_size}")
+        for slot, frame in enumerate(frames):
+            self.prepare(frame, slot)
+        return self.detect_prepared(len(frames))
+
+    def to_detections(self, array):
+        """
+        (label, confidence, bbox) tuples for draw_boxes and the YAML files.
+        """
+        return darknet.array_to_detections(array, self.class_names)
+
+    def close(self):
+        self.buffers.close()
+        if self.network is not None:
+            self._free_network()
+            self.network = None
+
+
+# Detector backends, by the name --detector takes
+BACKENDS = ('darknet', 'opencv', 'daemon')
+
+
+def make_detector(config_file, data_file, weights, backend='darknet', threads=None, socket_path=None, **options):
+    """
+    A DarknetDetector (libdarknet) or an OpenCVDetector (cv2.dnn, no Darknet
+    build needed) for the same cfg and weights. Both take the same options and
+    return the same DETECTION_DTYPE arrays. 'daemon' connects to a running
+    detectord instead, which has its own network, thresholds and tiles; only
+    batch_size and output_size apply then.
+
+    Args:
+        backend: 'darknet', 'opencv' or 'daemon'.
+        threads: CPU threads for the OpenCV backend (None leaves OpenCV's default).
+        socket_path: detectord's socket for the daemon backend (None for its default).
+        options: DarknetDetector keyword arguments (batch_size, thresh, roi, tile, ...).
+    """
+    if backend == 'daemon':
+        from detectord import DEFAULT_SOCKET, RemoteDetector
+        return RemoteDetector(socket_path or DEFAULT_SOCKET, batch_size=options.get('batch_size', 1),
+                              output_size=options.get('output_size', (1920, 1088)))
+    if backend == 'darknet':
+        return DarknetDetector(config_file, data_file, weights, **options)
+    if backend == 'opencv':
+        from cvdetector import OpenCVDetector
+        return OpenCVDetector(config_file, data_file, weights, threads=threads, **options)
+    raise ValueError(f"Unknown detector backend {backend!r}, expected one of {', '.join(BACKENDS)}")
@@ -0,0 +1,249 @@
+"""
+Several Darknet networks in worker processes, fed through shared memory.
+
+One network in one thread cannot keep up with capture on the CPU-only hosts,
+so DetectorPool forks `workers` processes that each load their own network
+with darknet.load_network. Frames are copied into slots of one shared-memory
+block and only the slot number travels over the task queue; the small
+DETECTION_DTYPE arrays come back over a result queue and are handed out in
+the order the frames were submitted.
+
+There are `workers * depth` slots. submit() blocks (or raises queue.Full
+after `timeout`) while all of them are taken, so a producer that outruns the
+workers is slowed down instead of piling up frames in memory.
+
+A frame the detector fails on comes back from get() as a DetectionError
+carrying its tag, and the pool keeps going. A worker that dies (a crash in
+libdarknet, the OOM killer) makes the next wait raise RuntimeError instead
+of blocking forever.
+
+Usage:
+    with DetectorPool(config_file, data_file, weights, workers=4) as pool:
+        for frame in frames:
+            pool.submit(frame, tag=path)
+            while pool.ready():
+                path, detections, detect_ms = pool.get()
+        while pool.pending():
+            path, detections, detect_ms = pool.get()
+"""
+import ctypes.util
+import multiprocessing
+import queue
+import time
+from collections import deque
+from ctypes import CDLL
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class DetectionError(RuntimeError):
+    """
+    The detector failed on one frame; `tag` is what the frame was submitted with.
+    """
+
+    def __init__(self, message, tag=None):
+        super().__init__(message)
+        self.tag = tag
+
+
+def limit_threads(threads):
+    """
+    Cap the OpenMP threads of a Darknet build with OpenMP, so N workers do not
+    each start one thread per core. Does nothing for builds without it.
+    """
+    path = ctypes.util.find_library('gomp')
+    if path is None:
+        return
+    try:
+        CDLL(path).omp_set_num_threads(threads)
+    except (OSError, AttributeError):
+        pass
+
+
+def _worker(index, shm, slot_bytes, tasks, results, config_file, data_file, weights, detector_options, threads):
+    from detector import make_detector
+
+    if threads:
+        limit_threads(threads)
+    try:
+        detector = make_detector(config_file, data_file, weights, threads=threads, **detector_options)
+    except Exception as e:
+        results.put(('ready', index, None, repr(e)))
+        return
+    results.put(('ready', index, (detector.class_names, detector.class_colors), None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        job, slot, shape = task
+        frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+        start = time.perf_counter()
+        try:
+            detections = detector.detect(frame)
+        except Exception as e:
+            results.put(('result', job, None, 0.0, repr(e)))
+        else:
+            results.put(('result', job, detections, (time.perf_counter() - start) * 1000, None))
+        del frame
+    detector.close()
+
+
+class DetectorPool:
+    def __init__(self, config_file, data_file, weights, workers=2, depth=2, frame_shape=(1080, 1920, 3),
+                 threads_per_worker=None, detector_options=None, poll_interval=1.0, log=print):
+        """
+        Args:
+            workers: number of worker processes, each with its own network.
+            depth: frames queued per worker; workers * depth frames can be in flight.
+            frame_shape: largest frame that will be submitted (height, width, channels).
+            threads_per_worker: OpenMP (or OpenCV) threads per worker (None leaves the backend's default).
+            detector_options: keyword arguments for each worker's detector.make_detector
+                              (backend, thresh, roi, tile, ...).
+            poll_interval: seconds between checks that the workers are still alive while waiting.
+        """
+        self.log = log
+        self.poll_interval = poll_interval
+        self.slot_bytes = int(np.prod(frame_shape))
+        slots = workers * depth
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * self.slot_bytes)
+        self._free_slots = deque(range(slots))
+
+        # Fork so the workers inherit the shared-memory mapping instead of attaching by name
+        context = multiprocessing.get_context('fork')
+        self.tasks = context.Queue()
+        self.results = context.Queue()
+        self.processes = [
+            context.Process(target=_worker, daemon=True,
+                            args=(i, self.shm, self.slot_bytes, self.tasks, self.results,
+                                  config_file, data_file, weights, detector_options or {}, threads_per_worker))
+            for i in range(workers)
+        ]
+        for process in self.processes:
+            process.start()
+
+        self._next_job = 0
+        self._next_result = 0
+        self._slots = {}
+        self._tags = {}
+        self._done = {}
+
+        # Every worker loaded the same files, so any of them can tell the class names
+        self.class_names = self.class_colors = None
+        try:
+            for _ in range(workers):
+                _, index, classes, error = self._receive()
+                if error is not None:
+                    raise RuntimeError(f"Detector worker {index} failed to load the network: {error}")
+                self.class_names, self.class_colors = classes
+        except RuntimeError:
+            self.close()
+            raise
+        self.log(f"{workers} detector workers ready, {slots} frame slots")
+
+    def _check_workers(self):
+        for index, process in enumerate(self.processes):
+            if process.exitcode is not None:
+                raise RuntimeError(f"Detector worker {index} exited with code {process.exitcode}")
+
+    def _receive(self, timeout=None):
+        # Wait in short steps, so a worker that died is noticed instead of waited on forever
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            step = self.poll_interval
+            if deadline is not None:
+                step = max(min(step, deadline - time.monotonic()), 0)
+            try:
+                return self.results.get(timeout=step)
+            except queue.Empty:
+                self._check_workers()
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+
+    def _collect(self, timeout=None):
+        message = self._receive(timeout)
+        if message is None:
+            return False
+        _, job, detections, detect_ms, error = message
+        self._free_slots.append(self._slots.pop(job))
+        self._done[job] = (detections, detect_ms, error)
+        return True
+
+    def submit(self, frame, tag=None, timeout=None):
+        """
+        Queue a BGR uint8 frame for detection and return its job number.
+        Waits for a free slot; raises queue.Full if none frees up within `timeout`.
+        """
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame of shape {frame.shape} does not fit in a {self.slot_bytes} byte slot")
+        while not self._free_slots:
+            if not self._collect(timeout):
+                raise queue.Full(f"All {len(self._slots)} frame slots are busy")
+
+        slot = self._free_slots.popleft()
+        view = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        view[...] = frame
+        del view
+
+        job = self._next_job
+        self._next_job += 1
+        self._slots[job] = slot
+        self._tags[job] = tag
+        self.tasks.put((job, slot, frame.shape))
+        return job
+
+    def pending(self):
+        """
+        Frames submitted whose results have not been taken with get() yet.
+        """
+        return self._next_job - self._next_result
+
+    def ready(self):
+        """
+        True if get() can return the next result in order without waiting.
+        """
+        while self._collect(timeout=0):
+            pass
+        return self._next_result in self._done
+
+    def get(self, timeout=None):
+        """
+        Return (tag, detections, detect_ms) for the oldest submitted frame, in
+        submission order. Detections are a DETECTION_DTYPE array in network
+        coordinates; detect_ms is the time the worker spent on the frame.
+        Raises DetectionError (with the frame's tag) if detection failed on
+        it; the next get() carries on with the frame after it.
+        """
+        if not self.pending():
+            raise ValueError("No frames are pending")
+        while self._next_result not in self._done:
+            if not self._collect(timeout):
+                raise queue.Empty(f"No detection result within {timeout} s")
+        job = self._next_result
+        self._next_result += 1
+        detections, detect_ms, error = self._done.pop(job)
+        tag = self._tags.pop(job)
+        if error is not None:
+            raise DetectionError(f"Detection failed for {tag if tag is not None else f'frame {job}'}: {error}", tag)
+        return tag, detections, detect_ms
+
+    def close(self):
+        for process in self.processes:
+            if process.is_alive():
+                self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,530 @@
+"""
+Resident detector process with a local socket API.
+
+Every run of overlay.py or combined.py parses the cfg and loads the weights
+before it handles its first frame. detectord loads the network once, warms it
+up and then serves detections over a Unix domain socket to any process on the
+machine, so short-lived tools and the live loop share one model.
+
+Frames travel either as raw bytes after the request, or in a shared-memory
+block the client owns, in which case only the block's name goes over the
+socket. Requests from all clients go into one queue. A single worker takes up
+to --batch_size of them at a time and runs them through the network in one
+forward pass. Every --report_interval seconds the daemon prints request
+latency, queue depth and throughput.
+
+Messages in both directions are a 4-byte little-endian length, a JSON header
+of that length, and the payload the header announces:
+
+    {"op": "detect", "shapes": [[h, w, 3], ...]}                     + the frames' bytes
+    {"op": "detect", "shapes": [[h, w, 3], ...], "shm": name, "offsets": [0, ...]}
+    -> {"ok": true, "counts": [n, ...], "queued_ms": [...], "detect_ms": [...]} + DETECTION_DTYPE rows
+    {"op": "info"}  -> class names and colors, backend and batch size
+    {"op": "stats"} -> the numbers the report prints
+    errors          -> {"ok": false, "error": "..."}
+
+Start it once, then point the other tools at it with --detector daemon:
+    python overlay/detectord.py --detector darknet --tile 640x640 --batch_size 4
+    python overlay/overlay.py --detector daemon
+    python overlay/detectord.py --stats
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+import darknet
+
+DEFAULT_SOCKET = '/tmp/pwn-detector.sock'
+LENGTH = struct.Struct('<I')
+
+
+def ts_print(message):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+def receive_exactly(sock, size, buffer=None):
+    """
+    Read exactly `size` bytes, into `buffer` (a writable buffer of that size) if given.
+    Returns None if the peer closed the connection first.
+    """
+    buffer = bytearray(size) if buffer is None else buffer
+    view = memoryview(buffer).cast('B')
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if not count:
+            return None
+        received += count
+    return buffer
+
+
+def send_message(sock, header, *payloads):
+    data = json.dumps(header).encode('utf-8')
+    sock.sendall(LENGTH.pack(len(data)) + data)
+    for payload in payloads:
+        sock.sendall(payload)
+
+
+def receive_header(sock):
+    """
+    The next message's JSON header, or None once the peer has closed the connection.
+    """
+    prefix = receive_exactly(sock, LENGTH.size)
+    if prefix is None:
+        return None
+    (length,) = LENGTH.unpack(prefix)
+    data = receive_exactly(sock, length)
+    if data is None:
+        return None
+    return json.loads(data)
+
+
+def frame_shapes(header):
+    """
+    The (height, width, 3) shapes a detect request announces. Raises ValueError if they are not that.
+    """
+    shapes = header.get('shapes')
+    if not isinstance(shapes, list) or not shapes:
+        raise ValueError("'shapes' must be a non-empty list")
+    for shape in shapes:
+        if (not isinstance(shape, list) or len(shape) != 3 or shape[2] != 3
+                or not all(type(size) is int and size > 0 for size in shape)):
+            raise ValueError(f"Frame shape {shape!r} is not [height, width, 3]")
+    return [tuple(shape) for shape in shapes]
+
+
+class Request:
+    def __init__(self, frame):
+        self.frame = frame
+        self.received_at = time.perf_counter()
+        self.started_at = None
+        self.detect_ms = 0.0
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class DetectorServer:
+    def __init__(self, detector, socket_path=DEFAULT_SOCKET, backend='darknet', report_interval=30.0, log=ts_print):
+        self.detector = detector
+        self.socket_path = socket_path
+        self.backend = backend
+        self.report_interval = report_interval
+        self.log = log
+
+        self.requests = queue.Queue()
+        self.stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=2000)
+        self.started = time.monotonic()
+        self.frames = 0
+        self.batches = 0
+        self.errors = 0
+        self.clients = 0
+        self._last_report = (self.started, 0)
+        self._listener = None
+
+    def warm_up(self, shape=(1080, 1920, 3)):
+        """
+        Run a full batch of black frames, so the first client does not pay for lazy allocations.
+        """
+        frames = [np.zeros(shape, dtype=np.uint8)] * self.detector.batch_size
+        start = time.perf_counter()
+        self._detect(frames)
+        self.log(f"Detector warmed up in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def _detect(self, frames):
+        for slot, frame in enumerate(frames):
+            self.detector.prepare(frame, slot)
+        return self.detector.detect_prepared(len(frames))
+
+    def _work(self):
+        batch_size = self.detector.batch_size
+        while not self.stopping.is_set():
+            try:
+                batch = [self.requests.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            # Whatever else is already waiting shares the forward pass
+            while len(batch) < batch_size:
+                try:
+                    batch.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+
+            start = time.perf_counter()
+            try:
+                arrays = self._detect([request.frame for request in batch])
+            except Exception as e:
+                arrays = None
+                error = f"{type(e).__name__}: {e}"
+            detect_ms = (time.perf_counter() - start) * 1000
+            for i, request in enumerate(batch):
+                request.started_at = start
+                request.detect_ms = detect_ms / len(batch)
+                if arrays is None:
+                    request.error = error
+                else:
+                    request.result = arrays[i]
+                request.frame = None
+                request.done.set()
+            with self._lock:
+                self.batches += 1
+                self.frames += len(batch)
+                self.errors += len(batch) if arrays is None else 0
+
+    def _frames(self, conn, header, blocks):
+        """
+        The request's frames, or None if the client hung up while sending them.
+        Raises ValueError for a header that does not describe frames.
+        """
+        shapes = frame_shapes(header)
+        if 'shm' in header:
+            offsets = header.get('offsets')
+            if (not isinstance(offsets, list) or len(offsets) != len(shapes)
+                    or not all(type(offset) is int and offset >= 0 for offset in offsets)):
+                raise ValueError("'offsets' must be one byte offset per frame")
+            # A client keeps its block until its frames outgrow it, so it is attached once, not per request
+            name = header['shm']
+            if name not in blocks:
+                from framering import attach_shared_memory
+                for old in blocks.values():
+                    old.close()
+                blocks.clear()
+                try:
+                    blocks[name] = attach_shared_memory(name)
+                except (FileNotFoundError, TypeError, ValueError):
+                    raise ValueError(f"No shared memory block {name!r}")
+            block = blocks[name]
+            for shape, offset in zip(shapes, offsets):
+                if offset + int(np.prod(shape)) > block.size:
+                    raise ValueError(f"A {shape} frame at offset {offset} does not fit in the {block.size} byte block")
+            return [np.ndarray(shape, dtype=np.uint8, buffer=block.buf, offset=offset)
+                    for shape, offset in zip(shapes, offsets)]
+        frames = []
+        for shape in shapes:
+            frame = np.empty(shape, dtype=np.uint8)
+            if receive_exactly(conn, frame.nbytes, frame) is None:
+                return None
+            frames.append(frame)
+        return frames
+
+    def _serve_detect(self, conn, header, blocks):
+        try:
+            frames = self._frames(conn, header, blocks)
+        except ValueError as e:
+            send_message(conn, {'ok': False, 'error': str(e)})
+            # Frames sent over the socket cannot be skipped without knowing their size
+            return 'shm' in header
+        if frames is None:
+            return False
+        requests = [Request(frame) for frame in frames]
+        for request in requests:
+            self.requests.put(request)
+        for request in requests:
+            request.done.wait()
+        # Shared-memory frames belong to the client again from here on
+        del frames
+
+        errors = [request.error for request in requests if request.error is not None]
+        if errors:
+            send_message(conn, {'ok': False, 'error': errors[0]})
+            return True
+        now = time.perf_counter()
+        with self._lock:
+            self._latencies.extend((now - request.received_at) * 1000 for request in requests)
+        send_message(conn, {'ok': True,
+                            'counts': [len(request.result) for request in requests],
+                            'queued_ms': [(request.started_at - request.received_at) * 1000 for request in requests],
+                            'detect_ms': [request.detect_ms for request in requests]},
+                     *(request.result.tobytes() for request in requests))
+        return True
+
+    def info(self):
+        return {'ok': True, 'backend': self.backend, 'class_names': self.detector.class_names,
+                'class_colors': {name: list(color) for name, color in self.detector.class_colors.items()},
+                'batch_size': self.detector.batch_size, 'pid': os.getpid()}
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            frames, batches, errors, clients = self.frames, self.batches, self.errors, self.clients
+        p50, p95 = np.percentile(latencies, [50, 95]).tolist() if latencies else (None, None)
+        uptime = time.monotonic() - self.started
+        return {'ok': True, 'uptime': uptime, 'frames': frames, 'batches': batches, 'errors': errors,
+                'clients': clients, 'queue_depth': self.requests.qsize(), 'latency_p50_ms': p50,
+                'latency_p95_ms': p95, 'frames_per_second': frames / uptime if uptime else 0.0}
+
+    def _connection(self, conn):
+        with self._lock:
+            self.clients += 1
+        blocks = {}
+        try:
+            while not self.stopping.is_set():
+                header = receive_header(conn)
+                if header is None:
+                    break
+                op = header.get('op')
+                if op == 'detect':
+                    if not self._serve_detect(conn, header, blocks):
+                        break
+                elif op == 'info':
+                    send_message(conn, self.info())
+                elif op == 'stats':
+                    send_message(conn, self.stats())
+                else:
+                    send_message(conn, {'ok': False, 'error': f"Unknown op {op!r}"})
+        except (OSError, ValueError, KeyError) as e:
+            self.log(f"Client dropped: {type(e).__name__}: {e}")
+        finally:
+            with self._lock:
+                self.clients -= 1
+            for block in blocks.values():
+                block.close()
+            conn.close()
+
+    def report(self):
+        now = time.monotonic()
+        stats = self.stats()
+        last_time, last_frames = self._last_report
+        self._last_report = (now, stats['frames'])
+        rate = (stats['frames'] - last_frames) / (now - last_time) if now > last_time else 0.0
+        latency = (f"p50 {stats['latency_p50_ms']:.1f} ms, p95 {stats['latency_p95_ms']:.1f} ms"
+                   if stats['latency_p50_ms'] is not None else "no requests yet")
+        batch = stats['frames'] / stats['batches'] if stats['batches'] else 0.0
+        self.log(f"Served {stats['frames']} frames ({rate:.1f}/s, {batch:.1f} per batch), {stats['errors']} errors; "
+                 f"latency {latency}; queue {stats['queue_depth']}; {stats['clients']} clients")
+
+    def _report_loop(self):
+        while not self.stopping.wait(self.report_interval):
+            self.report()
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            # A socket file left by a daemon that died; a live one would still accept connections
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                raise RuntimeError(f"A detector daemon is already listening on {self.socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.socket_path)
+            finally:
+                probe.close()
+
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.socket_path)
+        self._listener.listen(16)
+        threading.Thread(target=self._work, name='detect', daemon=True).start()
+        if self.report_interval:
+            threading.Thread(target=self._report_loop, name='report', daemon=True).start()
+        self.log(f"Serving {self.backend} detections on {self.socket_path}")
+
+        while not self.stopping.is_set():
+            conn, _ = self._listener.accept()
+            threading.Thread(target=self._connection, args=(conn,), name='client', daemon=True).start()
+
+    def close(self):
+        self.stopping.set()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        self.detector.close()
+
+
+class RemoteDetector:
+    def __init__(self, socket_path=DEFAULT_SOCKET, batch_size=1, output_size=(1920, 1088), shared=True):
+        """
+        Detector-shaped client of a running detectord: prepare/detect_prepared/canvas
+        like DarknetDetector, with thresholds, regions and tiles set on the daemon.
+
+        Args:
+            batch_size: frames sent per request; the daemon batches them with other clients' frames.
+            shared: pass frames through a shared-memory block instead of over the socket.
+        """
+        self.socket_path = socket_path
+        self.batch_size = batch_size
+        self.output_size = output_size
+        self.shared = shared
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            self.sock.close()
+            raise ConnectionError(f"No detector daemon on {socket_path}; start overlay/detectord.py first") from e
+
+        info, _ = self._call({'op': 'info'})
+        self.class_names = info['class_names']
+        self.class_colors = {name: tuple(color) for name, color in info['class_colors'].items()}
+        self.backend = info['backend']
+        self.block = None
+        self._slot_size = 0
+        self._frames = [None] * batch_size
+        self._canvas = np.empty((batch_size, output_size[1], output_size[0], 3), dtype=np.uint8)
+
+    def _call(self, header, *payloads):
+        send_message(self.sock, header, *payloads)
+        reply = receive_header(self.sock)
+        if reply is None:
+            raise ConnectionError(f"Detector daemon on {self.socket_path} closed the connection")
+        if not reply.get('ok'):
+            raise RuntimeError(f"Detector daemon: {reply.get('error')}")
+        payload = None
+        if 'counts' in reply:
+            payload = receive_exactly(self.sock, sum(reply['counts']) * darknet.DETECTION_DTYPE.itemsize)
+            if payload is None:
+                raise ConnectionError(f"Detector daemon on {self.socket_path} closed the connection")
+        return reply, payload
+
+    @property
+    def canvas(self):
+        """
+        Output-sized BGR frames from the last prepare, one per batch slot, to draw detections on.
+        """
+        return self._canvas
+
+    def _slot_view(self, shape, slot):
+        size = int(np.prod(shape))
+        if size > self._slot_size:
+            # Every slot gets room for the largest frame seen; slots already prepared move along
+            block = shared_memory.SharedMemory(create=True, size=size * self.batch_size)
+            if self.block is not None:
+                for prepared in range(slot):
+                    old = self._frames[prepared]
+                    source = np.ndarray(old[0], dtype=np.uint8, buffer=self.block.buf, offset=old[1])
+                    np.ndarray(old[0], dtype=np.uint8, buffer=block.buf, offset=prepared * size)[...] = source
+                    self._frames[prepared] = (old[0], prepared * size)
+                    del source
+                self.block.close()
+                self.block.unlink()
+            self.block = block
+            self._slot_size = size
+        offset = slot * self._slot_size
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.block.buf, offset=offset), offset
+
+    def prepare(self, frame, slot=0):
+        """
+        Load a BGR uint8 frame into batch slot `slot`. The frame is copied, so
+        the caller may reuse its buffer right away.
+        """
+        if self.shared:
+            view, offset = self._slot_view(frame.shape, slot)
+            view[...] = frame
+            self._frames[slot] = (frame.shape, offset)
+        else:
+            self._frames[slot] = (frame.shape, frame.copy())
+        cv2.resize(frame, self.output_size, dst=self._canvas[slot], interpolation=cv2.INTER_LINEAR)
+
+    def detect_prepared(self, count=1):
+        """
+        Detect on the first `count` prepared slots. Returns one DETECTION_DTYPE array per slot.
+        """
+        frames = self._frames[:count]
+        header = {'op': 'detect', 'shapes': [list(shape) for shape, _ in frames]}
+        if self.shared:
+            header['shm'] = self.block.name
+            header['offsets'] = [offset for _, offset in frames]
+            reply, payload = self._call(header)
+        else:
+            reply, payload = self._call(header, *(memoryview(frame).cast('B') for _, frame in frames))
+        rows = np.frombuffer(payload, dtype=darknet.DETECTION_DTYPE)
+        bounds = np.cumsum([0] + reply['counts'])
+        return [rows[start:stop].copy() for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    def detect(self, frame):
+        """
+        Detect on a single BGR frame of any size.
+        """
+        self.prepare(frame)
+        return self.detect_prepared(1)[0]
+
+    def detect_many(self, frames):
+        if len(frames) > self.batch_size:
+            raise ValueError(f"{len(frames)} frames do not fit in a batch of {self.batch_size}")
+        for slot, frame in enumerate(frames):
+            self.prepare(frame, slot)
+        return self.detect_prepared(len(frames))
+
+    def to_detections(self, array):
+        """
+        (label, confidence, bbox) tuples for draw_boxes.
+        """
+        return darknet.array_to_detections(array, self.class_names)
+
+    def stats(self):
+        return self._call({'op': 'stats'})[0]
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+
+def parser():
+    from detector import BACKENDS
+
+    parser = argparse.ArgumentParser(description="Keep a detector loaded and serve detections over a Unix socket")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket path to listen on")
+    parser.add_argument("--stats", action='store_true', help="print a running daemon's statistics and exit")
+    parser.add_argument("--detector", choices=[backend for backend in BACKENDS if backend != 'daemon'],
+                        default='darknet', help="network backend the daemon runs")
+    parser.add_argument("--detector_threads", type=int, default=None, help="CPU threads for the opencv detector")
+    parser.add_argument("--weights", default="screenshots/screenshots_best.weights", help="yolo weights path")
+    parser.add_argument("--config_file", default="screenshots/screenshots.cfg", help="path to config file")
+    parser.add_argument("--data_file", default="screenshots/screenshots.data", help="path to data file")
+    parser.add_argument("--thresh", type=float, default=.25, help="remove detections with lower confidence")
+    parser.add_argument("--batch_size", type=int, default=1, help="queued frames run through the network together")
+    parser.add_argument("--roi", type=str, default=None,
+                        help="x,y,width,height of the frame to detect in, or 'auto' to learn it from detections")
+    parser.add_argument("--tile", type=str, default=None,
+                        help="WIDTHxHEIGHT tiles to split the region into at native resolution")
+    parser.add_argument("--tile_overlap", type=int, default=160, help="minimum overlap between tiles in pixels")
+    parser.add_argument("--report_interval", type=float, default=30.0, help="seconds between status reports")
+    return parser.parse_args()
+
+
+def main():
+    args = parser()
+    if args.stats:
+        client = RemoteDetector(args.socket)
+        print(json.dumps(client.stats(), indent=2))
+        client.close()
+        return
+
+    from detector import make_detector
+    from roi import parse_region, parse_size
+
+    start = time.perf_counter()
+    detector = make_detector(args.config_file, args.data_file, args.weights, backend=args.detector,
+                             threads=args.detector_threads, batch_size=args.batch_size, thresh=args.thresh,
+                             roi=parse_region(args.roi), tile=parse_size(args.tile), tile_overlap=args.tile_overlap)
+    ts_print(f"Loaded {args.weights} with {args.detector} in {time.perf_counter() - start:.1f} s")
+    server = DetectorServer(detector, args.socket, backend=args.detector, report_interval=args.report_interval)
+    try:
+        server.warm_up()
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.report()
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
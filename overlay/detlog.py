@@ -0,0 +1,213 @@
+"""
+Append-only binary log of detections.
+
+overlay.py and combined.py used to yaml.dump a small file per frame, which
+takes milliseconds each and leaves a directory with one inode per frame.
+DetectionLog appends fixed-width records (frame_id, timestamp, class_id,
+conf, x, y, w, h) to one file instead: a frame costs one write() of 40 bytes
+per detection, and the whole log can be opened as a NumPy memmap for analysis
+without parsing anything.
+
+Frames without detections still get one record with class_id -1, so the log
+knows about every frame that was processed. The file starts with a small
+header that holds the class names.
+
+The per-frame YAML files can be recreated with:
+    python overlay/detlog.py overlay/output/detections.detlog overlay/output --layout overlay
+    python overlay/detlog.py output/detections.detlog output --layout combined     (from overlay/)
+"""
+import argparse
+import json
+import os
+import struct
+from datetime import datetime
+
+import numpy as np
+
+MAGIC = b'PWNDET01'
+# Magic, header size and record size, followed by the class names as JSON
+HEADER_PREFIX = struct.Struct('<8sII')
+HEADER_ALIGNMENT = 64
+
+RECORD_DTYPE = np.dtype([("frame_id", np.int64),
+                         ("timestamp", np.float64),
+                         ("class_id", np.int32),
+                         ("conf", np.float32),
+                         ("x", np.float32),
+                         ("y", np.float32),
+                         ("w", np.float32),
+                         ("h", np.float32)])
+
+# Marks a frame that had no detections
+NO_DETECTION = -1
+
+
+def combined_yaml_name(frame_id):
+    # combined.py's frame ids are the capture time's digits, with milliseconds for newer captures
+    if frame_id < 10 ** 14:
+        return f"screengrab-output-{frame_id // 1000000:08d}_{frame_id % 1000000:06d}.yaml"
+    seconds, milliseconds = divmod(frame_id, 1000)
+    return f"screengrab-output-{seconds // 1000000:08d}_{seconds % 1000000:06d}_{milliseconds:03d}.yaml"
+
+
+# YAML file names the two writers used to produce, by frame_id
+LAYOUTS = {
+    'overlay': lambda frame_id: f"screengrab_output_{frame_id}.yaml",
+    'combined': combined_yaml_name,
+}
+
+
+def _read_header(file):
+    prefix = file.read(HEADER_PREFIX.size)
+    if len(prefix) < HEADER_PREFIX.size:
+        raise ValueError(f"{file.name} is not a detection log (too short)")
+    magic, header_size, record_size = HEADER_PREFIX.unpack(prefix)
+    if magic != MAGIC:
+        raise ValueError(f"{file.name} is not a detection log")
+    if record_size != RECORD_DTYPE.itemsize:
+        raise ValueError(f"{file.name} has {record_size}-byte records, expected {RECORD_DTYPE.itemsize}")
+    meta = json.loads(file.read(header_size - HEADER_PREFIX.size).rstrip(b'\0'))
+    return header_size, meta['class_names']
+
+
+def _make_header(class_names):
+    meta = json.dumps({'class_names': list(class_names)}).encode('utf-8')
+    size = HEADER_PREFIX.size + len(meta)
+    size += -size % HEADER_ALIGNMENT
+    return HEADER_PREFIX.pack(MAGIC, size, RECORD_DTYPE.itemsize) + meta.ljust(size - HEADER_PREFIX.size, b'\0')
+
+
+class DetectionLog:
+    def __init__(self, path, class_names, flush=True):
+        """
+        Open a log for appending, creating it if needed.
+
+        Args:
+            class_names: names of the detector's classes; an existing log must have the same ones.
+            flush: flush after every frame, so readers and crashes see whole frames.
+        """
+        self.path = path
+        self.class_names = list(class_names)
+        self.flush = flush
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            with open(path, 'rb') as file:
+                header_size, logged_names = _read_header(file)
+            if logged_names != self.class_names:
+                raise ValueError(f"{path} was written with classes {logged_names}, not {self.class_names}")
+        self.file = open(path, 'ab')
+        if not exists:
+            self.file.write(_make_header(self.class_names))
+            self.file.flush()
+        else:
+            # Drop a record cut short by a crash, so every record stays aligned
+            size = os.path.getsize(path)
+            partial = (size - header_size) % RECORD_DTYPE.itemsize
+            if partial:
+                self.file.truncate(size - partial)
+
+    def append(self, frame_id, timestamp, detections):
+        """
+        Log one frame's detections, a DETECTION_DTYPE array (possibly empty).
+        """
+        records = np.zeros(max(len(detections), 1), dtype=RECORD_DTYPE)
+        records["frame_id"] = frame_id
+        records["timestamp"] = timestamp
+        if len(detections):
+            for field in ("class_id", "conf", "x", "y", "w", "h"):
+                records[field] = detections[field]
+        else:
+            records["class_id"] = NO_DETECTION
+        self.file.write(records.tobytes())
+        if self.flush:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def open_log(path):
+    """
+    Memory-map a log for reading. Returns (records, class_names), where records
+    is a read-only RECORD_DTYPE memmap of every record written so far.
+    """
+    with open(path, 'rb') as file:
+        header_size, class_names = _read_header(file)
+    count = (os.path.getsize(path) - header_size) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE), class_names
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=header_size, shape=(count,))
+    return records, class_names
+
+
+def frame_detections(records, frame_id):
+    """
+    Detections logged for one frame, without the no-detection marker.
+    Scans the whole log; use group_frames() to go through many frames.
+    """
+    frame = records[records["frame_id"] == frame_id]
+    return frame[frame["class_id"] != NO_DETECTION]
+
+
+def group_frames(records):
+    """
+    Yield (frame_id, records of that frame) for every frame, by frame_id.
+    """
+    # Logs are appended in frame order, so sorting is only needed after reruns
+    frame_ids = records["frame_id"]
+    if len(frame_ids) > 1 and np.any(frame_ids[1:] < frame_ids[:-1]):
+        records = records[np.argsort(frame_ids, kind="stable")]
+        frame_ids = records["frame_id"]
+    starts = np.flatnonzero(np.diff(frame_ids, prepend=frame_ids[:1] - 1))
+    bounds = np.append(starts, len(records)).tolist()
+    for i, start in enumerate(bounds[:-1]):
+        yield int(frame_ids[start]), records[start:bounds[i + 1]]
+
+
+def to_yaml_data(frame, class_names):
+    """
+    The dict overlay.py and combined.py used to dump for one frame's records.
+    """
+    detections = [(class_names[class_id], str(round(conf * 100, 2)), [x, y, w, h])
+                  for class_id, conf, x, y, w, h in
+                  frame[["class_id", "conf", "x", "y", "w", "h"]].tolist() if class_id != NO_DETECTION]
+    timestamp = datetime.fromtimestamp(float(frame["timestamp"][0])).strftime('%Y-%m-%d %H:%M:%S')
+    return {'timestamp': timestamp, 'detections': detections}
+
+
+def convert_to_yaml(path, directory, layout='overlay'):
+    """
+    Write the per-frame YAML files a log stands in for. Returns how many were written.
+    """
+    import yaml
+
+    records, class_names = open_log(path)
+    name = LAYOUTS[layout]
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for frame_id, frame in group_frames(records):
+        with open(os.path.join(directory, name(frame_id)), 'w') as file:
+            yaml.dump(to_yaml_data(frame, class_names), file)
+        count += 1
+    return count
+
+
+def parser():
+    parser = argparse.ArgumentParser(description="Convert a detection log to per-frame YAML files")
+    parser.add_argument("log", help="detection log to read")
+    parser.add_argument("directory", help="where to write the YAML files")
+    parser.add_argument("--layout", choices=sorted(LAYOUTS), default='overlay',
+                        help="file naming of the writer that produced the log")
+    return parser.parse_args()
+
+
+def main():
+    args = parser()
+    count = convert_to_yaml(args.log, args.directory, args.layout)
+    print(f"Wrote {count} YAML files to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
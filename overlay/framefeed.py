@@ -0,0 +1,116 @@
+"""
+Notification-based discovery of new capture files.
+
+FrameFeed watches the input directory with inotify (through ctypes, no extra
+package) and hands out the paths of frames as soon as grabber.py finishes
+writing them, so the cost per frame does not depend on how many old captures
+are sitting in the directory. On systems without inotify it falls back to
+rescanning the directory.
+"""
+from ctypes import CDLL, get_errno
+import ctypes.util
+import os
+import select
+import struct
+import time
+from collections import deque
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def _load_inotify():
+    try:
+        libc = CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError, TypeError):
+        return None
+    return libc
+
+
+class FrameFeed:
+    def __init__(self, directory, prefix, suffix='.png', poll_interval=0.5):
+        self.directory = directory
+        self.prefix = prefix
+        self.suffix = suffix
+        self.poll_interval = poll_interval
+        self._pending = deque()
+        self._fd = None
+        self._known = None
+
+        os.makedirs(directory, exist_ok=True)
+        libc = _load_inotify()
+        if libc is not None:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0 and libc.inotify_add_watch(fd, directory.encode(), IN_CLOSE_WRITE | IN_MOVED_TO) >= 0:
+                self._fd = fd
+            elif fd >= 0:
+                os.close(fd)
+        if self._fd is None:
+            print(f"inotify unavailable (errno {get_errno()}); rescanning {directory} instead")
+            self._known = set(self._scan())
+
+    def _matches(self, name):
+        return name.startswith(self.prefix) and name.endswith(self.suffix)
+
+    def _scan(self):
+        with os.scandir(self.directory) as entries:
+            return [entry.name for entry in entries if self._matches(entry.name)]
+
+    def _read_events(self, timeout):
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return
+        data = os.read(self._fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode()
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                print(f"inotify queue overflowed; some frames in {self.directory} were missed")
+            elif self._matches(name):
+                self._pending.append(os.path.join(self.directory, name))
+
+    def _poll(self, timeout):
+        time.sleep(min(timeout, self.poll_interval) if timeout is not None else self.poll_interval)
+        names = set(self._scan())
+        for name in sorted(names - self._known):
+            self._pending.append(os.path.join(self.directory, name))
+        self._known = names
+
+    def wait(self, timeout=None):
+        """
+        Return the list of frames that arrived since the last call, waiting up
+        to `timeout` seconds for at least one. Oldest first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._pending:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if self._fd is not None:
+                self._read_events(remaining)
+            else:
+                self._poll(remaining)
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        frames = list(self._pending)
+        self._pending.clear()
+        return frames
+
+    def latest(self, timeout=None):
+        """
+        Newest frame that arrived since the last call (older ones are dropped), or None.
+        """
+        frames = self.wait(timeout)
+        return frames[-1] if frames else None
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
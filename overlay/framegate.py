@@ -0,0 +1,105 @@
+"""
+Cheap change detection between captured frames.
+
+Pony Town scenes are mostly static while ponies sit, so most frames carry
+nothing new for YOLO or Tesseract. ChangeGate subsamples each frame, splits it
+into tiles and compares every tile's mean absolute difference against the last
+frame that was let through. Frames where no tile moved more than `threshold`
+grey levels are reported as unchanged and can be skipped.
+
+Only NumPy is needed, so grabber.py can use it too.
+"""
+import numpy as np
+
+
+class ChangeGate:
+    def __init__(self, step=4, tile=32, threshold=6.0, report_every=300, log=print):
+        """
+        Args:
+            step: keep every `step`-th pixel in each direction before comparing.
+            tile: tile size in subsampled pixels (tile * step screen pixels).
+            threshold: mean absolute difference (0-255) a tile needs to count as changed.
+            report_every: print the skip ratio every this many frames (0 = never).
+        """
+        self.step = step
+        self.tile = tile
+        self.threshold = threshold
+        self.report_every = report_every
+        self.log = log
+
+        self.reference = None
+        self.changed_tiles = None
+        self.seen = 0
+        self.skipped = 0
+
+    def signature(self, frame):
+        """
+        The subsampled grey image tiles are compared on.
+        """
+        # Green channel carries most of the luminance; subsampling is a strided view
+        small = frame[::self.step, ::self.step, 1] if frame.ndim == 3 else frame[::self.step, ::self.step]
+        return small.astype(np.int16)
+
+    def _grid_shape(self, signature):
+        # Edge tiles may be partial
+        return -(-signature.shape[0] // self.tile), -(-signature.shape[1] // self.tile)
+
+    def tile_differences(self, frame):
+        """
+        Mean absolute difference per tile against the reference frame,
+        as a (tile rows, tile cols) array. None if there is no reference yet.
+        """
+        signature = self.signature(frame)
+        if self.reference is None or self.reference.shape != signature.shape:
+            return None
+        return self.differences(signature, self.reference)
+
+    def differences(self, signature, reference):
+        """
+        Mean absolute difference per tile between two signatures of the same
+        shape, with tiles counted from their top-left corner.
+        """
+        diff = np.abs(signature - reference).astype(np.float32)
+        row_starts = np.arange(0, diff.shape[0], self.tile)
+        col_starts = np.arange(0, diff.shape[1], self.tile)
+        sums = np.add.reduceat(np.add.reduceat(diff, row_starts, axis=0), col_starts, axis=1)
+        heights = np.diff(np.append(row_starts, diff.shape[0]))
+        widths = np.diff(np.append(col_starts, diff.shape[1]))
+        return sums / np.outer(heights, widths)
+
+    def check(self, frame):
+        """
+        Return True if the frame changed enough to be worth processing.
+        Changed frames become the new reference; `changed_tiles` holds the
+        per-tile mask of the last check (all True for the first frame).
+        """
+        self.seen += 1
+        differences = self.tile_differences(frame)
+        if differences is None:
+            changed = True
+            self.changed_tiles = np.ones(self._grid_shape(self.signature(frame)), dtype=bool)
+        else:
+            self.changed_tiles = differences > self.threshold
+            changed = bool(self.changed_tiles.any())
+
+        if changed:
+            self.reference = self.signature(frame)
+        else:
+            self.skipped += 1
+
+        if self.report_every and self.seen % self.report_every == 0:
+            self.log(self.summary())
+        return changed
+
+    def tile_box(self, row, col):
+        """
+        Screen-pixel (x, y, width, height) covered by a tile.
+        """
+        size = self.tile * self.step
+        return col * size, row * size, size, size
+
+    def skip_ratio(self):
+        return self.skipped / self.seen if self.seen else 0.0
+
+    def summary(self):
+        return f"Change gate skipped {self.skipped}/{self.seen} frames ({100 * self.skip_ratio():.1f}%)"
@@ -0,0 +1,225 @@
+"""
+Fixed-size ring of raw frames in shared memory.
+
+grabber.py writes every captured frame into the ring instead of encoding a PNG,
+and readers in other processes (the YOLO overlay, the pipeline) attach to the
+same block by name and get NumPy views straight onto the frame bytes, with no
+copy and no decoding. Frames are stored as height x width x 3 uint8 in BGR
+order, the same layout cv2.imread returns.
+
+A reader's view stays valid until the writer comes round the ring again
+(`slots` frames later); `is_current(seq)` tells whether that has happened.
+
+The grabber replaces the ring when the frame size changes (and a restarted
+grabber replaces the one it left behind). The old block is marked `retired`
+before it is unlinked, so readers know to attach again, with sequence numbers
+starting over:
+
+    ring = FrameRing.wait_attach(name)
+    ...
+    if ring.retired:
+        ring.close()
+        ring, last_seq = FrameRing.wait_attach(name), 0
+"""
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+MAGIC = b'PWNRING1'
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('slots', '<u4'),
+    ('height', '<u4'),
+    ('width', '<u4'),
+    ('channels', '<u4'),
+    ('write_seq', '<u8'),
+    ('retired', '<u4'),
+])
+SLOT_DTYPE = np.dtype([
+    ('seq', '<u8'),
+    ('timestamp', '<f8'),
+])
+HEADER_SIZE = 64
+
+
+def attach_shared_memory(name):
+    """
+    Open an existing shared-memory block without taking ownership of it.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers attached blocks with the resource tracker,
+        # which would unlink the writer's block when this reader exits
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _align(offset, alignment=64):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+class FrameRing:
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+
+        self._header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=shm.buf)[0]
+        if bytes(self._header['magic']) != MAGIC:
+            raise ValueError(f"Shared memory block '{shm.name}' is not a frame ring")
+
+        self.slots = int(self._header['slots'])
+        self.shape = (int(self._header['height']), int(self._header['width']), int(self._header['channels']))
+        self._meta = np.ndarray((self.slots,), dtype=SLOT_DTYPE, buffer=shm.buf, offset=HEADER_SIZE)
+        data_offset = _align(HEADER_SIZE + SLOT_DTYPE.itemsize * self.slots)
+        self._frames = np.ndarray((self.slots,) + self.shape, dtype=np.uint8, buffer=shm.buf, offset=data_offset)
+
+    @staticmethod
+    def size_for(slots, shape):
+        frame_bytes = int(np.prod(shape))
+        return _align(HEADER_SIZE + SLOT_DTYPE.itemsize * slots) + slots * frame_bytes
+
+    @classmethod
+    def create(cls, name, slots=16, shape=(1080, 1920, 3)):
+        """
+        Create (or replace) the ring. Only the capturing process should do this.
+        """
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            pass
+        else:
+            # Readers still attached to the old block move over to the new one
+            header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=stale.buf)
+            if stale.size >= HEADER_SIZE and bytes(header[0]['magic']) == MAGIC:
+                header[0]['retired'] = 1
+            del header
+            stale.close()
+            stale.unlink()
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=cls.size_for(slots, shape))
+        header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=shm.buf)
+        header[0] = (MAGIC, slots, shape[0], shape[1], shape[2], 0, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Attach to a ring created by another process.
+        """
+        return cls(attach_shared_memory(name), owner=False)
+
+    @classmethod
+    def wait_attach(cls, name, timeout=None, poll_interval=0.5):
+        """
+        Attach to a ring, waiting for the grabber to create it if it is not
+        there yet. Returns None if it did not show up within `timeout`.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                return cls.attach(name)
+            except (FileNotFoundError, ValueError):
+                # Not created yet, or created but its header not written yet
+                pass
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_interval)
+
+    @property
+    def retired(self):
+        """
+        True once the writer has replaced this ring with a new one of the same name.
+        """
+        return bool(self._header['retired'])
+
+    def push(self, frame, timestamp=None):
+        """
+        Copy a frame into the next slot and publish it. Returns its sequence number.
+        """
+        seq = int(self._header['write_seq']) + 1
+        slot = seq % self.slots
+        meta = self._meta[slot]
+        # Readers treat seq 0 as "being written"
+        meta['seq'] = 0
+        self._frames[slot][...] = frame
+        meta['timestamp'] = time.time() if timestamp is None else timestamp
+        meta['seq'] = seq
+        self._header['write_seq'] = seq
+        return seq
+
+    def latest_seq(self):
+        return int(self._header['write_seq'])
+
+    def get(self, seq):
+        """
+        Return (timestamp, frame view) for a sequence number, or None if the
+        frame has not been written yet or was already overwritten.
+        """
+        if seq <= 0:
+            return None
+        slot = seq % self.slots
+        meta = self._meta[slot]
+        if int(meta['seq']) != seq:
+            return None
+        return float(meta['timestamp']), self._frames[slot]
+
+    def latest(self):
+        """
+        Return (seq, timestamp, frame view) for the newest frame, or None.
+        """
+        seq = self.latest_seq()
+        entry = self.get(seq)
+        if entry is None:
+            return None
+        return (seq,) + entry
+
+    def wait_newer(self, seq, timeout=None, poll_interval=0.005):
+        """
+        Block until a frame newer than `seq` is published.
+        Returns (seq, timestamp, frame view) or None on timeout or once the ring is retired.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.latest_seq() <= seq:
+            if self.retired or (deadline is not None and time.monotonic() >= deadline):
+                return None
+            time.sleep(poll_interval)
+        return self.latest()
+
+    def is_current(self, seq):
+        """
+        True if the frame with this sequence number has not been overwritten.
+        """
+        return int(self._meta[seq % self.slots]['seq']) == seq
+
+    def save(self, seq, path):
+        """
+        Write one frame to disk as an image. Returns False if it was already overwritten.
+        """
+        from PIL import Image
+
+        entry = self.get(seq)
+        if entry is None:
+            return False
+        _, frame = entry
+        image = Image.fromarray(frame[:, :, ::-1])
+        if not self.is_current(seq):
+            return False
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        image.save(path)
+        return True
+
+    def close(self):
+        if self.owner:
+            self._header['retired'] = 1
+        # Drop our views before closing the mapping
+        self._header = self._meta = self._frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,116 @@
+"""
+Fuzzy matching of OCR text against chat messages.
+
+Edit distance is computed with Myers' bit-parallel algorithm (in Hyyrö's
+formulation for Levenshtein distance): the OCR text becomes a bit mask per
+character once, and every candidate message then costs a handful of integer
+operations per character instead of difflib's quadratic Python loops.
+Python ints are arbitrary precision, so there is no 64-character limit.
+
+Before comparing, both sides are normalised for the mistakes Tesseract makes on
+Pony Town's pixel font: case is dropped, l/1/I/| and O/0 and the like are
+folded together and runs of whitespace become one space.
+
+The score is 1 - distance / length of the longer text. It is stricter than
+SequenceMatcher's ratio (an inserted character costs a whole point rather
+than half), so 0.75 here accepts about what 0.8 used to.
+"""
+
+# Characters Tesseract mixes up on the chat font, folded to one representative (after lowercasing)
+CONFUSIONS = str.maketrans({
+    '1': 'l', 'i': 'l', '|': 'l', '!': 'l',
+    '0': 'o',
+    '5': 's',
+    '8': 'b',
+    '‘': "'", '’': "'", '`': "'",
+    '“': '"', '”': '"',
+})
+
+
+def normalize(text):
+    return ' '.join(text.lower().translate(CONFUSIONS).split())
+
+
+class Pattern:
+    def __init__(self, text):
+        """
+        Bit masks of a (normalised) pattern: bit i of masks[c] is set where text[i] == c.
+        """
+        self.text = text
+        self.length = len(text)
+        self.full = (1 << self.length) - 1
+        self.last = 1 << (self.length - 1) if self.length else 0
+        self.masks = {}
+        for i, char in enumerate(text):
+            self.masks[char] = self.masks.get(char, 0) | (1 << i)
+
+    def distance(self, text, limit=None):
+        """
+        Levenshtein distance between the pattern and `text`. With `limit`, stops
+        early and returns limit + 1 once the distance is certain to exceed it.
+        """
+        if not self.length:
+            distance = len(text)
+            return distance if limit is None or distance <= limit else limit + 1
+        full, last, masks = self.full, self.last, self.masks
+        pv, mv, score = full, 0, self.length
+        remaining = len(text)
+        for char in text:
+            eq = masks.get(char, 0)
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = (mv | ~(xh | pv)) & full
+            mh = pv & xh
+            if ph & last:
+                score += 1
+            elif mh & last:
+                score -= 1
+            ph = ((ph << 1) | 1) & full
+            mh = (mh << 1) & full
+            pv = (mh | ~(xv | ph)) & full
+            mv = ph & xv
+            remaining -= 1
+            # Each remaining character can lower the score by at most one
+            if limit is not None and score - remaining > limit:
+                return limit + 1
+        return score if limit is None or score <= limit else limit + 1
+
+
+def similarity(a, b):
+    """
+    1 - normalised edit distance between two texts, after OCR normalisation.
+    """
+    a, b = normalize(a), normalize(b)
+    longest = max(len(a), len(b))
+    return 1.0 - Pattern(a).distance(b) / longest if longest else 1.0
+
+
+def best_match(ocr_text, candidates, min_score=0.75, key=None):
+    """
+    Score every candidate against ocr_text and return (best candidate, score),
+    or (None, 0.0) if none reaches min_score. Ties go to the earlier candidate.
+
+    Args:
+        candidates: messages, or objects that `key` maps to a message.
+        key: returns the already normalised message of a candidate (for callers
+             that normalise their messages once); None normalises plain strings.
+    """
+    pattern = Pattern(normalize(ocr_text))
+    best, best_score = None, 0.0
+    for candidate in candidates:
+        text = normalize(candidate) if key is None else key(candidate)
+        longest = max(pattern.length, len(text))
+        if not longest:
+            continue
+        # A candidate only matters if it can reach min_score and beat the best so far
+        needed = max(min_score, best_score)
+        limit = int((1.0 - needed) * longest + 1e-9)
+        if abs(pattern.length - len(text)) > limit:
+            continue
+        distance = pattern.distance(text, limit)
+        if distance > limit:
+            continue
+        score = 1.0 - distance / longest
+        if best is None or score > best_score:
+            best, best_score = candidate, score
+    return (best, best_score) if best is not None else (None, 0.0)
@@ -2,6 +2,7 @@ import re
 import time
 import os
 import glob
+import argparse
 import platform
 from datetime import datetime
 from PIL import Image
@@ -25,19 +26,24 @@ def get_next_output_filename(directory, prefix):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    # Get the current timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
+    # Get the current timestamp, to the millisecond so sub-second intervals don't overwrite frames
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+
     # Return the filename with the timestamp
     return os.path.join(directory, f"{prefix}-{timestamp}.png")
 
-def take_screenshot(output_file, window_title=None):
+def capture_frame(window_title=None, region=None):
+    """
+    Grab the screen (Linux) or the given window (Windows) as a PIL image.
+    On Linux `region` (x, y, width, height) limits the grab to part of the screen.
+    Returns None if the capture failed.
+    """
     if platform.system() == "Windows":
         # Windows-specific screenshot using win32gui
         hwnd = win32gui.FindWindow(None, window_title)
         if not hwnd:
             print(f"Window with title '{window_title}' not found.", flush=True)
-            return
+            return None
 
         # Set the process to be DPI aware to handle high DPI displays
         windll.user32.SetProcessDPIAware()
@@ -75,14 +81,17 @@ def take_screenshot(output_file, window_title=None):
 
         if result == 1:
             # PrintWindow Succeeded
-            im.save(output_file)
-            print(f"Screenshot saved to {output_file}", flush=True)
-        else:
-            print("Failed to capture the window.", flush=True)
+            return im
+        print("Failed to capture the window.", flush=True)
+        return None
 
     elif platform.system() == "Linux":
         # Linux-specific screenshot using PyAutoGUI
-        screenshot = pyautogui.screenshot()
+        return pyautogui.screenshot(region=region)
+
+def take_screenshot(output_file, window_title=None, region=None):
+    screenshot = capture_frame(window_title, region)
+    if screenshot is not None:
         screenshot.save(output_file)
         print(f"Screenshot saved to {output_file}", flush=True)
 
@@ -101,12 +110,122 @@ def find_window_with_title_partials(partials):
         print("Linux version does not support partial title window finding.", flush=True)
         return None
 
+def find_capture_title(partial_titles):
+    """
+    The window to capture on Windows, or None on Linux (whole screen).
+    Returns False if the window is missing.
+    """
+    if platform.system() == "Windows":
+        hwnd = find_window_with_title_partials(partial_titles)
+        if not hwnd:
+            return False
+        return win32gui.GetWindowText(hwnd)
+    return None
+
+def make_frame_source(backend, region=None, partial_titles=()):
+    """
+    Return a function that captures one frame as a height x width x 3 BGR
+    NumPy array, or None when there is nothing to capture.
+
+    backend 'xshm' reads the X display through MIT-SHM (Linux only, see xshm.py);
+    'pyautogui' goes through pyautogui / win32 like take_screenshot.
+    """
+    if backend == 'xshm':
+        from xshm import XShmCapture
+        return XShmCapture(os.environ.get('DISPLAY', ':1'), region).grab
+
+    import numpy as np
+
+    def grab():
+        title = find_capture_title(partial_titles)
+        screenshot = None if title is False else capture_frame(title, region)
+        if screenshot is None:
+            return None
+        # PIL gives RGB; everything downstream wants BGR like cv2.imread
+        return np.asarray(screenshot.convert('RGB'))[:, :, ::-1]
+    return grab
+
+def sleep_until_next(started, interval):
+    # Keep a steady capture rate regardless of how long the grab took
+    time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+def run_ring_capture(ring_name, slots, interval, grab):
+    """
+    Capture into a shared-memory ring instead of writing PNGs. Readers save
+    the frames they care about (see framering.FrameRing.save).
+    """
+    from framering import FrameRing
+
+    ring = None
+    captured = 0
+    try:
+        while True:
+            started = time.monotonic()
+            frame = grab()
+            if frame is None:
+                print("Nothing to capture this round.", flush=True)
+            else:
+                if ring is None or ring.shape != frame.shape:
+                    if ring is not None:
+                        ring.close()
+                    ring = FrameRing.create(ring_name, slots=slots, shape=frame.shape)
+                    print(f"Capturing {frame.shape[1]}x{frame.shape[0]} frames into shared memory '{ring_name}' ({slots} slots)", flush=True)
+                ring.push(frame)
+                captured += 1
+                if captured % 600 == 0:
+                    print(f"{captured} frames captured into '{ring_name}'", flush=True)
+            sleep_until_next(started, interval)
+    finally:
+        if ring is not None:
+            ring.close()
+
+def parser():
+    parser = argparse.ArgumentParser(description="Pony Town screen grabber")
+    parser.add_argument("--ring", type=str, default=None,
+                        help="write raw frames into this shared-memory ring instead of PNG files")
+    parser.add_argument("--ring_slots", type=int, default=16, help="number of frames the ring holds")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between captures")
+    parser.add_argument("--backend", choices=['pyautogui', 'xshm'], default='pyautogui',
+                        help="capture through pyautogui/scrot or directly from the X server over MIT-SHM")
+    parser.add_argument("--region", type=str, default=None,
+                        help="x,y,width,height of the screen area to capture (e.g. the game canvas)")
+    parser.add_argument("--skip_unchanged", action='store_true',
+                        help="don't write PNGs for frames that look the same as the last one written")
+    args = parser.parse_args()
+    if args.region and platform.system() == "Windows":
+        parser.error("--region needs a screen capture; on Windows the game window is captured instead")
+    return args
+
 def main():
+    args = parser()
     directory = 'overlay/input_grabs'
     prefix = 'screengrab-input'
     partial_titles = ['Pony Town', 'Mozilla Firefox']
 
+    region = tuple(int(v) for v in args.region.split(',')) if args.region else None
+
+    if args.ring:
+        grab = make_frame_source(args.backend, region, partial_titles)
+        run_ring_capture(args.ring, args.ring_slots, args.interval, grab)
+        return
+
+    if args.backend == 'xshm' or args.skip_unchanged:
+        grab = make_frame_source(args.backend, region, partial_titles)
+        gate = None
+        if args.skip_unchanged:
+            from framegate import ChangeGate
+            gate = ChangeGate(log=lambda message: print(message, flush=True))
+        while True:
+            started = time.monotonic()
+            frame = grab()
+            if frame is not None and (gate is None or gate.check(frame)):
+                output_file = get_next_output_filename(directory, prefix)
+                Image.fromarray(frame[:, :, ::-1]).save(output_file)
+                print(f"Screenshot saved to {output_file}", flush=True)
+            sleep_until_next(started, args.interval)
+
     while True:
+        started = time.monotonic()
         if platform.system() == "Windows":
             # Find the window with the specified partial titles on Windows
             hwnd = find_window_with_title_partials(partial_titles)
@@ -121,10 +240,10 @@ def main():
         elif platform.system() == "Linux":
             # Direct screenshot on Linux
             output_file = get_next_output_filename(directory, prefix)
-            take_screenshot(output_file)
+            take_screenshot(output_file, region=region)
 
         # Sleep for 1 second before taking the next screenshot
-        time.sleep(1)
+        sleep_until_next(started, args.interval)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,166 @@
+"""
+Detection that only re-runs YOLO on the parts of the screen that changed.
+
+When a frame does change, it is usually one bubble appearing or fading while
+the rest of the scene stays as it was. IncrementalDetector cuts the region
+into the same overlapping native-resolution tiles as DarknetDetector's --tile
+mode, but pushes them through a batch-1 network one at a time and keeps every
+tile's detections. For each new frame only the tiles touched by a changed
+ChangeGate cell (grown by `margin` cells) are detected again. The rest reuse
+their cached detections, and the tiles are merged back into full-frame
+coordinates with the same duplicate suppression as tiling.
+
+Every tile is compared against how it looked when it was last detected, not
+against the previous frame, so slow changes still add up to a re-detection.
+Each tile keeps its own reference, so detecting one tile does not reset the
+strip it overlaps with a neighbour that was not detected.
+Every `refresh_every` frames all tiles are detected anyway, so nothing the
+change test missed can stay stale for long.
+
+It has DarknetDetector's prepare/detect_prepared/canvas interface with a batch
+size of 1, so overlay.py and combined.py use it as a drop-in:
+    detector = IncrementalDetector(config_file, data_file, weights, tile=(640, 640))
+    detections = detector.detect(frame_bgr)
+    print(detector.summary())
+"""
+import cv2
+import numpy as np
+
+from detector import make_detector, suppress_tile_duplicates
+from framegate import ChangeGate
+from nms import top_k_per_class
+from roi import clip_region, tile_boxes
+
+
+class IncrementalDetector:
+    def __init__(self, config_file, data_file, weights, tile=(640, 640), tile_overlap=160, roi=None,
+                 change_threshold=3.0, margin=1, refresh_every=30, thresh=.25, hier_thresh=.5, nms=.45,
+                 output_size=(1920, 1088), nms_method="numpy", top_k=None, backend='darknet', threads=None):
+        """
+        Args:
+            tile: (width, height) of the tiles; the network input is sized to fit one.
+            roi: (x, y, width, height) of the frame to tile, or None for the whole frame.
+            change_threshold: mean absolute difference (0-255) a ChangeGate cell needs to count as changed.
+                              Lower than the frame gate's, since a missed tile keeps stale detections.
+            margin: ChangeGate cells added around every changed cell before picking tiles.
+            refresh_every: detect every tile every this many frames (0 = only when they change).
+            backend, threads: which network runs the tiles, see detector.make_detector.
+        """
+        if roi == 'auto':
+            raise ValueError("Incremental detection needs a fixed region of interest")
+        if backend == 'daemon':
+            raise ValueError("Incremental detection runs its own network, it cannot use the detector daemon")
+        self.detector = make_detector(config_file, data_file, weights, backend=backend, threads=threads,
+                                      batch_size=1, thresh=thresh, hier_thresh=hier_thresh, nms=nms,
+                                      output_size=output_size, nms_method=nms_method)
+        self.detector.set_input_size(*tile)
+        self.class_names = self.detector.class_names
+        self.class_colors = self.detector.class_colors
+        self.batch_size = 1
+        self.tile = tile
+        self.tile_overlap = tile_overlap
+        self.roi = roi
+        self.margin = margin
+        self.refresh_every = refresh_every
+        self.output_size = output_size
+        self.top_k = top_k
+        self.gate = ChangeGate(threshold=change_threshold, report_every=0)
+
+        self.tiles = None
+        self.cached = []
+        self.windows = []
+        self.references = []
+        self._frame_size = None
+        self._frame = None
+        self._signature = None
+        self._dirty = []
+        self._canvas = np.empty((1, output_size[1], output_size[0], 3), dtype=np.uint8)
+        self.frames = 0
+        self.tiles_detected = 0
+        self.tiles_seen = 0
+
+    @property
+    def canvas(self):
+        """
+        The last prepared frame at output size, to draw detections on.
+        """
+        return self._canvas
+
+    def _layout(self, frame_size):
+        region = clip_region(self.roi, frame_size) if self.roi is not None else (0, 0) + tuple(frame_size)
+        self.tiles = tile_boxes(region, self.tile, self.tile_overlap)
+        self.cached = [None] * len(self.tiles)
+        # Every tile is compared on the ChangeGate cells it touches, grown by `margin`
+        # cells, as signature slices that start on a cell corner
+        cell, size = self.gate.tile * self.gate.step, self.gate.tile
+        self.windows = [(slice(max(y // cell - self.margin, 0) * size, (-(-(y + height) // cell) + self.margin) * size),
+                         slice(max(x // cell - self.margin, 0) * size, (-(-(x + width) // cell) + self.margin) * size))
+                        for x, y, width, height in self.tiles]
+        # Each tile's window as it was when the tile was last detected
+        self.references = [None] * len(self.tiles)
+        self._frame_size = frame_size
+
+    def _dirty_tiles(self, signature):
+        refresh = self.refresh_every and self.frames % self.refresh_every == 0
+        if refresh:
+            return list(range(len(self.tiles)))
+        return [i for i, (window, reference) in enumerate(zip(self.windows, self.references))
+                if reference is None
+                or np.any(self.gate.differences(signature[window], reference) > self.gate.threshold)]
+
+    def prepare(self, frame, slot=0):
+        """
+        Load a BGR uint8 frame and work out which tiles changed. The frame is
+        copied, so the caller may reuse its buffer right away.
+        """
+        if slot != 0:
+            raise ValueError("Incremental detection takes one frame at a time")
+        frame_size = (frame.shape[1], frame.shape[0])
+        if frame_size != self._frame_size:
+            self._layout(frame_size)
+        self.frames += 1
+        self._signature = self.gate.signature(frame)
+        self._dirty = self._dirty_tiles(self._signature)
+        self._frame = frame.copy()
+        cv2.resize(frame, self.output_size, dst=self._canvas[0], interpolation=cv2.INTER_LINEAR)
+
+    def detect_prepared(self, count=1):
+        """
+        Detect on the changed tiles of the prepared frame. Returns a list with
+        one DETECTION_DTYPE array in output_size coordinates.
+        """
+        frame = self._frame
+        for i in self._dirty:
+            self.cached[i] = self.detector.detect_region(frame, self.tiles[i])
+            # The tile is now up to date, so later frames are compared with this one
+            self.references[i] = self._signature[self.windows[i]].copy()
+        self.tiles_detected += len(self._dirty)
+        self.tiles_seen += len(self.tiles)
+
+        detections = self.cached[0] if len(self.cached) == 1 else suppress_tile_duplicates(np.concatenate(self.cached))
+        if self.top_k is not None:
+            detections = top_k_per_class(detections, self.top_k)
+        return [detections]
+
+    def detect(self, frame):
+        """
+        Detect on a single BGR frame of any size.
+        """
+        self.prepare(frame)
+        return self.detect_prepared(1)[0]
+
+    def to_detections(self, array):
+        """
+        (label, confidence, bbox) tuples for draw_boxes.
+        """
+        return self.detector.to_detections(array)
+
+    def detected_ratio(self):
+        return self.tiles_detected / self.tiles_seen if self.tiles_seen else 0.0
+
+    def summary(self):
+        return (f"Incremental detection ran {self.tiles_detected}/{self.tiles_seen} tiles "
+                f"({100 * self.detected_ratio():.1f}%)")
+
+    def close(self):
+        self.detector.close()
@@ -0,0 +1,93 @@
+"""
+Durable record of which captured frames combined.py has processed.
+
+Every frame gets one row with its outcome, the detector version that produced
+it and how long detection and OCR took. On the next run the whole ledger is
+read with a single query and compared against one directory listing, so
+finding the remaining work costs no per-file stat calls. Frames processed by
+an older detector version count as pending again, so a model upgrade only
+re-processes stale frames.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+
+def detector_version(config_file, weights_file):
+    """
+    Identify a model by its cfg contents and the weights file's size and mtime
+    (hashing hundreds of megabytes of weights on every run would be slow).
+    """
+    digest = hashlib.sha1()
+    with open(config_file, 'rb') as f:
+        digest.update(f.read())
+    stat = os.stat(weights_file)
+    digest.update(f"{os.path.basename(weights_file)}:{stat.st_size}:{int(stat.st_mtime)}".encode())
+    return digest.hexdigest()[:16]
+
+
+class FrameLedger:
+    def __init__(self, path='output/ledger.sqlite3'):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        # WAL keeps the per-frame commits cheap without risking the file on a crash
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS frames (
+                path TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                detector_version TEXT,
+                detections INTEGER,
+                detect_ms REAL,
+                ocr_ms REAL,
+                processed_at REAL NOT NULL
+            )
+        """)
+        self.db.commit()
+
+    def is_empty(self):
+        return self.db.execute("SELECT 1 FROM frames LIMIT 1").fetchone() is None
+
+    def pending(self, paths, version):
+        """
+        Return the paths that were never processed, failed, or were processed
+        by a different detector version. Keeps the input order.
+        """
+        current = {
+            path for path, status, frame_version in
+            self.db.execute("SELECT path, status, detector_version FROM frames")
+            if status != 'failed' and frame_version == version
+        }
+        return [path for path in paths if path not in current]
+
+    def record(self, path, status, version, detections=None, detect_ms=None, ocr_ms=None):
+        self.db.execute(
+            "INSERT OR REPLACE INTO frames (path, status, detector_version, detections, detect_ms, ocr_ms, processed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (path, status, version, detections, detect_ms, ocr_ms, time.time())
+        )
+        self.db.commit()
+
+    def record_many(self, paths, status, version):
+        now = time.time()
+        self.db.executemany(
+            "INSERT OR REPLACE INTO frames (path, status, detector_version, processed_at) VALUES (?, ?, ?, ?)",
+            [(path, status, version, now) for path in paths]
+        )
+        self.db.commit()
+
+    def summary(self):
+        rows = self.db.execute(
+            "SELECT status, COUNT(*), AVG(detect_ms), AVG(ocr_ms) FROM frames GROUP BY status ORDER BY status"
+        ).fetchall()
+        return ", ".join(
+            f"{status}: {count}" + (f" (detect {detect:.0f} ms, ocr {ocr:.0f} ms avg)" if detect is not None and ocr is not None else "")
+            for status, count, detect, ocr in rows
+        )
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,243 @@
+"""
+Non-maximum suppression on DETECTION_DTYPE arrays.
+
+Darknet's do_nms_sort walks every box the network produced, for every class,
+in C on the DETECTION structs. Once detections_to_array has kept only the
+(box, class) pairs above the threshold there are usually a few hundred rows
+left, and suppressing those with NumPy is cheaper than the C pass over the
+full candidate set.
+
+Classes are kept apart by shifting every class into its own stretch of the x
+axis, so boxes of different classes can never overlap and one pass handles
+all classes at once. The overlapping pairs are found with a vectorized sweep
+over x within bands of y; the only Python loop left is the greedy pass over
+boxes that overlap something, which is one slice assignment per box.
+
+    kept = nms(detections, 0.45)                  # greedy, like do_nms_sort
+    kept = nms(detections, 0.5, metric='min')     # intersection over the smaller box
+    kept = soft_nms(detections, sigma=0.5)        # decay overlapping scores instead
+    kept = top_k_per_class(kept, 20)
+"""
+import numpy as np
+
+
+def _corners(detections, class_aware):
+    x0 = detections["x"] - detections["w"] / 2
+    y0 = detections["y"] - detections["h"] / 2
+    x1 = detections["x"] + detections["w"] / 2
+    y1 = detections["y"] + detections["h"] / 2
+    if class_aware and len(detections):
+        # Each class gets its own range of x, far enough apart that no boxes of two classes meet
+        span = float(max(x1.max(), 0) - min(x0.min(), 0)) + 1
+        shift = detections["class_id"] * span
+        x0, x1 = x0 + shift, x1 + shift
+    return (x0.astype(np.float64), y0.astype(np.float64), x1.astype(np.float64), y1.astype(np.float64))
+
+
+def _overlapping_pairs(x0, y0, x1, y1, metric, threshold):
+    """
+    Every pair of boxes whose overlap is above threshold, as (first, second,
+    overlap) arrays.
+
+    The frame is cut into horizontal bands twice the tallest box high, and
+    every band is moved to its own stretch of x (like the classes), so the
+    sweep only compares boxes that are close in both x and y. Two boxes that
+    overlap are less than one box height apart, so they share a band in at
+    least one of two cuttings offset by half a band.
+    """
+    height = float((y1 - y0).max()) if len(y0) else 0.0
+    if height <= 0 or y1.max() - y0.min() <= 4 * height:
+        return _sweep_pairs(x0, y0, x1, y1, metric, threshold)
+
+    span = float(x1.max() - x0.min()) + 1
+    found = []
+    for offset in (0.0, height):
+        shift = np.floor((y0 - y0.min() + offset) / (2 * height)) * span
+        found.append(_sweep_pairs(x0 + shift, y0, x1 + shift, y1, metric, threshold))
+    first = np.concatenate([pairs[0] for pairs in found])
+    second = np.concatenate([pairs[1] for pairs in found])
+    overlap = np.concatenate([pairs[2] for pairs in found])
+    # A pair sharing a band in both cuttings was found twice
+    low, high = np.minimum(first, second), np.maximum(first, second)
+    _, unique = np.unique(low * len(x0) + high, return_index=True)
+    return low[unique], high[unique], overlap[unique]
+
+
+def _sweep_pairs(x0, y0, x1, y1, metric, threshold, chunk_pairs=1 << 22):
+    """
+    Boxes are swept left to right by x0: only boxes that start before the
+    current one ends can meet it, so for spread out detections the pairs
+    checked grow with the number of neighbours rather than with n squared.
+    """
+    by_x = np.argsort(x0, kind="stable")
+    sx0, sy0, sx1, sy1 = x0[by_x], y0[by_x], x1[by_x], y1[by_x]
+    area = (sx1 - sx0) * (sy1 - sy0)
+    # Position p in x order can only meet positions p + 1 .. ends[p] - 1. An IoU above
+    # the threshold also needs the boxes to share more than threshold * width in x
+    reach = sx1 - threshold * (sx1 - sx0) if metric == 'iou' else sx1
+    ends = np.searchsorted(sx0, reach, side='left')
+    counts = np.maximum(ends - np.arange(len(sx0)) - 1, 0)
+    cumulative = np.cumsum(counts)
+
+    firsts, seconds, overlaps = [], [], []
+    start = 0
+    while start < len(sx0):
+        # Bound the memory of one round of pairs by cutting the sweep into chunks
+        stop = max(int(np.searchsorted(cumulative, cumulative[start] - counts[start] + chunk_pairs, side='right')),
+                   start + 1)
+        chunk_counts = counts[start:stop]
+        a = np.repeat(np.arange(start, stop), chunk_counts)
+        offsets = np.arange(len(a)) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+        b = a + 1 + offsets
+        inter = (np.clip(np.minimum(sx1[a], sx1[b]) - sx0[b], 0, None) *
+                 np.clip(np.minimum(sy1[a], sy1[b]) - np.maximum(sy0[a], sy0[b]), 0, None))
+        if metric == 'min':
+            overlap = inter / (np.minimum(area[a], area[b]) + 1e-9)
+        else:
+            overlap = inter / (area[a] + area[b] - inter + 1e-9)
+        hit = overlap > threshold
+        firsts.append(by_x[a[hit]])
+        seconds.append(by_x[b[hit]])
+        overlaps.append(overlap[hit])
+        start = stop
+    if not firsts:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0)
+    return np.concatenate(firsts), np.concatenate(seconds), np.concatenate(overlaps)
+
+
+def nms_indices(detections, iou_threshold=0.45, class_aware=True, metric='iou'):
+    """
+    Greedy non-maximum suppression.
+
+    Args:
+        detections: DETECTION_DTYPE array.
+        iou_threshold: boxes overlapping a kept box by more than this are dropped.
+        class_aware: only let boxes suppress boxes of their own class.
+        metric: 'iou', or 'min' for intersection over the smaller box (catches
+                a box clipped out of a bigger one, as tiling produces).
+
+    Returns:
+        Indices of the kept detections, highest confidence first.
+    """
+    if metric not in ('iou', 'min'):
+        raise ValueError(f"Unknown overlap metric {metric!r}")
+    order = np.argsort(-detections["conf"], kind="stable")
+    if len(order) < 2:
+        return order.astype(np.intp)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    # Every overlapping pair, pointing from the more to the less confident box
+    first, second, _ = _overlapping_pairs(*_corners(detections, class_aware), metric, iou_threshold)
+    stronger = np.minimum(rank[first], rank[second])
+    weaker = np.maximum(rank[first], rank[second])
+    by_stronger = np.argsort(stronger, kind="stable")
+    stronger, weaker = stronger[by_stronger], weaker[by_stronger]
+    sources, starts = np.unique(stronger, return_index=True)
+    stops = np.append(starts[1:], len(stronger))
+
+    # Only boxes that overlap something need the sequential pass, and only the ones still kept suppress
+    suppressed = np.zeros(len(order), dtype=bool)
+    for source, start, stop in zip(sources.tolist(), starts.tolist(), stops.tolist()):
+        if not suppressed[source]:
+            suppressed[weaker[start:stop]] = True
+    return order[~suppressed]
+
+
+def nms(detections, iou_threshold=0.45, top_k=None, class_aware=True, metric='iou'):
+    """
+    Greedy NMS (see nms_indices) and an optional per-class cap.
+    Returns the kept detections sorted by ascending confidence, like detect_image_array.
+    """
+    kept = detections[nms_indices(detections, iou_threshold, class_aware, metric)]
+    if top_k is not None:
+        kept = top_k_per_class(kept, top_k)
+    return kept[np.argsort(kept["conf"], kind="stable")]
+
+
+def soft_nms(detections, sigma=0.5, score_threshold=0.001, method='gaussian', iou_threshold=0.3,
+             top_k=None, class_aware=True):
+    """
+    Soft-NMS (Bodla et al., 2017): instead of dropping boxes that overlap a
+    kept one, lower their confidence by how much they overlap.
+
+    Args:
+        sigma: width of the gaussian decay, conf *= exp(-iou^2 / sigma).
+        score_threshold: boxes whose decayed confidence falls below this are dropped.
+        method: 'gaussian', or 'linear' for conf *= 1 - iou above iou_threshold.
+        iou_threshold: only used by the linear method.
+
+    Returns:
+        The kept detections with decayed confidences, sorted by ascending confidence.
+    """
+    if method not in ('gaussian', 'linear'):
+        raise ValueError(f"Unknown soft-NMS method {method!r}")
+    # Only boxes that overlap at all (or above the linear threshold) ever decay each other
+    first, second, overlap = _overlapping_pairs(*_corners(detections, class_aware), 'iou',
+                                                0.0 if method == 'gaussian' else iou_threshold)
+    sources = np.concatenate([first, second])
+    by_source = np.argsort(sources, kind="stable")
+    targets = np.concatenate([second, first])[by_source]
+    # Boxes never move, so every pair's IoU is known up front
+    if method == 'gaussian':
+        decay = np.exp(-np.square(np.concatenate([overlap, overlap])[by_source]) / sigma)
+    else:
+        decay = 1 - np.concatenate([overlap, overlap])[by_source]
+    bounds = np.searchsorted(sources[by_source], np.arange(len(detections) + 1))
+
+    scores = detections["conf"].astype(np.float64)
+    alive = scores >= score_threshold
+    candidates = np.where(alive, scores, -np.inf)
+    keep, kept_scores = [], []
+    while len(candidates):
+        # Scores change every round, so the best box has to be found again
+        i = int(np.argmax(candidates))
+        if candidates[i] == -np.inf:
+            break
+        keep.append(i)
+        kept_scores.append(scores[i])
+        alive[i] = False
+        candidates[i] = -np.inf
+
+        neighbours = targets[bounds[i]:bounds[i + 1]]
+        live = alive[neighbours]
+        neighbours = neighbours[live]
+        if not len(neighbours):
+            continue
+        scores[neighbours] *= decay[bounds[i]:bounds[i + 1]][live]
+        alive[neighbours] = scores[neighbours] >= score_threshold
+        candidates[neighbours] = np.where(alive[neighbours], scores[neighbours], -np.inf)
+
+    kept = detections[np.array(keep, dtype=np.intp)]
+    kept["conf"] = kept_scores
+    if top_k is not None:
+        kept = top_k_per_class(kept, top_k)
+    return kept[np.argsort(kept["conf"], kind="stable")]
+
+
+def box_iou(a, b):
+    """
+    IoU of every (center x, center y, width, height) box in a against every box in b.
+    """
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    a0, a1 = a[:, None, :2] - a[:, None, 2:] / 2, a[:, None, :2] + a[:, None, 2:] / 2
+    b0, b1 = b[None, :, :2] - b[None, :, 2:] / 2, b[None, :, :2] + b[None, :, 2:] / 2
+    sides = np.clip(np.minimum(a1, b1) - np.maximum(a0, b0), 0, None)
+    inter = sides[..., 0] * sides[..., 1]
+    union = (a[:, None, 2] * a[:, None, 3]) + (b[None, :, 2] * b[None, :, 3]) - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+def top_k_per_class(detections, k):
+    """
+    The k most confident detections of every class, in their original order.
+    """
+    if len(detections) <= k:
+        return detections
+    # Sort by class, then by falling confidence, and rank every row within its class
+    order = np.lexsort((-detections["conf"], detections["class_id"]))
+    classes = detections["class_id"][order]
+    starts = np.flatnonzero(np.diff(classes, prepend=classes[:1] - 1))
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.append(starts, len(order))))
+    return detections[np.sort(order[rank < k])]
@@ -0,0 +1,184 @@
+"""
+OCR stage for chat bubbles.
+
+combined.py used to re-open the source PNG for every 'message' box and start a
+fresh tesseract process per crop. OcrStage works on the frame that is already
+decoded, reads all bubbles of a frame in parallel on a small thread pool and
+keeps one Tesseract API per thread when tesserocr is installed (falling back
+to pytesseract, which still launches a process per crop).
+
+The same bubble usually stays on screen for several seconds, so results are
+cached by an exact digest of the trimmed mask: a bubble seen a few frames ago
+never reaches Tesseract again, even if YOLO's box moved by a pixel or two. The
+key is exact rather than a perceptual hash, because a bubble one character
+away from a cached one must not get its text.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+    import pytesseract
+
+# Detections are in the network's 1920x1088 space
+NETWORK_SIZE = (1920, 1088)
+
+# Bubble text is bright; everything darker is background
+LOWER_BOUND = np.array([0, 0, 123])
+UPPER_BOUND = np.array([179, 255, 255])
+
+
+def message_mask(image, coordinates):
+    """
+    Crop a detection box out of a BGR frame, up-sample it and return the
+    binary mask Tesseract reads. None if the box is empty.
+    """
+    # Scale the bounding box from network space to the frame's resolution
+    height_px, width_px = image.shape[:2]
+    center_x, center_y, width, height = coordinates
+    scale_x, scale_y = width_px / NETWORK_SIZE[0], height_px / NETWORK_SIZE[1]
+    x1 = max(0, round((center_x - width / 2) * scale_x))
+    y1 = max(0, round((center_y - height / 2) * scale_y))
+    x2 = min(width_px, round((center_x + width / 2) * scale_x))
+    y2 = min(height_px, round((center_y + height / 2) * scale_y))
+    if x2 <= x1 or y2 <= y1:
+        return None
+
+    cropped = cv2.resize(image[y1:y2, x1:x2], (0, 0), fx=2, fy=2)
+
+    # Convert the crop to HSV color-space and get the binary mask
+    hsv = cv2.cvtColor(cropped, cv2.COLOR_BGR2HSV)
+    return cv2.inRange(hsv, LOWER_BOUND, UPPER_BOUND)
+
+
+def trim_mask(mask):
+    """
+    Cut a mask down to the bounding box of its lit pixels, so the same text
+    gives the same crop however YOLO's box jittered around it.
+    """
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if not len(rows):
+        return mask
+    return mask[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+
+
+def crop_key(mask):
+    """
+    Exact cache key of a mask: a digest of its trimmed pixels and their shape.
+    The box is cropped at whole pixels and up-sampled by exactly 2, so the same
+    text gives the same trimmed mask however YOLO's box jittered around it,
+    while a single different character changes the key.
+    """
+    trimmed = np.ascontiguousarray(trim_mask(mask))
+    return hashlib.blake2b(trimmed.tobytes(), digest_size=16).digest(), trimmed.shape
+
+
+class OcrCache:
+    def __init__(self, capacity=2048):
+        """
+        Args:
+            capacity: crops remembered; the least recently used one is dropped.
+        """
+        self.capacity = capacity
+        self.texts = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        text = self.texts.get(key)
+        if text is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.texts.move_to_end(key)
+        return text
+
+    def put(self, key, text):
+        self.texts[key] = text
+        self.texts.move_to_end(key)
+        if len(self.texts) > self.capacity:
+            self.texts.popitem(last=False)
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class OcrStage:
+    def __init__(self, threads=4, cache_size=2048, lang='eng', psm=7, oem=3):
+        self.lang = lang
+        self.psm = psm
+        self.oem = oem
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='ocr')
+        self.cache = OcrCache(cache_size) if cache_size else None
+        self._local = threading.local()
+        self._apis = []
+        self._lock = threading.Lock()
+
+    def _api(self):
+        # Tesseract's API object is not thread-safe, so every worker thread gets its own
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(lang=self.lang, psm=self.psm, oem=self.oem)
+            self._local.api = api
+            with self._lock:
+                self._apis.append(api)
+        return api
+
+    def recognize(self, mask):
+        """
+        Run Tesseract on one binary mask and return the stripped text.
+        """
+        if tesserocr is not None:
+            api = self._api()
+            api.SetImage(Image.fromarray(mask))
+            return api.GetUTF8Text().strip()
+        return pytesseract.image_to_string(mask, lang=self.lang, config=f'--oem {self.oem} --psm {self.psm}').strip()
+
+    def read(self, image, boxes):
+        """
+        OCR every (center x, center y, width, height) box of a BGR frame.
+        Returns one string per box, in order; empty boxes read as ''.
+        """
+        texts = [''] * len(boxes)
+        pending = []
+        for i, coordinates in enumerate(boxes):
+            mask = message_mask(image, coordinates)
+            if mask is None:
+                continue
+            if self.cache is not None:
+                key = crop_key(mask)
+                text = self.cache.get(key)
+                if text is not None:
+                    texts[i] = text
+                    continue
+                pending.append((i, key, self.executor.submit(self.recognize, mask)))
+            else:
+                pending.append((i, None, self.executor.submit(self.recognize, mask)))
+
+        for i, key, future in pending:
+            texts[i] = future.result()
+            if self.cache is not None:
+                self.cache.put(key, texts[i])
+        return texts
+
+    def summary(self):
+        if self.cache is None:
+            return "OCR cache disabled"
+        return (f"OCR cache hits {self.cache.hits}/{self.cache.hits + self.cache.misses} "
+                f"({100 * self.cache.hit_ratio():.1f}%)")
+
+    def close(self):
+        self.executor.shutdown()
+        for api in self._apis:
+            api.End()
+        self._apis = []
@@ -1,35 +1,27 @@
 from datetime import datetime
 import argparse
 import os
-import time
 import cv2
 import darknet
-import yaml
-import glob
+from detector import BACKENDS, make_detector
+from incremental import IncrementalDetector
+from roi import parse_region, parse_size
+from framering import FrameRing
+from framegate import ChangeGate
+from framefeed import FrameFeed
+from detlog import DetectionLog
+import itertools
 import re
 
-def get_next_output_filename():
-    # Find all files matching the pattern screengrab_output_*.png
-    files = glob.glob("overlay/output/screengrab_output_*.png")
-    if not files:
-        return "screengrab_output_1.png"
+OUTPUT_PATTERN = re.compile(r"screengrab_output_(\d+)\.png$")
 
-    # Extract numbers from filenames and find the highest number
-    numbers = [int(re.search(r"screengrab_output_(\d+).png", f).group(1)) for f in files]
-    next_number = max(numbers) + 1
-    return f"screengrab_output_{next_number}.png"
-
-
-def get_latest_input_filename(directory, prefix):
-    # Find all files matching the pattern prefix-*.png
-    files = glob.glob(os.path.join(directory, f"{prefix}-*.png"))
-    if len(files) < 2:
-        return None
-
-    # Extract numbers from filenames and sort them
-    files.sort(key=lambda f: int(re.search(rf"{prefix}-(\d+).png", os.path.basename(f)).group(1)), reverse=True)
-    # Return the second-to-last file
-    return files[1]
+def find_last_output_number(directory="overlay/output"):
+    # Scanned once at startup; after that the counter lives in memory
+    if not os.path.isdir(directory):
+        return 0
+    with os.scandir(directory) as entries:
+        numbers = [int(match.group(1)) for match in map(OUTPUT_PATTERN.match, (e.name for e in entries)) if match]
+    return max(numbers, default=0)
 
 
 # Define a function named 'parser' to create and configure an argument parser
@@ -46,115 +38,171 @@ def parser():
     parser.add_argument("--data_file", default="screenshots/screenshots.data", help="path to data file")
     parser.add_argument("--thresh", type=float, default=.25, help="remove detections with lower confidence")
     parser.add_argument("--output_file", type=str, default="detections.yaml", help="YAML file to write detections to")
+    parser.add_argument("--detection_log", type=str, default="overlay/output/detections.detlog",
+                        help="binary log every frame's detections are appended to (see detlog.py for YAML)")
     parser.add_argument("--output_image", type=str, default="output_with_detections.png", help="Output image file with detections superimposed")
-    return parser.parse_args()
-
-# Define the function that performs YOLO object detection on a given image
-def image_detection(image_or_path, network, class_names, class_colors, thresh):
-    # Get the width and height of the Darknet network
-    width = 1920
-    height = 1088
-
-    # Create a Darknet IMAGE object with the specified width, height, and 3 channels
-    darknet_image = darknet.make_image(width, height, 3)
-
-    # Check if 'image_or_path' is a path to an image file (string) or an image array
-    if isinstance(image_or_path, str):
-        # Load the image from the provided file path
-        image = cv2.imread(image_or_path)
-
-        # Check if the image loading was successful
-        if image is None:
-            raise ValueError(f"Unable to load image {image_or_path}")
-    else:
-        # Use the provided image array
-        image = image_or_path
-
-    # Convert the input image from BGR to RGB color space
-    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-    # Resize the image to match the dimensions of the Darknet network
-    image_resized = cv2.resize(image_rgb, (width, height), interpolation=cv2.INTER_LINEAR)
-
-    # Copy the resized image data into the Darknet IMAGE object
-    darknet.copy_image_from_bytes(darknet_image, image_resized.tobytes())
-
-    # Perform object detection on the image using Darknet
-    detections = darknet.detect_image(network, class_names, darknet_image, thresh=thresh)
-
-    # Free the memory used by the Darknet IMAGE object
-    darknet.free_image(darknet_image)
-
-    # Draw bounding boxes and labels on the image based on the detected objects
-    image_with_boxes = darknet.draw_boxes(detections, image_resized, class_colors)
-
-    # Convert the image back to BGR color space (OpenCV format) and return it along with detections
-    return cv2.cvtColor(image_with_boxes, cv2.COLOR_BGR2RGB), detections
-
-# Function to write detections to a YAML file
-def write_detections_to_yaml(detections, output_file, timestamp):
-    detections_serializable = [(label, confidence, list(bbox)) for label, confidence, bbox in detections]
-    data = {
-        'timestamp': timestamp,
-        'detections': detections_serializable
-    }
-    with open(output_file, 'w') as file:
-        yaml.dump(data, file)
-
+    parser.add_argument("--ring", type=str, default=None,
+                        help="read frames from grabber.py's shared-memory ring instead of overlay/input_grabs PNGs")
+    parser.add_argument("--gate_threshold", type=float, default=6.0,
+                        help="skip frames whose tiles changed less than this mean grey level (0 processes every frame)")
+    parser.add_argument("--roi", type=str, default=None,
+                        help="x,y,width,height of the screen to detect in, or 'auto' to learn it from detections")
+    parser.add_argument("--tile", type=str, default=None,
+                        help="WIDTHxHEIGHT tiles to split the region into at native resolution")
+    parser.add_argument("--tile_overlap", type=int, default=160, help="minimum overlap between tiles in pixels")
+    parser.add_argument("--detector", choices=BACKENDS, default='darknet',
+                        help="run the network with libdarknet or with OpenCV's DNN module (no Darknet build needed)")
+    parser.add_argument("--detector_threads", type=int, default=None,
+                        help="CPU threads for the opencv detector (default: OpenCV's choice)")
+    parser.add_argument("--detector_socket", default=None,
+                        help="socket of the detectord to use with --detector daemon (default /tmp/pwn-detector.sock)")
+    parser.add_argument("--incremental", action='store_true',
+                        help="keep every tile's detections and re-detect only the tiles that changed (needs --tile)")
+    parser.add_argument("--refresh_every", type=int, default=30,
+                        help="with --incremental, detect every tile every this many frames (0 = never)")
+    args = parser.parse_args()
+    if args.incremental and args.tile is None:
+        parser.error("--incremental needs --tile")
+    if args.incremental and args.detector == 'daemon':
+        parser.error("--incremental runs its own network, it cannot use --detector daemon")
+    if args.detector == 'daemon':
+        # detectord runs the network with its own settings, these would be silently ignored
+        given = [f"--{name}" for name in ('thresh', 'roi', 'tile', 'tile_overlap') if getattr(args, name) != parser.get_default(name)]
+        if given:
+            parser.error(f"{', '.join(given)} must be set on detectord.py, not with --detector daemon")
+    if args.incremental and args.batch_size != 1:
+        parser.error("--incremental detects one frame at a time (--batch_size 1)")
+    return args
+
+# Up to `count` of the newest ring frames after last_seq, oldest first, as (seq, timestamp, image)
+def read_ring_frames(ring, last_seq, count, timeout=5):
+    if ring.wait_newer(last_seq, timeout=timeout) is None:
+        return []
+    newest = ring.latest_seq()
+    frames = []
+    for seq in range(max(last_seq + 1, newest - count + 1), newest + 1):
+        entry = ring.get(seq)
+        if entry is not None:
+            frames.append((seq,) + entry)
+    return frames
 
 def main():
     # Parse the arguments
     args = parser()
 
-        # Load the YOLO model
-    network, class_names, class_colors = darknet.load_network(
-        args.config_file,
-        args.data_file,
-        args.weights,
-        batch_size=args.batch_size
-    )
+    # Load the YOLO model; the detector keeps its frame buffers between frames
+    if args.incremental:
+        # Tiles that did not change since they were last detected keep their detections
+        detector = IncrementalDetector(
+            args.config_file,
+            args.data_file,
+            args.weights,
+            thresh=args.thresh,
+            roi=parse_region(args.roi),
+            tile=parse_size(args.tile),
+            tile_overlap=args.tile_overlap,
+            refresh_every=args.refresh_every,
+            backend=args.detector,
+            threads=args.detector_threads
+        )
+    else:
+        detector = make_detector(
+            args.config_file,
+            args.data_file,
+            args.weights,
+            backend=args.detector,
+            threads=args.detector_threads,
+            socket_path=args.detector_socket,
+            batch_size=args.batch_size,
+            thresh=args.thresh,
+            roi=parse_region(args.roi),
+            tile=parse_size(args.tile),
+            tile_overlap=args.tile_overlap
+        )
 
     os.makedirs("overlay/output", exist_ok=True)
+    detection_log = DetectionLog(args.detection_log, detector.class_names)
 
-    while True:
-        # Sleep for 1 second before processing the next image
-        time.sleep(1)
+    input_directory = 'overlay/input_grabs'
+    input_prefix = 'screengrab-input'
 
-        # Get the latest input filename
-        input_directory = 'overlay/input_grabs'
-        input_prefix = 'screengrab-input'
-        image_path = get_latest_input_filename(input_directory, input_prefix)
+    ring = FrameRing.wait_attach(args.ring) if args.ring else None
+    feed = None if ring is not None else FrameFeed(input_directory, f"{input_prefix}-")
+    last_seq = 0
+    output_numbers = itertools.count(find_last_output_number() + 1)
 
-        if image_path is None:
-            print(f"No images found in {input_directory}")
-            return
+    # Frames that look like the last processed one never reach YOLO
+    gate = ChangeGate(threshold=args.gate_threshold) if args.gate_threshold > 0 else None
 
-        # Get the creation timestamp of the image
-        timestamp = os.path.getctime(image_path)
-        human_readable_timestamp = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+    while True:
+        if ring is not None:
+            if ring.retired:
+                # grabber.py made a new ring (the frame size changed, or it restarted)
+                ring.close()
+                ring, last_seq = FrameRing.wait_attach(args.ring), 0
+                print(f"Attached to the new ring '{args.ring}'")
+            # Frames we have not seen; the views point straight into shared memory
+            frames = read_ring_frames(ring, last_seq, args.batch_size)
+            if not frames:
+                print(f"No new frames in ring '{args.ring}'")
+                continue
+            last_seq = frames[-1][0]
+        else:
+            # Newest captures grabber.py finished writing; older backlog is skipped
+            image_paths = feed.wait(timeout=5)[-args.batch_size:]
+
+            if not image_paths:
+                print(f"No new images in {input_directory}")
+                continue
+
+            frames = []
+            for image_path in image_paths:
+                # Read the image from the file
+                image = cv2.imread(image_path)
+
+                if image is None:
+                    print(f"Error: Unable to read image from {image_path}")
+                    continue
+
+                # Get the creation timestamp of the image
+                frames.append((None, os.path.getctime(image_path), image))
+
+        # Prepare right away, before the ring slot behind a view can be reused
+        batch = []
+        for seq, timestamp, image in frames:
+            if gate is None or gate.check(image):
+                detector.prepare(image, len(batch))
+                batch.append((seq, timestamp))
+        if not batch:
+            continue
 
-        # Read the image from the file
-        image = cv2.imread(image_path)
+        # Run the YOLO object detection, one forward pass for the whole batch
+        arrays = detector.detect_prepared(len(batch))
 
-        if image is None:
-            print(f"Error: Unable to read image from {image_path}")
-            time.sleep(0.2)
-            continue
+        for slot, ((seq, timestamp), array) in enumerate(zip(batch, arrays)):
+            detections = detector.to_detections(array)
+            image = darknet.draw_boxes(detections, detector.canvas[slot], detector.class_colors)
 
-        # Run the YOLO object detection and get the resized dimensions
-        image, detections = image_detection(image, network, class_names, class_colors, args.thresh)
+            # Frames from the ring only reach disk when they show a chat bubble
+            if ring is not None and any(label == 'message' for label, _, _ in detections):
+                input_name = f"{input_prefix}-{datetime.fromtimestamp(timestamp).strftime('%Y%m%d_%H%M%S_%f')[:-3]}.png"
+                if not ring.save(seq, os.path.join(input_directory, input_name)):
+                    print(f"Frame {seq} was overwritten before it could be saved")
 
-        # Get the next output filename
-        output_filename = get_next_output_filename()
+            # Get the next output filename
+            output_number = next(output_numbers)
+            output_filename = f"screengrab_output_{output_number}.png"
 
-        yaml_output_file = f"overlay/output/{output_filename.split('.png')[0]}.yaml"
-        write_detections_to_yaml(detections, yaml_output_file, human_readable_timestamp)
+            # One appended record per detection instead of a YAML file per frame
+            detection_log.append(output_number, timestamp, array)
 
+            # Save the image with detections
+            cv2.imwrite(f"overlay/output/{output_filename}", image)
 
-        # Save the image with detections
-        cv2.imwrite(f"overlay/output/{output_filename}", image)
+            print(f"Detections saved to {output_filename}")
 
-        print(f"Detections saved to {output_filename}")
+        if args.incremental and detector.frames % 100 == 0:
+            print(detector.summary())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
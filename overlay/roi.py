@@ -0,0 +1,116 @@
+"""
+Regions of interest and tiling for the detector.
+
+Chat bubbles only ever appear over the game canvas, never over the LXDE panel
+or the browser chrome, so the detector can skip most of the desktop. A region
+is an (x, y, width, height) rectangle in source-frame pixels. It can be given
+on the command line or learned by RoiLearner from where detections have
+actually shown up. A region can also be split into overlapping tiles of the
+network's native size, so nothing is scaled down before detection.
+"""
+import numpy as np
+
+
+def parse_region(text):
+    """
+    'x,y,width,height' -> tuple of ints. 'auto' and None pass through.
+    """
+    if text is None or text == 'auto':
+        return text
+    values = tuple(int(v) for v in text.split(','))
+    if len(values) != 4:
+        raise ValueError(f"Region must be x,y,width,height, got {text!r}")
+    return values
+
+
+def parse_size(text):
+    """
+    'WIDTHxHEIGHT' -> (width, height), None passes through.
+    """
+    if text is None:
+        return None
+    width, height = (int(v) for v in text.lower().split('x'))
+    return width, height
+
+
+def align_up(value, alignment=32):
+    # YOLO input sizes have to be multiples of the network stride
+    return (value + alignment - 1) // alignment * alignment
+
+
+def clip_region(region, frame_size):
+    """
+    Intersect a region with a (width, height) frame.
+    """
+    x, y, width, height = region
+    frame_width, frame_height = frame_size
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(frame_width, x + width), min(frame_height, y + height)
+    return x0, y0, max(0, x1 - x0), max(0, y1 - y0)
+
+
+def _tile_starts(length, tile, overlap):
+    if length <= tile:
+        return [0]
+    step = tile - overlap
+    starts = list(range(0, length - tile, step))
+    # The last tile is pushed back to end exactly at the edge rather than hanging over it
+    starts.append(length - tile)
+    return starts
+
+
+def tile_boxes(region, tile_size, overlap=160):
+    """
+    Cover a region with tile_size (width, height) tiles that overlap by at
+    least `overlap` pixels, so a bubble cut by one tile is whole in its neighbour.
+    Returns (x, y, width, height) boxes in the same coordinates as the region.
+    """
+    x, y, width, height = region
+    tile_width, tile_height = tile_size
+    return [(x + dx, y + dy, min(tile_width, width), min(tile_height, height))
+            for dy in _tile_starts(height, tile_height, overlap)
+            for dx in _tile_starts(width, tile_width, overlap)]
+
+
+class RoiLearner:
+    def __init__(self, warmup=100, margin=96, refresh_every=500):
+        """
+        Args:
+            warmup: frames to detect on the whole screen before narrowing down.
+            margin: pixels added around everything seen so far.
+            refresh_every: detect on the whole screen every this many frames,
+                           so bubbles in new places still widen the region (0 = never).
+        """
+        self.warmup = warmup
+        self.margin = margin
+        self.refresh_every = refresh_every
+        self.frames = 0
+        self.bounds = None
+
+    def observe(self, x, y, w, h):
+        """
+        Widen the learned area by boxes given as center x, y, width and height arrays in source pixels.
+        """
+        if len(x) == 0:
+            return
+        x0, y0 = float(np.min(x - w / 2)), float(np.min(y - h / 2))
+        x1, y1 = float(np.max(x + w / 2)), float(np.max(y + h / 2))
+        if self.bounds is not None:
+            bx0, by0, bx1, by1 = self.bounds
+            x0, y0, x1, y1 = min(x0, bx0), min(y0, by0), max(x1, bx1), max(y1, by1)
+        self.bounds = (x0, y0, x1, y1)
+
+    def region(self, frame_size):
+        """
+        Region to detect in for the next frame, or None for the whole frame.
+        """
+        self.frames += 1
+        if self.bounds is None or self.frames <= self.warmup:
+            return None
+        if self.refresh_every and self.frames % self.refresh_every == 0:
+            return None
+        x0, y0, x1, y1 = self.bounds
+        x0, y0 = int(x0) - self.margin, int(y0) - self.margin
+        # Rounding the size up keeps the network from being resized for every few pixels of growth
+        width, height = align_up(int(x1) + self.margin - x0, 128), align_up(int(y1) + self.margin - y0, 128)
+        return clip_region((x0, y0, width, height), frame_size)
@@ -0,0 +1,87 @@
+"""
+Accuracy of matching OCR text to chat lines, on labelled OCR strings.
+
+testdata/ocr_labels.json holds what Tesseract read off chat bubbles next to
+the chat_lines.json line each bubble showed, or null where nothing should
+match (too short, garbage, or outside the time window). A wrong match puts
+coordinates on somebody else's line, so it counts against accuracy and is
+also not allowed at all. The chat log's times are the old exporter's local
+wall-clock times; lines from the page's observer are stamped in UTC.
+
+    python -m pytest overlay
+"""
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from chatindex import ChatLogIndex
+from fuzzy import best_match
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CHAT_LOG = os.path.join(HERE, '..', 'chat_lines.json')
+LABELS = os.path.join(HERE, 'testdata', 'ocr_labels.json')
+MIN_ACCURACY = 0.95
+
+
+def load_labels():
+    with open(LABELS) as file:
+        labels = json.load(file)
+    for label in labels:
+        label['seen_at'] = datetime.strptime(label['seen_at'], "%m/%d/%Y, %H:%M:%S")
+    return labels
+
+
+def score(matcher, labels):
+    # (share of labels matched as labelled, labels matched to another line)
+    correct, wrong = 0, []
+    for label in labels:
+        found = matcher(label['ocr'], label['seen_at'])
+        if found == label['message']:
+            correct += 1
+        elif found is not None:
+            wrong.append((label['ocr'], found))
+    return correct / len(labels), wrong
+
+
+def test_chat_index_match():
+    index = ChatLogIndex(CHAT_LOG)
+
+    def matcher(ocr_text, seen_at):
+        entry = index.match(ocr_text, seen_at)
+        return entry['message'] if entry is not None else None
+
+    accuracy, wrong = score(matcher, load_labels())
+    assert not wrong
+    assert accuracy >= MIN_ACCURACY
+
+
+def test_best_match_on_window():
+    # Same candidates bench.py accuracy gives the matchers
+    index = ChatLogIndex(CHAT_LOG)
+
+    def matcher(ocr_text, seen_at):
+        candidates = [entry['message'] for entry in index.window(seen_at)
+                      if len(entry['message']) >= index.min_length]
+        return best_match(ocr_text, candidates)[0]
+
+    accuracy, wrong = score(matcher, load_labels())
+    assert not wrong
+    assert accuracy >= MIN_ACCURACY
+
+
+def test_utc_chat_times_outside_utc(monkeypatch):
+    # Frames carry local time, the observer's lines UTC; both must land on the same clock
+    monkeypatch.setenv('TZ', 'America/New_York')
+    time.tzset()
+    try:
+        index = ChatLogIndex()
+        index.add([{'time': '2024-09-28 05:18:26', 'name': 'pony', 'message': 'ha ha losers'}])
+        captured_at = datetime(2024, 9, 28, 5, 18, 28, tzinfo=timezone.utc).timestamp()
+        for seen_at in (datetime.fromtimestamp(captured_at), datetime.fromtimestamp(captured_at, timezone.utc)):
+            assert index.match("ha ha 1osers", seen_at)['message'] == 'ha ha losers'
+        assert index.forget_before(datetime.fromtimestamp(captured_at - 60, timezone.utc)) == 0
+        assert index.forget_before(datetime.fromtimestamp(captured_at + 60, timezone.utc)) == 1
+    finally:
+        monkeypatch.undo()
+        time.tzset()
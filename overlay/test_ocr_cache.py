@@ -0,0 +1,63 @@
+"""
+The OCR cache and the tracker must tell apart bubbles one character apart.
+
+Bubbles are drawn with cv2.putText the way the game shows them (bright text on
+a dark bubble) and keyed through message_mask like OcrStage.read does.
+
+    python -m pytest overlay
+"""
+import cv2
+import numpy as np
+
+from ocr import NETWORK_SIZE, OcrCache, crop_key, message_mask
+from tracker import BubbleTracker
+
+BOX = (400.0, 300.0, 360.0, 40.0)
+
+
+def render(text, offset=(0, 0)):
+    # A 1920x1088 frame, so network and frame coordinates are the same
+    frame = np.zeros((NETWORK_SIZE[1], NETWORK_SIZE[0], 3), dtype=np.uint8)
+    cv2.putText(frame, text, (240 + offset[0], 305 + offset[1]), cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                (255, 255, 255), 1, cv2.LINE_AA)
+    return frame
+
+
+def key(text, offset=(0, 0), box=BOX):
+    return crop_key(message_mask(render(text, offset), box))
+
+
+def test_one_character_apart_misses_the_cache():
+    cache = OcrCache()
+    for text in ("I am at the plaza now", "lol"):
+        cache.put(key(text), text)
+    assert cache.get(key("I am at the plaza new")) is None
+    assert cache.get(key("lel")) is None
+    assert cache.get(key("I am at the plaza now")) == "I am at the plaza now"
+
+
+def test_jittered_box_hits_the_cache():
+    cache = OcrCache()
+    cache.put(key("I am at the plaza now"), "I am at the plaza now")
+    moved = (BOX[0] + 3, BOX[1] - 2, BOX[2] + 4, BOX[3])
+    assert cache.get(key("I am at the plaza now", box=moved)) == "I am at the plaza now"
+
+
+def test_cache_drops_least_recently_used():
+    cache = OcrCache(capacity=2)
+    cache.put(key("first message"), "first message")
+    cache.put(key("second message"), "second message")
+    cache.get(key("first message"))
+    cache.put(key("third message"), "third message")
+    assert cache.get(key("second message")) is None
+    assert cache.get(key("first message")) == "first message"
+
+
+def test_tracker_restarts_a_bubble_changed_in_place():
+    tracker = BubbleTracker()
+    first, = tracker.update([BOX], 0, render("I am at the plaza now"))
+    first.set_text("I am at the plaza now")
+    second, = tracker.update([BOX], 1, render("I am at the plaza now"))
+    assert second is first and not second.needs_read
+    third, = tracker.update([BOX], 2, render("I am at the plaza new"))
+    assert third is first and third.needs_read and tracker.changes == 1
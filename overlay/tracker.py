@@ -0,0 +1,205 @@
+"""
+Follow chat bubbles from frame to frame, so each one is read and matched once.
+
+A bubble stays on screen for several seconds, and combined.py used to detect,
+OCR and match it again in every frame it appears in. BubbleTracker gives every
+'message' box a Track that follows it across frames: first by overlap with
+the track's last box, then by centre distance for a bubble that grew a line
+or moved with its pony. A track remembers what was read and matched for it:
+
+- a new track, or one whose trimmed crop changed at all (the pony said
+  something else), is OCR'd;
+- a track that was read but not matched yet is matched again only when new
+  chat lines came in, and always against the time it first appeared;
+- a matched chat line is reported once per track.
+
+Tracks that have not been seen for `max_misses` processed frames are dropped.
+
+When other threads read tracks while update() runs (pipeline.py's OCR and
+match stages), they hold `tracker.lock` while touching track fields, and
+compare `track.restarts` with what they saw earlier to notice a bubble that
+was restarted in between.
+
+    tracks = tracker.update(boxes, seen_at, image)
+    unread = [track for track in tracks if track.needs_read]
+    for track, text in zip(unread, ocr.read(image, [track.box for track in unread])):
+        track.set_text(text)
+"""
+import threading
+
+import numpy as np
+
+from nms import box_iou
+from ocr import crop_key, message_mask
+
+
+def crop_signature(image, box):
+    """
+    Exact key of a bubble's mask, as OcrCache keys it, or None.
+    """
+    mask = message_mask(image, box)
+    if mask is None:
+        return None
+    return crop_key(mask)
+
+
+class Track:
+    def __init__(self, track_id, box, seen_at):
+        self.id = track_id
+        self.box = box
+        self.first_seen = seen_at
+        self.last_seen = seen_at
+        self.misses = 0
+        self.signature = None
+        self.restarts = 0
+
+        self.text = None
+        self.reading = False
+        self.entry = None
+        self.matched_revision = None
+        self.reported = set()
+
+    @property
+    def needs_read(self):
+        return self.text is None and not self.reading
+
+    def needs_match(self, revision):
+        """
+        True if the track has text, no match yet, and the chat log changed since it was last tried.
+        """
+        return bool(self.text) and self.entry is None and self.matched_revision != revision
+
+    def set_text(self, text):
+        self.text = text
+        self.reading = False
+
+    def resolve(self, entry, revision=None):
+        """
+        Record the chat line the track was matched to (None if none matched).
+        Returns True the first time this line is matched to this track.
+        """
+        self.matched_revision = revision
+        if entry is None:
+            return False
+        self.entry = entry
+        key = (entry['time'], entry['name'], entry['message'])
+        if key in self.reported:
+            return False
+        self.reported.add(key)
+        return True
+
+    def _restart(self, seen_at):
+        # Same place, different bubble: read it again, but remember what was already reported
+        self.first_seen = seen_at
+        self.restarts += 1
+        self.text = None
+        self.reading = False
+        self.entry = None
+        self.matched_revision = None
+
+
+class BubbleTracker:
+    def __init__(self, iou_threshold=0.3, max_shift=48.0, max_misses=2):
+        """
+        Args:
+            iou_threshold: overlap with a track's last box that continues the track.
+            max_shift: centre distance (network pixels) that still continues a track the overlap missed.
+            max_misses: processed frames a track may go unseen before it is dropped.
+        """
+        self.iou_threshold = iou_threshold
+        self.max_shift = max_shift
+        self.max_misses = max_misses
+
+        self.lock = threading.Lock()
+        self.tracks = []
+        self._next_id = 1
+        self.sightings = 0
+        self.reads = 0
+        self.changes = 0
+
+    def _assign(self, boxes):
+        # Greedy assignment: best overlap first, then nearest centre for what is left
+        assigned = {}
+        if not self.tracks or not len(boxes):
+            return assigned
+        previous = np.array([track.box for track in self.tracks], dtype=np.float64)
+        iou = box_iou(previous, boxes)
+        for t, d in zip(*np.unravel_index(np.argsort(-iou, axis=None, kind="stable"), iou.shape)):
+            if iou[t, d] <= self.iou_threshold:
+                break
+            if t not in assigned.values() and d not in assigned:
+                assigned[d] = t
+
+        distance = np.hypot(previous[:, None, 0] - boxes[None, :, 0], previous[:, None, 1] - boxes[None, :, 1])
+        for t, d in zip(*np.unravel_index(np.argsort(distance, axis=None, kind="stable"), distance.shape)):
+            if distance[t, d] > self.max_shift:
+                break
+            if t not in assigned.values() and d not in assigned:
+                assigned[d] = t
+        return assigned
+
+    def _changed(self, old, new):
+        # Any pixel of the text changing counts: a near match may be a different message
+        return old is not None and new is not None and old != new
+
+    def update(self, boxes, seen_at, image=None):
+        """
+        Continue or start a track for every box of a frame.
+
+        Args:
+            boxes: (center x, center y, width, height) boxes in network space, or a DETECTION_DTYPE array.
+            seen_at: the frame's time, kept as the track's first_seen/last_seen as given.
+            image: the frame, to notice a bubble whose text changed in place. None skips that check.
+
+        Returns:
+            One Track per box, in order.
+        """
+        if isinstance(boxes, np.ndarray) and boxes.dtype.names:
+            boxes = np.stack([boxes[field] for field in ("x", "y", "w", "h")], axis=1)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        # Hashing the crops is the slow part, so it is done before taking the lock
+        signatures = [crop_signature(image, tuple(float(value) for value in box)) if image is not None else None
+                      for box in boxes]
+        with self.lock:
+            return self._update(boxes, seen_at, signatures)
+
+    def _update(self, boxes, seen_at, signatures):
+        assigned = self._assign(boxes)
+
+        tracks = []
+        continued = set()
+        for d, box in enumerate(boxes):
+            box = tuple(float(value) for value in box)
+            signature = signatures[d]
+            if d in assigned:
+                track = self.tracks[assigned[d]]
+                continued.add(assigned[d])
+                track.box = box
+                track.last_seen = seen_at
+                track.misses = 0
+                if self._changed(track.signature, signature):
+                    self.changes += 1
+                    track._restart(seen_at)
+            else:
+                track = Track(self._next_id, box, seen_at)
+                self._next_id += 1
+            if signature is not None:
+                track.signature = signature
+            tracks.append(track)
+
+        survivors = []
+        for t, track in enumerate(self.tracks):
+            if t not in continued:
+                track.misses += 1
+            if track.misses <= self.max_misses:
+                survivors.append(track)
+        self.tracks = survivors + [track for d, track in enumerate(tracks) if d not in assigned]
+
+        self.sightings += len(tracks)
+        self.reads += sum(track.needs_read for track in tracks)
+        return tracks
+
+    def summary(self):
+        share = 100 * self.reads / self.sightings if self.sightings else 0.0
+        return (f"Tracker: {self._next_id - 1} bubbles, {self.reads}/{self.sightings} sightings read "
+                f"({share:.1f}%), {self.changes} changed in place")
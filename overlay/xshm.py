@@ -0,0 +1,176 @@
+"""
+Screen capture straight from the X server through the MIT-SHM extension.
+
+The X server copies the requested rectangle into a System V shared-memory
+segment we own, and the frame comes back as a NumPy view of that segment: no
+subprocess, no temp file and no PNG round trip, unlike pyautogui/pyscreeze's
+scrot path. Only needs libX11 and libXext, loaded through ctypes.
+
+Usage:
+    capture = XShmCapture(':1', region=(0, 0, 1920, 1080))
+    frame = capture.grab()   # height x width x 3 BGR uint8, reused by the next grab()
+"""
+from ctypes import *
+import ctypes.util
+import os
+
+import numpy as np
+
+ZPIXMAP = 2
+ALL_PLANES = c_ulong(~0).value
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+
+
+class XShmSegmentInfo(Structure):
+    _fields_ = [("shmseg", c_ulong),
+                ("shmid", c_int),
+                ("shmaddr", c_void_p),
+                ("readOnly", c_int)]
+
+
+# Only the leading fields of XImage that we read
+class XImage(Structure):
+    _fields_ = [("width", c_int),
+                ("height", c_int),
+                ("xoffset", c_int),
+                ("format", c_int),
+                ("data", c_void_p),
+                ("byte_order", c_int),
+                ("bitmap_unit", c_int),
+                ("bitmap_bit_order", c_int),
+                ("bitmap_pad", c_int),
+                ("depth", c_int),
+                ("bytes_per_line", c_int),
+                ("bits_per_pixel", c_int),
+                ("red_mask", c_ulong),
+                ("green_mask", c_ulong),
+                ("blue_mask", c_ulong)]
+
+
+def _load(name):
+    path = ctypes.util.find_library(name)
+    if path is None:
+        raise OSError(f"lib{name} not found")
+    return CDLL(path)
+
+
+xlib = _load("X11")
+xext = _load("Xext")
+libc = CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+xlib.XOpenDisplay.argtypes = [c_char_p]
+xlib.XOpenDisplay.restype = c_void_p
+xlib.XCloseDisplay.argtypes = [c_void_p]
+xlib.XDefaultScreen.argtypes = [c_void_p]
+xlib.XDefaultScreen.restype = c_int
+xlib.XRootWindow.argtypes = [c_void_p, c_int]
+xlib.XRootWindow.restype = c_ulong
+xlib.XDefaultVisual.argtypes = [c_void_p, c_int]
+xlib.XDefaultVisual.restype = c_void_p
+xlib.XDefaultDepth.argtypes = [c_void_p, c_int]
+xlib.XDefaultDepth.restype = c_int
+xlib.XDisplayWidth.argtypes = [c_void_p, c_int]
+xlib.XDisplayWidth.restype = c_int
+xlib.XDisplayHeight.argtypes = [c_void_p, c_int]
+xlib.XDisplayHeight.restype = c_int
+xlib.XSync.argtypes = [c_void_p, c_int]
+xlib.XFree.argtypes = [c_void_p]
+
+xext.XShmQueryExtension.argtypes = [c_void_p]
+xext.XShmQueryExtension.restype = c_int
+xext.XShmCreateImage.argtypes = [c_void_p, c_void_p, c_uint, c_int, c_void_p, POINTER(XShmSegmentInfo), c_uint, c_uint]
+xext.XShmCreateImage.restype = POINTER(XImage)
+xext.XShmAttach.argtypes = [c_void_p, POINTER(XShmSegmentInfo)]
+xext.XShmAttach.restype = c_int
+xext.XShmDetach.argtypes = [c_void_p, POINTER(XShmSegmentInfo)]
+xext.XShmDetach.restype = c_int
+xext.XShmGetImage.argtypes = [c_void_p, c_ulong, POINTER(XImage), c_int, c_int, c_ulong]
+xext.XShmGetImage.restype = c_int
+
+libc.shmget.argtypes = [c_int, c_size_t, c_int]
+libc.shmget.restype = c_int
+libc.shmat.argtypes = [c_int, c_void_p, c_int]
+libc.shmat.restype = c_void_p
+libc.shmdt.argtypes = [c_void_p]
+libc.shmdt.restype = c_int
+libc.shmctl.argtypes = [c_int, c_int, c_void_p]
+libc.shmctl.restype = c_int
+
+
+class XShmCapture:
+    def __init__(self, display=None, region=None):
+        """
+        Args:
+            display: X display name, defaults to $DISPLAY (":1" in the container).
+            region: (x, y, width, height) to capture, e.g. just the game canvas.
+                    Defaults to the whole screen.
+        """
+        display = display or os.environ.get('DISPLAY', ':1')
+        self.display = xlib.XOpenDisplay(display.encode())
+        if not self.display:
+            raise OSError(f"Cannot open X display {display}")
+        if not xext.XShmQueryExtension(self.display):
+            xlib.XCloseDisplay(self.display)
+            raise OSError(f"X display {display} has no MIT-SHM extension")
+
+        screen = xlib.XDefaultScreen(self.display)
+        self.root = xlib.XRootWindow(self.display, screen)
+        if region is None:
+            region = (0, 0, xlib.XDisplayWidth(self.display, screen), xlib.XDisplayHeight(self.display, screen))
+        self.x, self.y, self.width, self.height = region
+
+        self.segment = XShmSegmentInfo()
+        self.image = xext.XShmCreateImage(
+            self.display, xlib.XDefaultVisual(self.display, screen), xlib.XDefaultDepth(self.display, screen),
+            ZPIXMAP, None, byref(self.segment), self.width, self.height
+        )
+        if not self.image:
+            raise OSError("XShmCreateImage failed")
+
+        image = self.image.contents
+        if image.bits_per_pixel != 32:
+            raise OSError(f"Unsupported X visual: {image.bits_per_pixel} bits per pixel")
+        size = image.bytes_per_line * image.height
+
+        self.segment.shmid = libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+        if self.segment.shmid < 0:
+            raise OSError(get_errno(), "shmget failed")
+        self.segment.shmaddr = libc.shmat(self.segment.shmid, None, 0)
+        if self.segment.shmaddr == c_void_p(-1).value:
+            raise OSError(get_errno(), "shmat failed")
+        image.data = self.segment.shmaddr
+        self.segment.readOnly = 0
+        if not xext.XShmAttach(self.display, byref(self.segment)):
+            raise OSError("XShmAttach failed")
+        xlib.XSync(self.display, 0)
+        # Both sides are attached, so the segment can be marked for removal now;
+        # the kernel frees it once we and the X server detach, even after a crash
+        libc.shmctl(self.segment.shmid, IPC_RMID, None)
+
+        # BGRX rows, possibly padded; expose the BGR part as a view
+        buffer = (c_uint8 * size).from_address(self.segment.shmaddr)
+        raw = np.frombuffer(buffer, dtype=np.uint8).reshape(image.height, image.bytes_per_line)
+        self._bgrx = raw[:, :image.width * 4].reshape(image.height, image.width, 4)
+        self.frame = self._bgrx[:, :, :3]
+
+    def grab(self):
+        """
+        Capture the region and return it as a height x width x 3 BGR view.
+        The same memory is reused by the next grab(); copy it to keep it.
+        """
+        if not xext.XShmGetImage(self.display, self.root, self.image, self.x, self.y, ALL_PLANES):
+            return None
+        return self.frame
+
+    def close(self):
+        if self.display:
+            xext.XShmDetach(self.display, byref(self.segment))
+            xlib.XSync(self.display, 0)
+            self._bgrx = self.frame = None
+            libc.shmdt(self.segment.shmaddr)
+            # The pixel data lives in our segment, so only free the XImage struct itself
+            xlib.XFree(self.image)
+            xlib.XCloseDisplay(self.display)
+            self.display = None
@@ -0,0 +1,482 @@
+"""
+Capture, detect, OCR, match and store chat bubbles in one streaming process.
+
+Without this the stages talk through the filesystem: grabber.py writes PNGs,
+overlay.py polls for them and writes YAML, combined.py OCRs those in a
+separate batch job, and the scraper inserts every chat line with
+POINT(0 0) because nothing ever joins the two sides.
+
+Here every stage is a thread connected to the next by a bounded queue:
+
+    capture -> detect -> OCR -> match -> CoordinateWriter (MariaDB)
+                                  ^
+    chat lines (DevTools) --------+
+
+Capture keeps only the newest frames when detection falls behind, so a slow
+stage costs frames rather than latency. The later queues block, so a bubble
+that was detected is always read and matched. Darknet and Tesseract do their
+work outside the GIL, so the threads really do run in parallel.
+
+The scraper still owns the browser and inserts the chat lines. The pipeline
+follows the same lines over DevTools, finds their bubbles on screen and
+fills in the coordinates of the rows the scraper wrote. The latency from the
+capture of a bubble to its row being updated is measured and reported.
+
+Run from the repository root next to scraper.py, e.g.:
+    python pipeline.py --backend xshm --interval 0.5 --roi 0,80,1920,1000
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+# The overlay modules import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'overlay'))
+
+from chat_stream import ChatStream
+from chatdb import CoordinateWriter
+from chatindex import ChatLogIndex
+from detector import BACKENDS, make_detector
+from framegate import ChangeGate
+from incremental import IncrementalDetector
+from ocr import NETWORK_SIZE, OcrStage
+from roi import parse_region, parse_size
+from tracker import BubbleTracker
+
+
+def ts_print(message):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+def put_latest(q, item):
+    """
+    Put without blocking; when the queue is full the oldest item makes room.
+    Returns True if an item was dropped.
+    """
+    dropped = False
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                q.get_nowait()
+                dropped = True
+            except queue.Empty:
+                pass
+
+
+class Stage(threading.Thread):
+    """
+    Worker thread that takes items from `inbox`, runs `work` on them and puts
+    whatever is not None into `outbox`, blocking while the outbox is full.
+    """
+
+    def __init__(self, name, work, inbox, outbox, stopping, log=ts_print):
+        super().__init__(name=name, daemon=True)
+        self.work = work
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stopping = stopping
+        self.log = log
+        self.processed = 0
+        self.errors = 0
+        self.busy = 0.0
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                item = self.inbox.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            started = time.perf_counter()
+            try:
+                result = self.work(item)
+            except Exception as e:
+                self.errors += 1
+                self.log(f"[{self.name}] {type(e).__name__}: {e}")
+                continue
+            finally:
+                self.busy += time.perf_counter() - started
+            self.processed += 1
+            if result is not None and self.outbox is not None:
+                self._put(result)
+
+    def _put(self, item):
+        while not self.stopping.is_set():
+            try:
+                self.outbox.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+
+class LatencyStats:
+    def __init__(self, size=2000):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self.size = size
+
+    def record(self, name, seconds):
+        with self._lock:
+            samples = self._samples.setdefault(name, [])
+            samples.append(seconds)
+            del samples[:-self.size]
+
+    def percentiles(self, name):
+        """
+        (p50, p95, max) in seconds over the most recent samples, or None.
+        """
+        with self._lock:
+            samples = list(self._samples.get(name, ()))
+        if not samples:
+            return None
+        p50, p95 = np.percentile(samples, [50, 95])
+        return p50, p95, max(samples)
+
+
+class Pipeline:
+    def __init__(self, args):
+        self.args = args
+        self.stopping = threading.Event()
+        self.latency = LatencyStats()
+
+        if args.incremental:
+            # Only the tiles that changed since they were last detected go through the network
+            self.detector = IncrementalDetector(
+                args.config_file, args.data_file, args.weights,
+                thresh=args.thresh,
+                roi=parse_region(args.roi),
+                tile=parse_size(args.tile),
+                tile_overlap=args.tile_overlap,
+                refresh_every=args.refresh_every,
+                backend=args.detector,
+                threads=args.detector_threads
+            )
+        else:
+            self.detector = make_detector(
+                args.config_file, args.data_file, args.weights,
+                backend=args.detector,
+                threads=args.detector_threads,
+                socket_path=args.detector_socket,
+                thresh=args.thresh,
+                roi=parse_region(args.roi),
+                tile=parse_size(args.tile),
+                tile_overlap=args.tile_overlap
+            )
+        self.message_class = self.detector.class_names.index('message')
+        self.gate = ChangeGate(threshold=args.gate_threshold, log=ts_print) if args.gate_threshold > 0 else None
+        self.ocr = OcrStage(threads=args.ocr_threads, cache_size=args.ocr_cache)
+        # Bubbles followed across frames, so one is only read again when its text changes
+        self.tracker = BubbleTracker(max_misses=args.track_misses)
+        self.chat_index = ChatLogIndex(window_seconds=args.window_seconds)
+        # Screen offset of the captured region, so coordinates are in screen pixels
+        region = parse_region(args.region)
+        self.origin = region[:2] if region else (0, 0)
+
+        self.writer = None
+        if not args.dry_run:
+            from scraper import db_config
+            self.writer = CoordinateWriter(db_config, on_written=self._written, log=ts_print).start()
+
+        # Bubbles already located, so one bubble on screen for ten frames is written once
+        self.located = {}
+        self.frames_dropped = 0
+
+        self.frames = queue.Queue(maxsize=2)
+        self.detected = queue.Queue(maxsize=4)
+        self.read = queue.Queue(maxsize=4)
+        self.chat_lines = queue.Queue(maxsize=10000)
+        self.stages = [
+            Stage('detect', self.detect, self.frames, self.detected, self.stopping),
+            Stage('ocr', self.recognize, self.detected, self.read, self.stopping),
+            Stage('match', self.match, self.read, None, self.stopping),
+        ]
+        self.sources = [
+            threading.Thread(target=self.capture, name='capture', daemon=True),
+            threading.Thread(target=self.follow_chat, name='chat', daemon=True),
+        ]
+
+    # Sources
+
+    def _frame_source(self):
+        # Yields (capture time, BGR frame) at the capture interval
+        args = self.args
+        if args.ring:
+            from framering import FrameRing
+            ring = None
+            last_seq = 0
+            try:
+                while not self.stopping.is_set():
+                    if ring is None or ring.retired:
+                        # Not created yet, or grabber.py replaced it (new frame size, restart)
+                        if ring is not None:
+                            ring.close()
+                        ring, last_seq = FrameRing.wait_attach(args.ring, timeout=1), 0
+                        if ring is None:
+                            continue
+                        ts_print(f"Reading frames from ring '{args.ring}'")
+                    entry = ring.wait_newer(last_seq, timeout=1)
+                    if entry is None:
+                        continue
+                    last_seq, timestamp, frame = entry
+                    # The ring slot is reused by the grabber, so the frame has to be copied out
+                    copy = frame.copy()
+                    if ring.is_current(last_seq):
+                        yield timestamp, copy
+            finally:
+                if ring is not None:
+                    ring.close()
+            return
+
+        from grabber import make_frame_source, sleep_until_next
+        grab = make_frame_source(args.backend, parse_region(args.region), ['Pony Town', 'Mozilla Firefox'])
+        while not self.stopping.is_set():
+            started = time.monotonic()
+            frame = grab()
+            if frame is not None:
+                yield time.time(), frame
+            sleep_until_next(started, args.interval)
+
+    def capture(self):
+        try:
+            for frame_id, (captured_at, image) in enumerate(self._frame_source()):
+                frame = {'id': frame_id, 'captured_at': captured_at, 'shape': image.shape, 'image': image}
+                if put_latest(self.frames, frame):
+                    self.frames_dropped += 1
+        except Exception as e:
+            ts_print(f"[capture] {type(e).__name__}: {e}; stopping")
+            self.stopping.set()
+
+    def follow_chat(self):
+        """
+        Feed chat lines from the page's DevTools binding into the match stage,
+        reconnecting when the connection drops and replaying the lines missed meanwhile.
+        """
+        # One stream across reconnects, so it can replay what the page showed in between
+        stream = ChatStream(port=self.args.devtools_port, log=lambda message: ts_print(f"[chat] {message}"))
+        while not self.stopping.is_set():
+            try:
+                if not stream.connected:
+                    stream.connect()
+                    ts_print("Following chat lines over DevTools.")
+                for line in stream.lines(idle_timeout=1.0):
+                    if self.stopping.is_set():
+                        break
+                    if line is not None:
+                        put_latest(self.chat_lines, line)
+            except Exception as e:
+                ts_print(f"[chat] DevTools chat stream failed: {e}; reconnecting in 5 seconds...")
+                stream.close()
+                self.stopping.wait(5)
+        stream.close()
+
+    # Stages
+
+    def detect(self, frame):
+        image = frame['image']
+        if self.gate is not None and not self.gate.check(image):
+            return None
+        array = self.detector.detect(image)
+        messages = array[array['class_id'] == self.message_class]
+        tracks = self.tracker.update(messages, datetime.fromtimestamp(frame['captured_at'], timezone.utc), image)
+        if not tracks:
+            return None
+        # The tracks move on with the next frame, so the later stages get this frame's boxes
+        with self.tracker.lock:
+            frame['tracks'] = [(track, track.box) for track in tracks]
+            frame['unread'] = [(track, track.box, track.restarts) for track in tracks if track.needs_read]
+            for track, _, _ in frame['unread']:
+                track.reading = True
+        return frame
+
+    def recognize(self, frame):
+        unread = frame['unread']
+        try:
+            texts = self.ocr.read(frame['image'], [box for _, box, _ in unread])
+        except Exception:
+            # Let the next frame try these bubbles again
+            with self.tracker.lock:
+                for track, _, restarts in unread:
+                    if track.restarts == restarts:
+                        track.reading = False
+            raise
+        with self.tracker.lock:
+            for (track, _, restarts), text in zip(unread, texts):
+                # A bubble that changed while it was read is read again from a newer frame
+                if track.restarts == restarts:
+                    track.set_text(text)
+        # Matching only needs the text, so the frame can go
+        frame['image'] = None
+        return frame
+
+    def match(self, frame):
+        lines = []
+        while True:
+            try:
+                lines.append(self.chat_lines.get_nowait())
+            except queue.Empty:
+                break
+        self.chat_index.add(lines)
+
+        when = datetime.fromtimestamp(frame['captured_at'], timezone.utc)
+        height, width = frame['shape'][:2]
+        scale_x, scale_y = width / NETWORK_SIZE[0], height / NETWORK_SIZE[1]
+        located = []
+        for track, (x, y, _, _) in frame['tracks']:
+            revision = self.chat_index.revision
+            # The detect stage may restart the track meanwhile, so match a snapshot of it
+            with self.tracker.lock:
+                if not track.needs_match(revision):
+                    continue
+                text, first_seen, restarts = track.text, track.first_seen, track.restarts
+            # Matched against when the bubble appeared, which may be several frames ago
+            entry = self.chat_index.match(text, first_seen)
+            with self.tracker.lock:
+                if track.restarts != restarts or not track.resolve(entry, revision):
+                    continue
+            key = (entry['time'], entry['name'], entry['message'])
+            if key in self.located:
+                continue
+            self.located[key] = frame['captured_at']
+            now = time.time()
+            self.latency.record('match', now - frame['captured_at'])
+            located.append({
+                'message': entry['message'], 'name': entry['name'], 'time': entry['time'],
+                'coordinates': (round(self.origin[0] + x * scale_x), round(self.origin[1] + y * scale_y)),
+                'captured_at': frame['captured_at'], 'located_at': now,
+            })
+            ts_print(f"{entry['name']} says {entry['message']} at {located[-1]['coordinates']} "
+                     f"(score {entry['score']:.2f})")
+
+        if located and self.writer is not None:
+            self.writer.add(located)
+        self._forget(when)
+        return None
+
+    def _forget(self, when):
+        # Lines and bubbles older than the match window can never match again
+        horizon = when - timedelta(seconds=2 * self.args.window_seconds)
+        self.chat_index.forget_before(horizon)
+        cutoff = horizon.timestamp()
+        for key in [key for key, seen_at in self.located.items() if seen_at < cutoff]:
+            del self.located[key]
+
+    def _written(self, lines):
+        now = time.time()
+        for line in lines:
+            self.latency.record('db', now - line['captured_at'])
+
+    # Control
+
+    def report(self):
+        stages = ", ".join(f"{stage.name} {stage.processed}" + (f" ({stage.errors} errors)" if stage.errors else "")
+                           for stage in self.stages)
+        queues = (f"frames {self.frames.qsize()}/{self.frames.maxsize}, "
+                  f"detected {self.detected.qsize()}/{self.detected.maxsize}, "
+                  f"read {self.read.qsize()}/{self.read.maxsize}")
+        ts_print(f"Stages: {stages}; queues: {queues}; {self.frames_dropped} frames dropped")
+        ts_print(self.ocr.summary())
+        ts_print(self.tracker.summary())
+        if self.args.incremental:
+            ts_print(self.detector.summary())
+        if self.writer is not None:
+            ts_print(f"Coordinates written for {self.writer.written} lines, {self.writer.pending()} waiting "
+                     f"for their row, {self.writer.expired} gave up")
+        for name, label in (('match', 'capture -> match'), ('db', 'capture -> DB row')):
+            percentiles = self.latency.percentiles(name)
+            if percentiles is None:
+                continue
+            p50, p95, worst = percentiles
+            ts_print(f"Latency {label}: p50 {p50:.2f}s, p95 {p95:.2f}s, max {worst:.2f}s")
+            if name == 'db' and p95 > self.args.latency_budget:
+                ts_print(f"Warning: p95 latency {p95:.2f}s is over the {self.args.latency_budget:.1f}s budget")
+
+    def run(self):
+        for thread in self.stages + self.sources:
+            thread.start()
+        try:
+            while not self.stopping.wait(self.args.report_interval):
+                self.report()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        self.stopping.set()
+        for thread in self.stages + self.sources:
+            thread.join(timeout=5)
+        self.report()
+        if self.writer is not None:
+            self.writer.close()
+        self.ocr.close()
+        self.detector.close()
+
+
+def parser():
+    parser = argparse.ArgumentParser(description="Streaming capture -> detect -> OCR -> match -> DB pipeline")
+    parser.add_argument("--ring", type=str, default=None,
+                        help="read frames from grabber.py's shared-memory ring instead of capturing them here")
+    parser.add_argument("--backend", choices=['pyautogui', 'xshm'], default='xshm',
+                        help="how to capture the screen when not reading a ring")
+    parser.add_argument("--region", type=str, default=None,
+                        help="x,y,width,height of the screen area to capture (e.g. the game canvas)")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between captures")
+    parser.add_argument("--weights", default="screenshots/screenshots_best.weights", help="yolo weights path")
+    parser.add_argument("--config_file", default="screenshots/screenshots.cfg", help="path to config file")
+    parser.add_argument("--data_file", default="screenshots/screenshots.data", help="path to data file")
+    parser.add_argument("--thresh", type=float, default=.25, help="remove detections with lower confidence")
+    parser.add_argument("--roi", type=str, default=None,
+                        help="x,y,width,height of the frame to detect in, or 'auto' to learn it from detections")
+    parser.add_argument("--tile", type=str, default=None,
+                        help="WIDTHxHEIGHT tiles to split the region into at native resolution")
+    parser.add_argument("--tile_overlap", type=int, default=160, help="minimum overlap between tiles in pixels")
+    parser.add_argument("--detector", choices=BACKENDS, default='darknet',
+                        help="run the network with libdarknet or with OpenCV's DNN module (no Darknet build needed)")
+    parser.add_argument("--detector_threads", type=int, default=None,
+                        help="CPU threads for the opencv detector (default: OpenCV's choice)")
+    parser.add_argument("--detector_socket", default=None,
+                        help="socket of the detectord to use with --detector daemon (default /tmp/pwn-detector.sock)")
+    parser.add_argument("--incremental", action='store_true',
+                        help="keep every tile's detections and re-detect only the tiles that changed (needs --tile)")
+    parser.add_argument("--refresh_every", type=int, default=30,
+                        help="with --incremental, detect every tile every this many frames (0 = never)")
+    parser.add_argument("--gate_threshold", type=float, default=6.0,
+                        help="skip frames whose tiles changed less than this mean grey level (0 processes every frame)")
+    parser.add_argument("--ocr_threads", type=int, default=4, help="bubbles OCR'd in parallel")
+    parser.add_argument("--ocr_cache", type=int, default=2048, help="bubble crops remembered by hash (0 disables)")
+    parser.add_argument("--track_misses", type=int, default=2,
+                        help="detected frames a bubble may be missing from before it is read again as new")
+    parser.add_argument("--window_seconds", type=float, default=10,
+                        help="how far a chat line's time may be from the frame it is matched in")
+    parser.add_argument("--devtools_port", type=int, default=9222, help="Chrome remote debugging port of the scraper")
+    parser.add_argument("--latency_budget", type=float, default=3.0,
+                        help="warn when the p95 capture-to-DB latency exceeds this many seconds")
+    parser.add_argument("--report_interval", type=float, default=30.0, help="seconds between status reports")
+    parser.add_argument("--dry_run", action='store_true', help="print matches without writing to the database")
+    args = parser.parse_args()
+    if args.incremental and args.tile is None:
+        parser.error("--incremental needs --tile")
+    if args.incremental and args.detector == 'daemon':
+        parser.error("--incremental runs its own network, it cannot use --detector daemon")
+    if args.detector == 'daemon':
+        # detectord runs the network with its own settings, these would be silently ignored
+        given = [f"--{name}" for name in ('thresh', 'roi', 'tile', 'tile_overlap') if getattr(args, name) != parser.get_default(name)]
+        if given:
+            parser.error(f"{', '.join(given)} must be set on detectord.py, not with --detector daemon")
+    return args
+
+
+def main():
+    args = parser()
+    Pipeline(args).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,13 @@ import platform
 import os
 import json
 import time
-import mysql.connector
+import atexit
+import argparse
+import itertools
+import hashlib
+from contextlib import contextmanager
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -15,6 +21,9 @@ from selenium.common.exceptions import (
     TimeoutException
 )
 import sys
+from chatdb import ChatLineWriter
+from chat_stream import ChatStream
+from chat_dedup import ChatDedupIndex
 
 def ts_print(message, flush=True):
     """
@@ -24,50 +33,132 @@ def ts_print(message, flush=True):
     print(f"[{now}] {message}", flush=flush)
 
 
-def setup_pony_town(driver):
+PLAY_BUTTON_XPATH = "//button[contains(@class, 'btn-success') and contains(., 'Play')]"
+SETTINGS_MARKER_KEY = 'pwn-settings-hash'
+SETTINGS_BUTTON_XPATH = "//ui-button[@title='Settings']"
+# Part of the game UI that "Toggle showing game UI" hides
+GAME_UI_SELECTOR = 'chat-box'
+default_settings_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pony-town-settings.json")
+
+
+@contextmanager
+def timed_step(name, log=ts_print):
+    """
+    Log how long a setup step took.
+    """
+    start = time.monotonic()
+    yield
+    log(f"Step '{name}' took {time.monotonic() - start:.2f}s")
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def probe_setup_state(driver, cookies):
+    """
+    One quick look at what a (possibly warm) browser profile already has:
+    whether our cookies are present, which settings file was last applied and
+    whether the game UI is shown (only meaningful once the game has loaded).
+    """
+    present = {cookie['name'] for cookie in driver.get_cookies()}
+    return {
+        'cookies_loaded': bool(cookies) and all(cookie['name'] in present for cookie in cookies),
+        'settings_hash': driver.execute_script(f"return window.localStorage.getItem('{SETTINGS_MARKER_KEY}');"),
+        'game_ui_visible': any(element.is_displayed()
+                               for element in driver.find_elements(By.CSS_SELECTOR, GAME_UI_SELECTOR)),
+    }
+
+
+def setup_pony_town(driver, cookies_path='cookies.json', server=None, log=ts_print,
+                    settings_path=default_settings_path):
     """
     Perform all the steps needed to get from a blank browser session
     into the Pony Town game with the desired settings.
+    Steps a warm browser profile has already done (cookies, settings upload,
+    hiding the game UI) are skipped, so retries and restarts only redo what is missing.
     If *anything* fails, raise an exception to indicate we should retry.
     """
-    driver.get('https://pony.town')
+    setup_start = time.monotonic()
+    with timed_step("open pony.town", log):
+        driver.get('https://pony.town')
 
-    # Load cookies from JSON
-    if os.path.exists('cookies.json'):
-        with open('cookies.json', 'r') as f:
+    cookies = []
+    if os.path.exists(cookies_path):
+        with open(cookies_path, 'r') as f:
             cookies = json.load(f)
-        for cookie in cookies:
-            if 'sameSite' in cookie and cookie['sameSite'] not in ["Strict", "Lax", "None"]:
-                cookie['sameSite'] = 'None'
-            driver.add_cookie(cookie)
-
-    # Go to the main page
-    driver.get('https://pony.town/')
-
-    # Close update panel if present
-    try:
-        close_button = WebDriverWait(driver, 10).until(
+    settings_hash = file_digest(settings_path)
+    state = probe_setup_state(driver, cookies)
+
+    # Load cookies from JSON, unless the profile still has them
+    if cookies and not state['cookies_loaded']:
+        with timed_step("load cookies", log):
+            for cookie in cookies:
+                if 'sameSite' in cookie and cookie['sameSite'] not in ["Strict", "Lax", "None"]:
+                    cookie['sameSite'] = 'None'
+                driver.add_cookie(cookie)
+
+            # Go to the main page
+            driver.get('https://pony.town/')
+    elif cookies:
+        log("Cookies already in the browser profile; skipping.")
+
+    with timed_step("start page", log):
+        # Wait until the start page is up, then close the update panel if it is there
+        WebDriverWait(driver, 20).until(EC.any_of(
+            EC.element_to_be_clickable((By.XPATH, PLAY_BUTTON_XPATH)),
             EC.element_to_be_clickable((By.CLASS_NAME, 'btn-close'))
+        ))
+        close_buttons = driver.find_elements(By.CLASS_NAME, 'btn-close')
+        if close_buttons and close_buttons[0].is_displayed():
+            close_buttons[0].click()
+            try:
+                # Let the panel go away before clicking what is behind it
+                WebDriverWait(driver, 5).until(EC.staleness_of(close_buttons[0]))
+            except TimeoutException:
+                pass
+            log("Closed the update panel.")
+        else:
+            log("Update panel not found; proceeding.")
+
+        if server:
+            select_server(driver, server, log)
+
+    with timed_step("play", log):
+        # Click "Play" button
+        play_button = WebDriverWait(driver, 20).until(
+            EC.element_to_be_clickable((By.XPATH, PLAY_BUTTON_XPATH))
         )
-        close_button.click()
-        ts_print("Closed the update panel.")
-    except Exception:
-        ts_print("Update panel not found; proceeding.")
+        play_button.click()
+        log("Clicked Play")
+
+    if state['settings_hash'] != settings_hash:
+        with timed_step("upload settings", log):
+            upload_settings(driver, settings_path, log)
+            driver.execute_script(
+                f"window.localStorage.setItem('{SETTINGS_MARKER_KEY}', arguments[0]);", settings_hash
+            )
+    else:
+        log("Settings already applied in the browser profile; skipping upload.")
 
-    time.sleep(2)
+    with timed_step("hide game UI", log):
+        # The menu entry flips the UI, so a profile that kept it hidden must not be toggled again
+        WebDriverWait(driver, 15).until(EC.element_to_be_clickable((By.XPATH, SETTINGS_BUTTON_XPATH)))
+        if probe_setup_state(driver, cookies)['game_ui_visible']:
+            toggle_game_ui(driver, log)
+        else:
+            log("Game UI already hidden in the browser profile; skipping.")
 
-    # Click "Play" button
-    play_button = WebDriverWait(driver, 20).until(
-        EC.element_to_be_clickable((By.XPATH, "//button[contains(@class, 'btn-success') and contains(., 'Play')]"))
-    )
-    play_button.click()
-    ts_print("Clicked Play")
+    log(f"Setup took {time.monotonic() - setup_start:.2f}s")
+    log("Setup completed successfully. (Starting grabber now)")
 
-    # Wait a bit for the world to load
-    time.sleep(3)
 
-    # Example: click settings
-    ts_print("Going to click settings now...")
+def upload_settings(driver, settings_path=default_settings_path, log=ts_print):
+    """
+    Import a settings file through the game's settings dialog.
+    """
+    log("Going to click settings now...")
     # time.sleep(7)
     found_settings = False
 
@@ -81,7 +172,7 @@ def setup_pony_town(driver):
             found_settings = True
             break
         except StaleElementReferenceException:
-            ts_print("StaleElementReferenceException: Re-locating settings_button and retrying...")
+            log("StaleElementReferenceException: Re-locating settings_button and retrying...")
 
     if not found_settings:
         raise Exception("Could not click 'Settings' even after multiple retries.")
@@ -97,13 +188,13 @@ def setup_pony_town(driver):
                 "//a[@title='Open game settings' and contains(@class, 'dropdown-item')]"
             )
             settings_link.click()
-            ts_print("Clicked settings link")
+            log("Clicked settings link")
             found_link = True
             break
         except StaleElementReferenceException:
-            ts_print("StaleElementReferenceException: trying to click open settings again")
+            log("StaleElementReferenceException: trying to click open settings again")
         except NoSuchElementException:
-            ts_print("NoSuchElementException: trying again")
+            log("NoSuchElementException: trying again")
 
     if not found_link:
         raise Exception("Could not click 'Open game settings' even after multiple retries.")
@@ -113,93 +204,85 @@ def setup_pony_town(driver):
         EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='file']"))
     )
     # time.sleep(1)
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    file_path = os.path.join(current_dir, "pony-town-settings.json")
-    file_input.send_keys(file_path)
-    ts_print("Pony Town settings file sent")
+    file_input.send_keys(os.path.abspath(settings_path))
+    log("Pony Town settings file sent")
 
     ok_button = WebDriverWait(driver, 20).until(
         EC.element_to_be_clickable((By.XPATH, "//button[@class='btn btn-wide btn-outline-secondary ms-2' and contains(text(), 'OK')]"))
     )
     ok_button.click()
-    ts_print("OK button clicked")
+    log("OK button clicked")
 
-    # time.sleep(2)
 
-    # Attempt to toggle the UI off
+def toggle_game_ui(driver, log=ts_print):
+    """
+    Turn the game UI off through the settings menu so screenshots only show the world.
+    """
     for attempt in range(3):
         try:
             settings_button = WebDriverWait(driver, 15).until(
-                EC.element_to_be_clickable((By.XPATH, "//ui-button[@title='Settings']"))
+                EC.element_to_be_clickable((By.XPATH, SETTINGS_BUTTON_XPATH))
             )
             settings_button.click()
             break
         except StaleElementReferenceException:
-            ts_print("StaleElementReferenceException: Re-locating settings_button and retrying...")
+            log("StaleElementReferenceException: Re-locating settings_button and retrying...")
         except Exception as e:
-            ts_print(f"the exception was {e}")
+            log(f"the exception was {e}")
 
     # time.sleep(2)
 
     uitoggle = driver.find_element(By.XPATH, "//a[@title='Toggle showing game UI' and contains(@class, 'dropdown-item')]")
     uitoggle.click()
-    ts_print("UI Disabled")
+    log("UI Disabled")
 
-    time.sleep(2)
-        
     for attempt in range(3):
         try:
             settings_button = WebDriverWait(driver, 15).until(
-                EC.element_to_be_clickable((By.XPATH, "//ui-button[@title='Settings']"))
+                EC.element_to_be_clickable((By.XPATH, SETTINGS_BUTTON_XPATH))
             )
             settings_button.click()
             break
         except StaleElementReferenceException:
-            ts_print("StaleElementReferenceException: Re-locating settings_button and retrying...")
+            log("StaleElementReferenceException: Re-locating settings_button and retrying...")
 
-    ts_print("Setup completed successfully. (Starting grabber now)")
 
+def select_server(driver, server, log=ts_print):
+    """
+    Pick a server by name from the server dropdown on the start page.
+    """
+    toggle = WebDriverWait(driver, 10).until(
+        EC.element_to_be_clickable((By.XPATH, "//*[contains(@class, 'server')]//button[contains(@class, 'dropdown-toggle')]"))
+    )
+    toggle.click()
+    option = WebDriverWait(driver, 10).until(
+        EC.element_to_be_clickable((By.XPATH, f"//*[contains(@class, 'dropdown-item') and contains(., '{server}')]"))
+    )
+    option.click()
+    log(f"Selected server {server}")
 
-############################################
-# Driver setup (just like your original code)
-if platform.system() == 'Linux':
-    from selenium.webdriver.chrome.service import Service
-    from selenium.webdriver.chrome.options import Options
 
-    chrome_driver_path = '/usr/bin/chromedriver'  # Adjust path if needed
-    chrome_options = Options()
-    # chrome_options.add_argument("--headless") 
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--remote-debugging-port=9222")
-    chrome_options.add_argument("--display=:1")
+def walk_to_position(driver, moves, log=ts_print):
+    """
+    Walk the pony to its spot after spawning.
+    `moves` is a list of [key, seconds] pairs, e.g. [["d", 1.5], ["w", 0.5]].
+    """
+    for key, seconds in moves:
+        actions = ActionChains(driver)
+        actions.key_down(key).pause(seconds).key_up(key)
+        actions.perform()
+    log(f"Walked to position ({len(moves)} moves)")
 
-    service = Service(chrome_driver_path)
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    driver.set_window_size(1920, 1080)
-else:
-    driver = webdriver.Firefox()
-
-############################################
-# 1) Attempt the setup, retry if there's an exception
-while True:
-    try:
-        setup_pony_town(driver)
-        break  # If we got here, the setup succeeded; break the retry loop
-    except Exception as e:
-        ts_print(f"Setup failed with exception: {e}")
-        ts_print("Re-navigating to pony.town and retrying setup in 5 seconds...")
-        time.sleep(5)
-        driver.get("https://pony.town")
-
-############################################
-# 2) Once setup is complete, run your main loop
-ts_print("Now entering the main chat-collecting loop...")
 
 # JavaScript code for the mutation observer
 mutation_observer_script = """
 const chatLines = [];
+// The last lines shown, for DevTools clients to replay after they reconnect
+const RECENT_LIMIT = 500;
+const recentLines = [];
+// Microseconds since the epoch, so sequence numbers keep increasing if the page is reloaded
+const startedAt = Date.now() * 1000;
+let lastSeq = startedAt;
 const observer = new MutationObserver((mutations) => {
     mutations.forEach((mutation) => {
         mutation.addedNodes.forEach((node) => {
@@ -213,7 +296,18 @@ const observer = new MutationObserver((mutations) => {
                 let message = node.querySelector('.chat-line-message').innerHTML;
                 message = message.replace(/<img[^>]*alt="([^"]*)"[^>]*>/g, (match, alt) => alt);
 
-                chatLines.push({ time, name, message });
+                lastSeq = Math.max(lastSeq + 1, Date.now() * 1000);
+                const line = { seq: lastSeq, time, name, message };
+                recentLines.push(line);
+                if (recentLines.length > RECENT_LIMIT) {
+                    recentLines.shift();
+                }
+                // Push straight to the scraper when its DevTools binding is installed
+                if (typeof window.pwnChatLine === 'function') {
+                    window.pwnChatLine(JSON.stringify(line));
+                } else {
+                    chatLines.push(line);
+                }
             }
         });
     });
@@ -224,14 +318,12 @@ window.getChatLines = () => {
     chatLines.length = 0;
     return collectedLines;
 };
+window.getChatLinesSince = (seq) => ({
+    lines: recentLines.filter((line) => line.seq > seq),
+    // False when lines after `seq` fell out of recentLines or came before this observer started
+    complete: seq >= startedAt && (recentLines.length < RECENT_LIMIT || recentLines[0].seq <= seq),
+});
 """
-driver.execute_script(mutation_observer_script)
-
-def press_key(key):
-    actions = ActionChains(driver)
-    actions.send_keys(key)
-    actions.perform()
-    ts_print(f'Pressed {key}')
 
 interval_duration = 9 * 60
 check_interval = 15
@@ -243,68 +335,277 @@ db_config = {
     'database': 'mydatabase'
 }
 
-def remove_duplicates(new_chat_lines, existing_chat_lines):
-    existing_set = {json.dumps(line) for line in existing_chat_lines}
-    return [line for line in new_chat_lines if json.dumps(line) not in existing_set]
-
-def insert_chat_lines_to_db(chat_lines):
-    try:
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor()
-        for line in chat_lines:
-            cursor.execute("""
-                INSERT INTO messages (content, sender, timestamp, coordinates)
-                VALUES (%s, %s, %s, ST_GeomFromText(%s))
-            """, (line['message'], line['name'], line['time'], 'POINT(0 0)'))
-        connection.commit()
-    except mysql.connector.Error as err:
-        ts_print(f"Error: {err}")
-    finally:
-        if 'connection' in locals() and connection.is_connected():
-            cursor.close()
-            connection.close()
-
-
-############################################
-# 3) The final loop for pressing keys, checking lines, etc.
-while True:
-    # Alternate between pressing '2' and '3'
-    for key in ['2', '3']:
-        # 9-minute loop
-        for _ in range(0, interval_duration, check_interval):
+
+def clear_profile_locks(profile_dir):
+    """
+    Remove Chromium's "profile in use" lock files left behind by a killed
+    browser or a previous container, which would otherwise refuse the profile.
+    """
+    for name in ('SingletonLock', 'SingletonCookie', 'SingletonSocket'):
+        path = os.path.join(profile_dir, name)
+        if os.path.lexists(path):
+            os.remove(path)
+
+
+def make_driver(debugging_port=9222, headless=False, profile_dir=None):
+    """
+    Start a browser. On Linux this is Chromium with a DevTools port; headless
+    sessions skip the Xvfb display entirely. With `profile_dir` the browser
+    keeps its cookies and local storage between runs (a warm start).
+    Returns the driver and the debugging port (None for Firefox).
+    """
+    if platform.system() != 'Linux':
+        return webdriver.Firefox(), None
+
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_driver_path = '/usr/bin/chromedriver'  # Adjust path if needed
+    chrome_options = Options()
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument(f"--remote-debugging-port={debugging_port}")
+    if profile_dir:
+        profile_dir = os.path.abspath(profile_dir)
+        os.makedirs(profile_dir, exist_ok=True)
+        clear_profile_locks(profile_dir)
+        chrome_options.add_argument(f"--user-data-dir={profile_dir}")
+    if headless:
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--window-size=1920,1080")
+        chrome_options.add_argument("--mute-audio")
+        chrome_options.add_argument("--disable-extensions")
+        # Keep the game rendering chat even though nobody is looking at it
+        chrome_options.add_argument("--disable-background-timer-throttling")
+        chrome_options.add_argument("--disable-renderer-backgrounding")
+        chrome_options.add_argument("--disable-backgrounding-occluded-windows")
+    else:
+        chrome_options.add_argument("--display=:1")
+
+    service = Service(chrome_driver_path)
+    driver = webdriver.Chrome(service=service, options=chrome_options)
+    driver.set_window_size(1920, 1080)
+    return driver, debugging_port
+
+
+class ScraperSession:
+    """
+    One browser logged into Pony Town, collecting chat into the shared
+    DB writer and dedup index.
+    """
+
+    def __init__(self, name, cookies='cookies.json', server=None, position=None,
+                 debugging_port=9222, headless=False, profile_dir=None):
+        self.name = name
+        self.cookies = cookies
+        self.server = server
+        self.position = position or []
+        self.debugging_port = debugging_port
+        self.headless = headless
+        self.profile_dir = profile_dir
+        self.driver = None
+        self.started_at = None
+
+    def log(self, message):
+        ts_print(f"[{self.name}] {message}")
+
+    def start(self):
+        """
+        Launch the browser and get into the game, retrying until it works.
+        """
+        self.started_at = time.monotonic()
+        with timed_step("launch browser", self.log):
+            self.driver, self.debugging_port = make_driver(self.debugging_port, self.headless, self.profile_dir)
+
+        # 1) Attempt the setup, retry if there's an exception
+        while True:
+            try:
+                setup_pony_town(self.driver, self.cookies, self.server, log=self.log)
+                break  # If we got here, the setup succeeded; break the retry loop
+            except Exception as e:
+                self.log(f"Setup failed with exception: {e}")
+                self.log("Re-navigating to pony.town and retrying setup in 5 seconds...")
+                time.sleep(5)
+                self.driver.get("https://pony.town")
+
+        if self.position:
+            walk_to_position(self.driver, self.position, log=self.log)
+
+        # 2) Once setup is complete, hook the chat
+        self.driver.execute_script(mutation_observer_script)
+        return self
+
+    def press_key(self, key):
+        actions = ActionChains(self.driver)
+        actions.send_keys(key)
+        actions.perform()
+        self.log(f'Pressed {key}')
+
+    def poll_chat_lines(self):
+        """
+        Ask the page for the lines it buffered since the last call,
+        every `check_interval` seconds.
+        """
+        while True:
             # We wrap execute_script in a try/except to handle TimeoutException
             try:
-                chat_lines = driver.execute_script("return window.getChatLines();")
+                yield self.driver.execute_script("return window.getChatLines();")
             except TimeoutException:
-                ts_print("Script timeout encountered. Possibly 'Play' reappeared.")
-                chat_lines = []
+                self.log("Script timeout encountered. Possibly 'Play' reappeared.")
+                yield []
+            time.sleep(check_interval)
 
-            if not chat_lines:
-                # If no chat lines, let's see if "Play" reappeared
-                ts_print("No chat lines found. Checking 'Play' button...")
+    def stream_chat_lines(self):
+        """
+        Yield each chat line (as a one-item list) the moment the page pushes it
+        over DevTools, or an empty list after a second without chat.
+        Reconnects on its own if the DevTools connection drops.
+        """
+        # One stream across reconnects, so it can replay what the page showed in between
+        stream = ChatStream(port=self.debugging_port, log=self.log)
+        while True:
+            try:
+                if not stream.connected:
+                    stream.connect()
+                    self.log("Streaming chat lines over DevTools.")
+                    # Pick up anything the page buffered while we were not connected
+                    yield self.driver.execute_script("return window.getChatLines();") or []
+                for line in stream.lines(idle_timeout=1.0):
+                    yield [line] if line is not None else []
+            except Exception as e:
+                self.log(f"DevTools chat stream failed: {e}; reconnecting in 5 seconds...")
+                stream.close()
+                time.sleep(5)
+                yield []
+
+    def run(self, chat_writer, dedup_index, poll=False):
+        """
+        3) The final loop for pressing keys, checking lines, etc.
+        """
+        self.log("Now entering the main chat-collecting loop...")
+        if poll or self.debugging_port is None:
+            chat_line_batches = self.poll_chat_lines()
+        else:
+            chat_line_batches = self.stream_chat_lines()
+
+        # Alternate between pressing '2' and '3' every 9 minutes
+        keys = itertools.cycle(['2', '3'])
+        next_key_press = time.monotonic() + interval_duration
+        last_chat_time = time.monotonic()
+
+        for chat_lines in chat_line_batches:
+            now = time.monotonic()
+
+            if chat_lines:
+                if self.started_at is not None:
+                    self.log(f"First chat line {now - self.started_at:.2f}s after start.")
+                    self.started_at = None
+                last_chat_time = now
+                new_chat_lines = dedup_index.filter_new(chat_lines)
+                if new_chat_lines:
+                    chat_writer.add(new_chat_lines)
+                    self.log(f'Added {len(new_chat_lines)} new chat lines.')
+            elif now - last_chat_time >= check_interval:
+                # If no chat lines for a while, let's see if "Play" reappeared
+                last_chat_time = now
+                self.log("No chat lines found. Checking 'Play' button...")
                 try:
-                    play_button = driver.find_element(
+                    play_button = self.driver.find_element(
                         By.XPATH,
                         "//button[contains(@class, 'btn-success') and contains(., 'Play')]"
                     )
                     time.sleep(2)
                     play_button.click()
-                    ts_print("Clicked 'Play' button again.")
+                    self.log("Clicked 'Play' button again.")
                 except Exception as e:
-                    ts_print(f"No 'Play' button or error: {e}")
-            else:
-                if os.path.exists('chat_lines.json'):
-                    with open('chat_lines.json', 'r', encoding='utf-8') as file:
-                        existing_chat_lines = json.load(file)
-                else:
-                    existing_chat_lines = []
-
-                new_chat_lines = remove_duplicates(chat_lines, existing_chat_lines)
-                if new_chat_lines:
-                    insert_chat_lines_to_db(new_chat_lines)
-                    ts_print(f'Added {len(new_chat_lines)} new chat lines.')
+                    self.log(f"No 'Play' button or error: {e}")
 
-            time.sleep(check_interval)
+            if now >= next_key_press:
+                self.press_key(next(keys))
+                next_key_press = now + interval_duration
 
-        # After 9 minutes, press the key ('2' or '3')
-        press_key(key)
\ No newline at end of file
+
+def load_sessions(path, base_port=9222, profile_root=None):
+    """
+    Read a JSON list of session definitions, e.g.
+    [{"name": "plaza", "cookies": "cookies-alt1.json", "server": "Safe",
+      "position": [["d", 1.5]]}, ...]
+    Every session runs headless on its own debugging port, with its own
+    browser profile under `profile_root` when one is given.
+    """
+    with open(path, 'r') as f:
+        definitions = json.load(f)
+    return [
+        ScraperSession(
+            definition.get('name', f"session{i}"),
+            cookies=definition.get('cookies', 'cookies.json'),
+            server=definition.get('server'),
+            position=definition.get('position'),
+            debugging_port=base_port + i,
+            headless=True,
+            profile_dir=profile_dir_for(profile_root, definition.get('name', f"session{i}"))
+        )
+        for i, definition in enumerate(definitions)
+    ]
+
+
+def profile_dir_for(profile_root, name):
+    return os.path.join(profile_root, name) if profile_root else None
+
+
+def parser():
+    parser = argparse.ArgumentParser(description="Pony Town chat scraper")
+    parser.add_argument("--poll", action='store_true',
+                        help="poll window.getChatLines() every 15 seconds instead of streaming lines over DevTools")
+    parser.add_argument("--dedup_db", default="data/chat_dedup.sqlite3",
+                        help="SQLite file that remembers recently seen chat lines across restarts")
+    parser.add_argument("--sessions", type=str, default=None,
+                        help="JSON file listing several headless sessions to run from this one process")
+    parser.add_argument("--profile_root", default="data/profiles",
+                        help="keep one persistent browser profile per session here so restarts start warm")
+    parser.add_argument("--cold", action='store_true',
+                        help="start every browser from a throwaway profile instead")
+    return parser.parse_args()
+
+
+def main():
+    args = parser()
+
+    # Lines are buffered and written in batches by a background thread,
+    # so a slow or missing database never stalls the loops below.
+    chat_writer = ChatLineWriter(db_config, log=ts_print).start()
+    atexit.register(chat_writer.close)
+
+    # Remembers the last few hours of lines so duplicates are dropped in constant time
+    dedup_index = ChatDedupIndex(args.dedup_db)
+    atexit.register(dedup_index.close)
+
+    profile_root = None if args.cold else args.profile_root
+    if args.sessions:
+        sessions = load_sessions(args.sessions, profile_root=profile_root)
+    else:
+        # The classic single browser on the Xvfb display that grabber.py screenshots
+        sessions = [ScraperSession('main', profile_dir=profile_dir_for(profile_root, 'main'))]
+
+    # Bring every browser up at the same time rather than one after another
+    with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+        list(pool.map(ScraperSession.start, sessions))
+
+    if len(sessions) == 1:
+        sessions[0].run(chat_writer, dedup_index, poll=args.poll)
+        return
+
+    threads = [
+        threading.Thread(target=session.run, args=(chat_writer, dedup_index, args.poll),
+                         name=session.name, daemon=True)
+        for session in sessions
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()